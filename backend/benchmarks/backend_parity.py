@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+DataFrame Backend Parity Check
+Runs the full pipeline (clean, analyze, enrich) on the synthetic benchmark
+corpus once per DataFrame backend (see core/dataframe_backend.py), compares
+the cleaned, analyzed and enriched files of every backend with the pandas
+ones, and prints the time of the stages the backends implement.
+
+Each run is a run_benchmarks.py worker with SAP_DATAFRAME_BACKEND set, so
+timings come from the same profiler report as the benchmark suite.
+Backends that are not installed are skipped. Exits non-zero if any output
+differs.
+
+Usage: python benchmarks/backend_parity.py [--sizes 10k,100k] [--types SM20,CDHDR,CDPOS] [--backends pandas,polars]
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+import synthetic  # noqa: E402
+from run_benchmarks import DEFAULT_WORK_DIR  # noqa: E402
+from core.dataframe_backend import BACKEND_ENV, BACKENDS  # noqa: E402
+
+# Stages whose column work goes through the backend
+BACKEND_STAGES = ['clean.strings', 'detect.encode_columns', 'enrich.SM20.lookups',
+                  'enrich.CDHDR.lookups', 'enrich.CDPOS.lookups']
+
+OUTPUT_STAGES = ['cleaned', 'analyzed', 'enriched']
+
+
+def available(backend):
+    try:
+        BACKENDS[backend]()
+        return True
+    except ImportError:
+        return False
+
+
+def run_backend(backend, input_file, file_type, work_dir):
+    """Run the pipeline with one backend; returns {stage: seconds} and the total."""
+    run_dir = os.path.join(work_dir, backend)
+    os.makedirs(run_dir, exist_ok=True)
+    report_file = os.path.join(run_dir, f'{file_type}_report.json')
+    command = [sys.executable, os.path.join(BENCH_DIR, 'run_benchmarks.py'), '--worker', input_file, file_type, report_file]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                            env=dict(os.environ, **{BACKEND_ENV: backend}))
+    if result.returncode != 0:
+        raise RuntimeError(f"{backend} {file_type} run failed:\n{result.stderr}")
+    with open(report_file) as f:
+        report = json.load(f)
+    stages = {}
+    for stage in report['stages']:
+        if stage['name'] in BACKEND_STAGES:
+            stages[stage['name']] = stages.get(stage['name'], 0.0) + stage['wall_seconds']
+    return stages, report['wall_seconds']
+
+
+def output_file(work_dir, backend, file_type, stage):
+    return os.path.join(work_dir, backend, f'{file_type}_bench_{stage}.csv')
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Check DataFrame backends produce identical outputs')
+    parser.add_argument('--sizes', default='10k,100k')
+    parser.add_argument('--types', default='SM20,CDHDR,CDPOS')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', default=os.path.join(DEFAULT_WORK_DIR, 'parity'))
+    args = parser.parse_args()
+
+    backends = [backend for backend in args.backends.split(',') if available(backend)]
+    skipped = [backend for backend in args.backends.split(',') if backend not in backends]
+    if skipped:
+        print(f"Skipping unavailable backends: {', '.join(skipped)}")
+    if 'pandas' not in backends:
+        backends.insert(0, 'pandas')
+
+    failures = []
+    for size in args.sizes.split(','):
+        rows = synthetic.parse_size(size)
+        for file_type in args.types.split(','):
+            case_dir = os.path.join(args.work_dir, f'{file_type}-{size}')
+            os.makedirs(case_dir, exist_ok=True)
+            input_file = os.path.join(case_dir, f'{file_type}_{size}_seed{args.seed}.csv')
+            if not os.path.exists(input_file):
+                synthetic.generate_export(file_type, rows, input_file, seed=args.seed)
+
+            print(f"\n{file_type}-{size}")
+            print(f"  {'backend':<8} {'total (s)':>10} " + ' '.join(f'{name:>22}' for name in BACKEND_STAGES if file_type in name or not name.startswith('enrich')))
+            for backend in backends:
+                stages, total = run_backend(backend, input_file, file_type, case_dir)
+                shown = [name for name in BACKEND_STAGES if file_type in name or not name.startswith('enrich')]
+                print(f"  {backend:<8} {total:>10.3f} " + ' '.join(f'{stages.get(name, 0.0):>22.3f}' for name in shown))
+                if backend == 'pandas':
+                    continue
+                for stage in OUTPUT_STAGES:
+                    expected = output_file(case_dir, 'pandas', file_type, stage)
+                    actual = output_file(case_dir, backend, file_type, stage)
+                    if not filecmp.cmp(expected, actual, shallow=False):
+                        failures.append(f"{file_type}-{size}: {backend} {stage} output differs from pandas")
+
+    if failures:
+        print("\nPARITY FAILURES:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nOutputs identical across backends: {', '.join(backends)}")
+
+
+if __name__ == "__main__":
+    main()
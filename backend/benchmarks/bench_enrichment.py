@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Enrichment Benchmark
+Times the SM20 enrichment steps (KEY column, lookup columns, TABLE_MAINT_FLAG
+augmentation) on synthetic frames while varying row count and the number of
+distinct codes/flags independently.
+
+Lookup and flag augmentation work is done once per distinct value, so their
+time should track the number of unique values; only the KEY concatenation,
+the final broadcast and the event template rendering (a few concatenations
+per row; events are drawn from data/events.csv) grow with row count.
+
+Usage: python benchmarks/bench_enrichment.py [--rows 10000,100000,1000000] [--uniques 10,1000,10000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from core import sap_output_generator as gen  # noqa: E402
+
+
+def build_frame(rows, uniques, event_codes, seed=0):
+    """Build an SM20-like frame with `uniques` distinct codes and flags."""
+    rng = np.random.default_rng(seed)
+    tcodes = np.array([f'Z{i:05d}' for i in range(uniques)], dtype=object)
+    events = np.array([event_codes[i % len(event_codes)] for i in range(uniques)], dtype=object)
+    variables = np.array([f'VAR{i:05d}' for i in range(uniques)], dtype=object)
+    flags = np.array([f'TAB{i:05d}-02 | Text:table_maintenance' for i in range(uniques)], dtype=object)
+    return pd.DataFrame({
+        'USER': rng.choice(tcodes, rows),
+        'DATE': '2024-03-01',
+        'TIME': rng.choice(np.array([f'{h:02d}:00:00' for h in range(24)], dtype=object), rows),
+        'EVENT': rng.choice(events, rows),
+        'VARIABLE1': rng.choice(variables, rows),
+        'VARIABLE2': rng.choice(variables, rows),
+        'VARIABLE3': rng.choice(variables, rows),
+        'SOURCE_TA': rng.choice(tcodes, rows),
+        'ABAP_SOURCE': rng.choice(tcodes, rows),
+        'TABLE_MAINT_FLAG': rng.choice(flags, rows),
+    })
+
+
+def time_stages(df, lookup_manager):
+    """Return elapsed seconds for each enrichment stage on a copy of df."""
+    df = df.copy()
+    timings = {}
+
+    start = time.perf_counter()
+    gen._generate_key_column(df, ['USER', 'DATE', 'TIME'])
+    timings['key'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gen._add_event_description_column(df, lookup_manager)
+    gen._add_lookup_column(df, 'SOURCE_TA', lookup_manager.tcodes_dict, 'TCODE_DESCRIPTION')
+    gen._add_lookup_column(df, 'ABAP_SOURCE', lookup_manager.abap_sources_dict, 'ABAP_SOURCE_DESCRIPTION')
+    timings['lookups'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gen._augment_table_maint_column(df['TABLE_MAINT_FLAG'], lookup_manager)
+    timings['table_maint'] = time.perf_counter() - start
+
+    return timings
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Benchmark SM20 enrichment scaling')
+    parser.add_argument('--rows', default='10000,100000,1000000')
+    parser.add_argument('--uniques', default='10,1000,10000')
+    args = parser.parse_args()
+
+    row_counts = [int(x) for x in args.rows.split(',')]
+    unique_counts = [int(x) for x in args.uniques.split(',')]
+
+    os.chdir(SRC_DIR)  # LookupManager reads from data/
+    lookup_manager = gen.LookupManager()
+
+    print(f"\n{'rows':>10} {'uniques':>8} {'key (s)':>9} {'lookups (s)':>12} {'table_maint (s)':>16}")
+    for rows in row_counts:
+        for uniques in unique_counts:
+            if uniques > rows:
+                continue
+            timings = time_stages(build_frame(rows, uniques, sorted(lookup_manager.events_dict)), lookup_manager)
+            print(f"{rows:>10} {uniques:>8} {timings['key']:>9.3f} "
+                  f"{timings['lookups']:>12.3f} {timings['table_maint']:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Local API Load Test
+Drives the whole upload -> analyze -> results flow of the local API server
+(core/local_server.py) the way the frontend does, from many clients at once:
+
+    POST /upload, PUT the file to the presigned URL (multipart above
+    --multipart-mb, parts uploaded in parallel), POST /analyze, then poll
+    GET /results/<id> until the analysis completed or failed.
+
+Reports throughput and the latency percentiles of each step. The analysis
+time is the handler's own profile (wall_seconds); the remainder of the
+analyze -> completed time is queueing and polling.
+
+Without --url a server is started for the run (--workers analysis workers,
+data in a temporary directory).
+
+Usage: python benchmarks/bench_local_api.py [--url http://localhost:3001] [--clients 8] [--files 32]
+                                            [--rows 20000] [--types SM20,CDHDR,CDPOS] [--workers N]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+POLL_SECONDS = 0.25
+TIMEOUT_SECONDS = 1800
+PART_CONCURRENCY = 4
+
+
+def request(method, url, body=None, headers=None):
+    """(status, headers, body bytes) of one HTTP request; 503s are retried after Retry-After."""
+    data = json.dumps(body).encode() if isinstance(body, dict) else body
+    headers = dict({'Content-Type': 'application/json'} if isinstance(body, dict) else {}, **(headers or {}))
+    while True:
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=data, method=method, headers=headers)) as r:
+                return r.status, r.headers, r.read()
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                raise RuntimeError(f"{method} {url} -> {e.code}: {e.read().decode()[:200]}")
+            time.sleep(float(e.headers.get('Retry-After') or 1))
+
+
+def upload(url, path, multipart_bytes):
+    """Upload path like the frontend does; returns (analysisId, key)."""
+    name = os.path.basename(path)
+    size = os.path.getsize(path)
+    if size <= multipart_bytes:
+        _, _, body = request('POST', f'{url}/upload', {'fileName': name})
+        presigned = json.loads(body)
+        with open(path, 'rb') as f:
+            request('PUT', presigned['uploadUrl'], f.read(), {'Content-Type': presigned['contentType']})
+        return presigned['analysisId'], presigned['key']
+
+    _, _, body = request('POST', f'{url}/upload', {'action': 'initiate', 'fileName': name, 'fileSize': size})
+    upload_info = json.loads(body)
+
+    def put_part(part_number):
+        with open(path, 'rb') as f:
+            f.seek((part_number - 1) * upload_info['partSize'])
+            request('PUT', upload_info['partUrls'][str(part_number)], f.read(upload_info['partSize']))
+
+    with ThreadPoolExecutor(PART_CONCURRENCY) as parts:
+        list(parts.map(put_part, range(1, upload_info['partCount'] + 1)))
+    request('POST', f'{url}/upload', {'action': 'complete', 'key': upload_info['key'],
+                                      'uploadId': upload_info['uploadId'], 'partCount': upload_info['partCount']})
+    return upload_info['analysisId'], upload_info['key']
+
+
+def run_client_job(url, path, file_type, bucket, multipart_bytes):
+    """One file through the whole flow; returns its timings."""
+    start = time.perf_counter()
+    analysis_id, key = upload(url, path, multipart_bytes)
+    uploaded = time.perf_counter()
+    request('POST', f'{url}/analyze', {'bucket': bucket, 'key': key, 'analysisId': analysis_id, 'fileType': file_type})
+    while True:
+        _, _, body = request('GET', f'{url}/results/{analysis_id}')
+        item = json.loads(body)
+        if item['status'] in ('completed', 'failed'):
+            break
+        if time.perf_counter() - start > TIMEOUT_SECONDS:
+            raise RuntimeError(f"{analysis_id} still {item['status']} after {TIMEOUT_SECONDS}s")
+        time.sleep(POLL_SECONDS)
+    done = time.perf_counter()
+    if item['status'] == 'completed':
+        request('GET', item['downloadUrl'])
+    return {'status': item['status'], 'upload': uploaded - start, 'analysis': item.get('profile', {}).get('wall_seconds', 0.0),
+            'analyze_to_done': done - uploaded, 'total': done - start}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def start_server(workers, data_dir, port):
+    """Local API server subprocess; returns (process, url) once it answers /health."""
+    process = subprocess.Popen([sys.executable, '-m', 'core.local_server', '--port', str(port), '--workers', str(workers),
+                                '--data-dir', data_dir], cwd=SRC_DIR, stdout=subprocess.DEVNULL)
+    url = f'http://localhost:{port}'
+    for _ in range(120):
+        try:
+            request('GET', f'{url}/health')
+            return process, url
+        except (OSError, RuntimeError):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Local API server did not start")
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Load-test the local upload/analyze/results API')
+    parser.add_argument('--url', help='Running server (default: start one for the run)')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--files', type=int, default=32)
+    parser.add_argument('--rows', default='20000')
+    parser.add_argument('--types', default='SM20,CDHDR,CDPOS')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) - 1))
+    parser.add_argument('--port', type=int, default=3091)
+    parser.add_argument('--multipart-mb', type=float, default=64, help='Files above this use multipart uploads')
+    parser.add_argument('--bucket', default=os.environ.get('UPLOAD_BUCKET', 'sapanalyzer4-uploads'))
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_local_api_')
+    process = None
+    try:
+        rows = synthetic.parse_size(args.rows)
+        types = args.types.split(',')
+        inputs = {}
+        for file_type in types:
+            inputs[file_type] = os.path.join(work_dir, f'{file_type}_{args.rows}.csv')
+            synthetic.generate_export(file_type, rows, inputs[file_type], seed=args.seed)
+
+        url = args.url
+        if not url:
+            process, url = start_server(args.workers, os.path.join(work_dir, 'data'), args.port)
+        url = url.rstrip('/')
+
+        jobs = [types[i % len(types)] for i in range(args.files)]
+        lock = threading.Lock()
+        finished = []
+
+        def job(file_type):
+            timings = run_client_job(url, inputs[file_type], file_type, args.bucket, args.multipart_mb * 2**20)
+            with lock:
+                finished.append(timings)
+                print(f"  {len(finished):>4}/{args.files} {file_type:<6} {timings['status']:<9} {timings['total']:>7.2f}s")
+            return timings
+
+        print(f"{args.files} files of {rows} rows, {args.clients} clients -> {url}")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as clients:
+            results = list(clients.map(job, jobs))
+        elapsed = time.perf_counter() - start
+
+        _, _, health = request('GET', f'{url}/health')
+        failed = sum(1 for result in results if result['status'] != 'completed')
+        print(f"\nThroughput: {len(results) / elapsed * 60:.1f} files/min, {len(results) * rows / elapsed:,.0f} rows/s "
+              f"({elapsed:.1f}s, {failed} failed)")
+        print(f"Server: {json.loads(health)}")
+        print(f"{'step':<16} {'p50 (s)':>9} {'p95 (s)':>9} {'max (s)':>9}")
+        for step in ('upload', 'analysis', 'analyze_to_done', 'total'):
+            values = [result[step] for result in results]
+            print(f"{step:<16} {percentile(values, 0.5):>9.3f} {percentile(values, 0.95):>9.3f} {max(values):>9.3f}")
+        if failed:
+            sys.exit(1)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
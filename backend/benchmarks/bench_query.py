@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Query Engine Benchmark
+Writes a synthetic enriched SM20 report and times one selective question
+(debugger events of a single user) answered three ways:
+
+    pandas        read the whole CSV, filter in memory (the pre-query-engine way)
+    sqlite cold   first registration (load + index) plus the query
+    sqlite warm   a later session on the same database file: the cached load
+                  is reused and the query is an index search
+    duckdb        scan of the CSV in place, when duckdb is installed
+
+Usage: python benchmarks/bench_query.py [--rows 100000,1000000] [--keep DIR]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from core.query_engine import QueryEngine, duckdb  # noqa: E402
+
+TARGET_USER = 'USER0007'
+QUERY = "SELECT USER, TCODE, DATE, TIME, DEBUG_FLAG FROM sm20_enriched WHERE USER = ? AND DEBUG_FLAG <> ''"
+
+
+def write_report(path, rows, seed=0):
+    """Enriched-style SM20 report with rows rows over 400 users."""
+    rng = np.random.default_rng(seed)
+    users = np.array([f'USER{i:04d}' for i in range(400)], dtype=object)
+    tcodes = np.array(['VA01', 'ME21N', 'FB01', 'SE16N', 'SM30', 'SE38', 'SU01', 'MIGO'], dtype=object)
+    debug = np.where(rng.random(rows) < 0.02, 'R3TR PROG ZTEST | Debug:I', '')
+    pd.DataFrame({
+        'USER': rng.choice(users, rows),
+        'DATE': '2024-03-01',
+        'TIME': [f'{h:02d}:00:00' for h in rng.integers(0, 24, rows)],
+        'EVENT': rng.choice(np.array(['AU1', 'AU3', 'BU4', 'CUK'], dtype=object), rows),
+        'TCODE': rng.choice(tcodes, rows),
+        'ABAP_SOURCE': 'SAPLSMTR_NAVIGATION',
+        'AUDIT_LOG_MSG_TEXT': 'Transaction started',
+        'DEBUG_FLAG': debug,
+        'TABLE_MAINT_FLAG': '',
+        'HIGH_RISK_TCODE_FLAG': '',
+        'OTHER_FLAGS': '',
+    }).to_csv(path, index=False)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def run_pandas(path):
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return df[(df['USER'] == TARGET_USER) & (df['DEBUG_FLAG'] != '')]
+
+
+def run_engine(path, engine, database=None):
+    query_engine = QueryEngine(database=database, engine=engine)
+    try:
+        query_engine.register_files('sm20_enriched', [path])
+        return query_engine.query(QUERY, [TARGET_USER])
+    finally:
+        query_engine.close()
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Benchmark the SQL query layer against pandas')
+    parser.add_argument('--rows', default='100000,1000000')
+    parser.add_argument('--keep', help='Write the reports and database here and keep them')
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='bench_query_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        print(f"{'rows':>10} {'method':<12} {'seconds':>9} {'matches':>8}")
+        for rows in [int(value) for value in args.rows.split(',')]:
+            path = os.path.join(work_dir, f'SAP_Analysis_Report_bench_{rows}_SM20.csv')
+            database = os.path.join(work_dir, f'query_{rows}.db')
+            write_report(path, rows)
+            if os.path.exists(database):
+                os.remove(database)
+
+            results = [('pandas',) + timed(lambda: run_pandas(path))]
+            results.append(('sqlite cold',) + timed(lambda: run_engine(path, 'sqlite', database)))
+            results.append(('sqlite warm',) + timed(lambda: run_engine(path, 'sqlite', database)))
+            if duckdb is not None:
+                results.append(('duckdb',) + timed(lambda: run_engine(path, 'duckdb')))
+
+            expected = len(results[0][2])
+            for method, seconds, matches in results:
+                print(f"{rows:>10} {method:<12} {seconds:>9.3f} {len(matches):>8}")
+                if len(matches) != expected:
+                    print(f"  Warning: {method} returned {len(matches)} rows, pandas {expected}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
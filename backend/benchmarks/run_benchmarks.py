@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark Suite
+Generates synthetic SM20, CDHDR and CDPOS exports (see synthetic.py), runs the
+full pipeline on each - clean_sap_file, analyze_sap_activities and the output
+generator enrichment - under the pipeline profiler, and reports per-stage
+throughput and peak memory.
+
+Each case runs in its own subprocess so peak RSS belongs to that case alone.
+Results are compared against a stored baseline; a stage whose rows/sec drops,
+or a case whose peak RSS grows, by more than the threshold is reported as a
+regression and the suite exits non-zero.
+
+Usage:
+    python benchmarks/run_benchmarks.py                       # 10k rows, all types
+    python benchmarks/run_benchmarks.py --sizes 10k,1m --types SM20
+    python benchmarks/run_benchmarks.py --save-baseline       # record current numbers
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+import synthetic  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), 'sap_analyzer_bench')
+DEFAULT_THRESHOLD = 0.25
+
+# Stages shorter than this are too noisy to compare
+MIN_STAGE_SECONDS = 0.1
+
+PROCESSORS = {'SM20': 'process_sm20_data', 'CDHDR': 'process_cdhdr_data', 'CDPOS': 'process_cdpos_data'}
+
+# ================================================================================
+# CASE EXECUTION
+# ================================================================================
+
+def run_case(input_file, file_type, report_file):
+    """Run the pipeline on one export under the profiler and write its report (worker side)."""
+    os.chdir(SRC_DIR)  # lookups are read from data/
+    import pandas as pd
+    from core import sap_output_generator as gen
+    from core.profiling import profile_run, profile_stage
+    from core.sap_analyzer import analyze_sap_activities
+    from core.sm20_cleaner import clean_sap_file
+
+    work_dir = os.path.dirname(report_file)
+    cleaned_file = os.path.join(work_dir, f'{file_type}_bench_cleaned.csv')
+    analyzed_file = os.path.join(work_dir, f'{file_type}_bench_analyzed.csv')
+    enriched_file = os.path.join(work_dir, f'{file_type}_bench_enriched.csv')
+
+    with profile_run(f'bench-{file_type}') as profiler:
+        clean_sap_file(input_file, file_type, cleaned_file)
+        analyze_sap_activities(cleaned_file, analyzed_file)
+
+        with profile_stage('enrich.read', bytes_read=os.path.getsize(analyzed_file)) as stage:
+            df = pd.read_csv(analyzed_file, encoding='utf-8-sig')
+            stage.rows = len(df)
+        with profile_stage('enrich.load_lookups'):
+            lookup_manager = gen.LookupManager()
+        df = getattr(gen, PROCESSORS[file_type])(df, lookup_manager)
+        with profile_stage('enrich.write', rows=len(df)) as stage:
+            df.to_csv(enriched_file, index=False, encoding='utf-8-sig')
+            stage.bytes_written = os.path.getsize(enriched_file)
+
+    profiler.write_report(report_file)
+
+
+def benchmark_case(file_type, size, work_dir, seed, quiet=True):
+    """Generate (or reuse) the export for a case and run it in a subprocess."""
+    rows = synthetic.parse_size(size)
+    input_file = os.path.join(work_dir, f'{file_type}_{size}_seed{seed}.csv')
+    if not os.path.exists(input_file):
+        print(f"Generating {rows} {file_type} rows -> {input_file}")
+        synthetic.generate_export(file_type, rows, input_file, seed=seed)
+
+    report_file = os.path.join(work_dir, f'{file_type}_{size}_report.json')
+    command = [sys.executable, os.path.abspath(__file__), '--worker', input_file, file_type, report_file]
+    output = subprocess.DEVNULL if quiet else None
+    result = subprocess.run(command, stdout=output, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{file_type} {size} benchmark failed:\n{result.stderr}")
+
+    with open(report_file) as f:
+        report = json.load(f)
+    return summarize_report(report, rows)
+
+
+def summarize_report(report, rows):
+    """Reduce a profiler report to the numbers the baseline tracks."""
+    stages = {}
+    for stage in report['stages']:
+        entry = stages.setdefault(stage['name'], {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows': stage['rows']})
+        entry['wall_seconds'] += stage['wall_seconds']
+        entry['cpu_seconds'] += stage['cpu_seconds']
+    for entry in stages.values():
+        entry['rows_per_sec'] = round(entry['rows'] / entry['wall_seconds'], 1) if entry['rows'] and entry['wall_seconds'] > 0 else None
+        entry['wall_seconds'] = round(entry['wall_seconds'], 4)
+        entry['cpu_seconds'] = round(entry['cpu_seconds'], 4)
+    return {
+        'rows': rows,
+        'wall_seconds': report['wall_seconds'],
+        'rows_per_sec': round(rows / report['wall_seconds'], 1) if report['wall_seconds'] else None,
+        'peak_rss_mb': report['process_peak_rss_mb'],
+        'counters': report.get('counters', {}),
+        'stages': stages,
+    }
+
+# ================================================================================
+# BASELINE COMPARISON
+# ================================================================================
+
+def compare_to_baseline(results, baseline, threshold):
+    """Return a list of regression messages (empty when within threshold)."""
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        if base['peak_rss_mb'] and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f"{case}: peak RSS {result['peak_rss_mb']:.1f} MB vs baseline {base['peak_rss_mb']:.1f} MB")
+        for name, stage in result['stages'].items():
+            base_stage = base['stages'].get(name)
+            if not base_stage or not base_stage.get('rows_per_sec') or not stage.get('rows_per_sec'):
+                continue
+            if max(stage['wall_seconds'], base_stage['wall_seconds']) < MIN_STAGE_SECONDS:
+                continue
+            if stage['rows_per_sec'] < base_stage['rows_per_sec'] * (1 - threshold):
+                regressions.append(f"{case} {name}: {stage['rows_per_sec']:,.0f} rows/s vs baseline "
+                                   f"{base_stage['rows_per_sec']:,.0f} rows/s")
+    return regressions
+
+
+def print_results(results, baseline):
+    """Per-case stage table with change vs baseline."""
+    for case, result in results.items():
+        base = baseline.get(case, {})
+        print(f"\n{case}: {result['rows']:,} rows in {result['wall_seconds']:.2f}s "
+              f"({result['rows_per_sec'] or 0:,.0f} rows/s), peak RSS {result['peak_rss_mb']:.1f} MB")
+        print(f"  {'stage':<32} {'wall (s)':>9} {'cpu (s)':>9} {'rows/s':>13} {'vs base':>8}")
+        for name, stage in result['stages'].items():
+            base_stage = base.get('stages', {}).get(name, {})
+            change = ''
+            if stage.get('rows_per_sec') and base_stage.get('rows_per_sec'):
+                change = f"{stage['rows_per_sec'] / base_stage['rows_per_sec'] - 1:+.0%}"
+            rate = f"{stage['rows_per_sec']:,.0f}" if stage.get('rows_per_sec') else '-'
+            print(f"  {name:<32} {stage['wall_seconds']:>9.3f} {stage['cpu_seconds']:>9.3f} {rate:>13} {change:>8}")
+        for name, value in result.get('counters', {}).items():
+            print(f"  {name} = {value}")
+
+
+def main():
+    """Command line interface."""
+    if len(sys.argv) == 5 and sys.argv[1] == '--worker':
+        run_case(*sys.argv[2:])
+        return 0
+
+    parser = argparse.ArgumentParser(description='Benchmark the SAP analysis pipeline')
+    parser.add_argument('--sizes', default='10k', help="comma list of row counts or presets: " + ', '.join(synthetic.SIZE_PRESETS))
+    parser.add_argument('--types', default='SM20,CDHDR,CDPOS')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed fractional slowdown / memory growth before flagging a regression')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--output', help='also write the results JSON here')
+    parser.add_argument('--verbose', action='store_true', help='show pipeline output')
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = {}
+    for size in args.sizes.split(','):
+        for file_type in args.types.split(','):
+            case = f'{file_type}-{size}'
+            print(f"Running {case}...")
+            results[case] = benchmark_case(file_type, size, args.work_dir, args.seed, quiet=not args.verbose)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline for {len(results)} cases to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for message in regressions:
+            print(f"  - {message}")
+        return 1
+    print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
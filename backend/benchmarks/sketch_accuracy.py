@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Sketch Accuracy Check
+Feeds Zipf-distributed key streams (the shape of user and tcode activity in
+real exports) through the triage sketches in chunks, splits the stream into
+shards that are sketched separately and merged, and compares every answer
+with exact counts.
+
+Checked against the bounds documented in core/sketches.py:
+    Count-Min    true <= estimate <= true + e/width * N   (all keys)
+    SpaceSaving  count - error <= true <= count, error <= N/k,
+                 and every key with true count > N/k is reported
+    HyperLogLog  relative error within 4 standard errors (1.04/sqrt(m))
+    Merging      merged HyperLogLog equals the single-stream one exactly
+
+Exits non-zero if any bound is violated.
+
+Usage: python benchmarks/sketch_accuracy.py [--rows 1000000] [--keys 50000] [--shards 4] [--seeds 3]
+"""
+
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from core.sketches import CountMinSketch, HyperLogLog, KeyedHyperLogLog, SpaceSaving  # noqa: E402
+
+CHUNK_ROWS = 100000
+
+
+def zipf_stream(rows, keys, seed):
+    """rows keys drawn from `keys` distinct values with a Zipf(1.1) popularity."""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.1, rows), keys) - 1
+    return np.array([f'U{i:06d}' for i in range(keys)], dtype=object)[ranks]
+
+
+def build(stream):
+    """Sketches of stream, updated chunk by chunk as the pipeline does."""
+    cms, top, hll = CountMinSketch(), SpaceSaving(), HyperLogLog()
+    for start in range(0, len(stream), CHUNK_ROWS):
+        counts = pd.Series(stream[start:start + CHUNK_ROWS]).value_counts(sort=False)
+        keys = list(counts.index)
+        cms.add(keys, counts.values)
+        top.add(keys, counts.values)
+        hll.add(keys)
+    return cms, top, hll
+
+
+def check(stream, shards, failures):
+    truth = pd.Series(stream).value_counts()
+    total = len(stream)
+
+    parts = [build(part) for part in np.array_split(stream, shards)]
+    cms, top, hll = parts[0]
+    for other_cms, other_top, other_hll in parts[1:]:
+        cms.merge(other_cms)
+        top.merge(other_top)
+        hll.merge(other_hll)
+    _, _, single_hll = build(stream)
+
+    # Count-Min: never under, and within e/w * N for every key
+    slack = math.e / cms.width * total
+    estimates = np.array([cms.estimate(key) for key in truth.index])
+    over = estimates - truth.values
+    if (over < 0).any():
+        failures.append("Count-Min underestimated a key")
+    violations = int((over > slack).sum())
+    print(f"  Count-Min    max over {over.max():>8} (bound {slack:.0f}), keys over bound: {violations}")
+    if violations > len(truth) * math.exp(-cms.depth):
+        failures.append(f"Count-Min exceeded its bound for {violations} keys")
+
+    # SpaceSaving: sandwich bounds and guaranteed recall of heavy hitters
+    max_error = max((error for _, _, error in top.top(top.k)), default=0)
+    for key, count, error in top.top(top.k):
+        if not count - error <= truth.get(key, 0) <= count:
+            failures.append(f"SpaceSaving bounds do not hold for {key}")
+    heavy = set(truth[truth > total / top.k].index)
+    missed = heavy - set(top.counts)
+    print(f"  SpaceSaving  max error {max_error:>7} (bound {total / top.k:.0f}), "
+          f"heavy hitters {len(heavy)}, missed {len(missed)}")
+    if max_error > total / top.k:
+        failures.append("SpaceSaving error exceeded N/k")
+    if missed:
+        failures.append(f"SpaceSaving missed heavy hitters: {sorted(missed)[:5]}")
+
+    # HyperLogLog: relative error and exact merge
+    relative = abs(hll.estimate() - len(truth)) / len(truth)
+    standard = 1.04 / math.sqrt(len(hll.registers))
+    print(f"  HyperLogLog  {hll.estimate():>8} vs {len(truth)} distinct, error {relative:.2%} "
+          f"(std error {standard:.2%})")
+    if relative > 4 * standard:
+        failures.append(f"HyperLogLog error {relative:.2%} exceeds 4 standard errors")
+    if not np.array_equal(hll.registers, single_hll.registers):
+        failures.append("Merged HyperLogLog differs from the single-stream sketch")
+
+
+def check_keyed(seed, failures):
+    """Distinct terminals per user on a stream with known per-user cardinalities."""
+    rng = np.random.default_rng(seed)
+    users = [f'USER{i:03d}' for i in range(50)]
+    distinct = {user: int(rng.integers(1, 400)) for user in users}
+    pairs = [(user, f'T{t:05d}') for user in users for t in range(distinct[user])]
+    pairs = [pairs[i] for i in rng.permutation(len(pairs))]
+
+    keyed = KeyedHyperLogLog()
+    for start in range(0, len(pairs), 1000):
+        chunk = pairs[start:start + 1000]
+        keyed.add([user for user, _ in chunk], [terminal for _, terminal in chunk])
+
+    standard = 1.04 / math.sqrt(1 << keyed.precision)
+    worst = max(abs(estimate - distinct[user]) / distinct[user] for user, estimate in keyed.top(len(users)))
+    print(f"  Keyed HLL    worst per-user error {worst:.2%} (std error {standard:.2%})")
+    if worst > 4 * standard:
+        failures.append(f"Keyed HyperLogLog error {worst:.2%} exceeds 4 standard errors")
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Check triage sketch error bounds')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--keys', type=int, default=50000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--seeds', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = []
+    for seed in range(args.seeds):
+        print(f"\nSeed {seed}: {args.rows} rows, {args.keys} keys, {args.shards} shards")
+        check(zipf_stream(args.rows, args.keys, seed), args.shards, failures)
+        check_keyed(seed, failures)
+
+    if failures:
+        print("\nBOUND VIOLATIONS:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll sketch error bounds hold.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Synthetic SAP Export Generator
+Writes deterministic SM20, CDHDR and CDPOS exports that look like the real
+thing: header spellings from SM20_COLUMN_MAPPING, SAP regional date formats,
+comma or tab delimiters, several encodings, csv or xlsx, and flag hit rates in
+the range seen on production audit logs.
+
+Rows are generated in fixed-size chunks seeded from (seed, chunk number), so a
+10M-row file is produced in bounded memory and the same arguments always give
+byte-identical output.
+
+Usage:
+    python benchmarks/synthetic.py SM20 1m /tmp/SM20_bench.csv
+    python benchmarks/synthetic.py CDPOS 10k /tmp/CDPOS_bench.xlsx --headers technical
+    python benchmarks/synthetic.py SM20 10m /tmp/SM20_big.txt --sep tab --encoding latin-1 --date-format MM/DD/YYYY
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+SIZE_PRESETS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+CHUNK_ROWS = 250_000
+XLSX_MAX_ROWS = 1_048_575
+
+DELIMITERS = {'comma': ',', 'tab': '\t'}
+ENCODINGS = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252']
+DATE_FORMATS = {
+    'DD.MM.YYYY': '%d.%m.%Y',
+    'MM/DD/YYYY': '%m/%d/%Y',
+    'YYYY-MM-DD': '%Y-%m-%d',
+    'YYYYMMDD': '%Y%m%d',
+}
+
+# Header spellings per logical column; every SM20 spelling is a key of
+# SM20_COLUMN_MAPPING so the cleaner's renaming is exercised
+HEADER_STYLES = {
+    'SM20': {
+        'gui': {
+            'date': 'Date', 'time': 'Time', 'user': 'User', 'terminal': 'Terminal Name',
+            'source_ta': 'Source TA', 'tcode': 'Transaction Code', 'abap': 'ABAP Source',
+            'message': 'Audit Log Msg. Text', 'event': 'Event', 'var1': 'First Variable Value for Event',
+            'var2': 'Variable 2', 'var3': 'Variable 3', 'system': 'Sys.', 'client': 'Cl.',
+        },
+        'technical': {
+            'date': 'DATE', 'time': 'TIME', 'user': 'USER NAME', 'terminal': 'TERMINAL',
+            'source_ta': 'SOURCE TA', 'tcode': 'TCODE', 'abap': 'PROGRAM',
+            'message': 'MESSAGE TEXT', 'event': 'EVENT CODE', 'var1': 'VAR 1',
+            'var2': 'VAR 2', 'var3': 'VAR 3', 'system': 'SYSTEMID', 'client': 'AUD.CLASS',
+        },
+        'short': {
+            'date': 'date', 'time': 'time', 'user': 'user', 'terminal': 'terminal',
+            'source_ta': 'source ta', 'tcode': 't-code', 'abap': 'abap pgm',
+            'message': 'msg text', 'event': 'event', 'var1': 'first variable',
+            'var2': 'second variable', 'var3': 'third variable', 'system': 'sys.', 'client': 'ip address',
+        },
+    },
+    'CDHDR': {
+        'technical': {
+            'object': 'OBJECTCLAS', 'objectid': 'OBJECTID', 'changenr': 'CHANGENR', 'user': 'USERNAME',
+            'date': 'UDATE', 'time': 'UTIME', 'tcode': 'TCODE', 'change_ind': 'CHANGE_IND',
+        },
+        'descriptive': {
+            'object': 'Object', 'objectid': 'Object Value', 'changenr': 'ChangeNr', 'user': 'User',
+            'date': 'Date', 'time': 'Time', 'tcode': 'Transaction', 'change_ind': 'Change Ind',
+        },
+    },
+    'CDPOS': {
+        'descriptive': {
+            'object': 'Object', 'objectid': 'Object Value', 'changenr': 'CHANGENR', 'table': 'Table Name',
+            'tabkey': 'TABKEY', 'field': 'Field Name', 'change_ind': 'Change Indicator',
+            'new_value': 'New Value', 'old_value': 'Old Value',
+        },
+        'technical': {
+            'object': 'OBJECTCLAS', 'objectid': 'OBJECTID', 'changenr': 'CHANGENR', 'table': 'TABNAME',
+            'tabkey': 'TABKEY', 'field': 'FNAME', 'change_ind': 'CHNGIND',
+            'new_value': 'VALUE_NEW', 'old_value': 'VALUE_OLD',
+        },
+    },
+}
+
+DEFAULT_HEADERS = {'SM20': 'gui', 'CDHDR': 'technical', 'CDPOS': 'descriptive'}
+
+# Share of SM20 rows per activity profile (the rest is routine business activity)
+SM20_PROFILE_RATES = {
+    'debug': 0.004,
+    'table_maint': 0.012,
+    'generic_table': 0.02,
+    'high_risk_tcode': 0.015,
+    'security': 0.02,
+    'config': 0.01,
+    'transport': 0.006,
+    'job': 0.008,
+    'keyword': 0.01,
+}
+
+# Share of CDPOS rows that touch a high-risk table
+CDPOS_HIGH_RISK_RATE = 0.01
+
+ROUTINE_TCODES = ['VA01', 'VA02', 'VA03', 'ME21N', 'ME23N', 'FB01', 'FB03', 'MM03', 'MIGO', 'VL02N',
+                  'F-02', 'FBL1N', 'CO03', 'MB52', 'XD03', 'IW32', 'SESSION_MANAGER', '']
+ROUTINE_EVENTS = ['AU1', 'AU2', 'AU3', 'AU5', 'AU6', 'AUC', 'BU4', 'AUE', 'AUK', 'DU9']
+ROUTINE_MESSAGES = [
+    'Logon successful (type=A, method=A)',
+    'Transaction {tcode} started',
+    'Report {program} started',
+    'RFC/CPIC logon successful (type=B, method=A)',
+    'User {user} logged off',
+    'Benutzer {user}: Änderung gespeichert',
+]
+PROGRAMS = ['SAPLSMTR_NAVIGATION', 'RSABAPPROGRAM', 'SAPMV45A', 'SAPMM07M', 'RFITEMAP', 'SAPLSUSO', 'ZFI_PAYMENT_RUN']
+USERS = [f'USER{i:04d}' for i in range(400)] + ['MÜLLER', 'GARCÍA', 'BATCH_JOB', 'DDIC', 'FIREFIGHTER01']
+TERMINALS = [f'WS{i:05d}' for i in range(150)]
+
+CDHDR_OBJECTS = ['MATERIAL', 'VERKBELEG', 'EINKBELEG', 'KRED', 'DEBI', 'BELEG', 'PFCG', 'IDENTITY', 'USER_CUA']
+CDPOS_FIELDS = ['KEY', 'NETWR', 'MENGE', 'BSTME', 'LIFNR', 'KUNNR', 'MATKL', 'BNAME', 'AGR_NAME', 'PASSCODE', 'UFLAG']
+ROUTINE_TABLES = ['VBAP', 'VBAK', 'EKPO', 'EKKO', 'MARA', 'MARC', 'LFA1', 'KNA1', 'BSEG', 'BKPF']
+CHANGE_IND_CODES = ['U', 'U', 'U', 'I', 'I', 'D', 'E', 'J', 'K']
+
+# Every HH:MM:SS of the day, indexed by second
+TIME_STRINGS = np.array([f'{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}' for s in range(86400)], dtype=object)
+
+# ================================================================================
+# HELPER FUNCTIONS
+# ================================================================================
+
+def _analyzer_lists():
+    """Detector constants from the analyzer, so hit rates follow the real rules."""
+    cwd = os.getcwd()
+    os.chdir(SRC_DIR)  # the analyzer loads data/ lists on import
+    try:
+        from core import sap_analyzer as analyzer
+    finally:
+        os.chdir(cwd)
+    return analyzer
+
+
+def _rng(seed, chunk):
+    return np.random.default_rng([seed, chunk])
+
+
+def _pick(rng, values, size):
+    return rng.choice(np.asarray(values, dtype=object), size)
+
+
+def _dates_and_times(rng, size, date_format, start='2024-01-01', days=90):
+    """Working-hours heavy timestamps rendered with an SAP regional date format."""
+    day = rng.integers(0, days, size)
+    hour = np.where(rng.random(size) < 0.85, rng.integers(7, 19, size), rng.integers(0, 24, size))
+    seconds = hour * 3600 + rng.integers(0, 3600, size)
+    base = pd.Timestamp(start)
+    day_strings = pd.Series(pd.date_range(base, periods=days, freq='D').strftime(DATE_FORMATS[date_format]))
+    return day_strings.to_numpy(dtype=object)[day], TIME_STRINGS[seconds]
+
+
+def _fill(column, mask, values):
+    if mask.any():
+        column[mask] = values[:mask.sum()] if isinstance(values, np.ndarray) else values
+
+
+# ================================================================================
+# CHUNK GENERATORS
+# ================================================================================
+
+def sm20_chunk(rng, size, date_format, analyzer):
+    """One chunk of SM20 security audit log rows, keyed by logical column."""
+    profiles = list(SM20_PROFILE_RATES)
+    rates = np.array([SM20_PROFILE_RATES[p] for p in profiles])
+    profile = rng.choice(len(profiles) + 1, size, p=np.append(rates, 1 - rates.sum()))
+
+    dates, times = _dates_and_times(rng, size, date_format)
+    users = _pick(rng, USERS, size)
+    tcode = _pick(rng, ROUTINE_TCODES, size)
+    source_ta = tcode.copy()
+    event = _pick(rng, ROUTINE_EVENTS, size)
+    program = _pick(rng, PROGRAMS, size)
+    templates = _pick(rng, ROUTINE_MESSAGES, size)
+    message = np.array([t.format(tcode=c, program=p, user=u) for t, c, p, u in zip(templates, tcode, program, users)],
+                       dtype=object)
+    var1 = _pick(rng, ['', 'A', 'B', '01', 'X'], size)
+    var2 = _pick(rng, ['', '', '0', '100', '400'], size)
+    var3 = _pick(rng, ['', '', 'SAPLSUSO', 'RFC'], size)
+
+    def rows(name):
+        return profile == profiles.index(name)
+
+    mask = rows('debug')
+    half = mask & (rng.random(size) < 0.5)
+    _fill(event, half, _pick(rng, analyzer.DEBUG_EVENT_CODES, size))
+    _fill(tcode, mask & ~half, _pick(rng, analyzer.DEBUG_TCODES, size))
+    _fill(var2, mask & (rng.random(size) < 0.3), '200')
+    _fill(var3, mask & (rng.random(size) < 0.2), 'CODE -> EDIT')
+    _fill(message, mask & (rng.random(size) < 0.4), 'Debugger session started for program')
+
+    mask = rows('table_maint')
+    _fill(tcode, mask, _pick(rng, analyzer.TABLE_MAINT_TCODES, size))
+    _fill(event, mask & (rng.random(size) < 0.5), _pick(rng, analyzer.TABLE_MAINT_EVENT_CODES, size))
+
+    mask = rows('generic_table')
+    tables = np.where(rng.random(size) < 0.15,
+                      _pick(rng, analyzer.HIGH_RISK_TABLE_NAMES, size),
+                      _pick(rng, [t.lower() for t in ROUTINE_TABLES], size))
+    activities = _pick(rng, analyzer.TABLE_MAINT_ACTIVITIES + ['03', '03', '03'], size)
+    generic = np.array([f'Generic table access call to {t} with activity {a} (auth. check: successful)'
+                        for t, a in zip(tables[:mask.sum()], activities[:mask.sum()])], dtype=object)
+    _fill(message, mask, generic)
+    _fill(tcode, mask, _pick(rng, ['SE16', 'SE16N', 'SM30', 'SE17'], size))
+
+    hr_tcodes = sorted(analyzer.HIGH_RISK_TCODES) or ['SE38']
+    _fill(tcode, rows('high_risk_tcode'), _pick(rng, hr_tcodes, size))
+    _fill(tcode, rows('security'), _pick(rng, analyzer.SECURITY_TCODES, size))
+    _fill(tcode, rows('config'), _pick(rng, analyzer.CONFIG_TCODES, size))
+    _fill(tcode, rows('transport'), _pick(rng, analyzer.TRANSPORT_TCODES, size))
+    _fill(tcode, rows('job'), _pick(rng, analyzer.JOB_SCHEDULE_TCODES, size))
+
+    keywords = ([p for p, _ in analyzer.SECURITY_PATTERNS] + analyzer.CONFIG_KEYWORDS +
+                analyzer.TRANSPORT_KEYWORDS + analyzer.JOB_KEYWORDS)
+    mask = rows('keyword')
+    _fill(message, mask, np.array([f'{k.title()} processed by {u}' for k, u in
+                                   zip(_pick(rng, keywords, mask.sum()), users[mask])], dtype=object))
+
+    # Source TA mostly mirrors the transaction, with some drift as in real logs
+    drift = rng.random(size) < 0.1
+    source_ta = np.where(drift, source_ta, tcode)
+
+    return {
+        'date': dates, 'time': times, 'user': users, 'terminal': _pick(rng, TERMINALS, size),
+        'source_ta': source_ta, 'tcode': tcode, 'abap': program, 'message': message, 'event': event,
+        'var1': var1, 'var2': var2, 'var3': var3,
+        'system': _pick(rng, ['PRD', 'PRD', 'PRD', 'QAS'], size), 'client': _pick(rng, ['100', '200', '000'], size),
+    }
+
+
+def _change_numbers(rng, size, chunk):
+    return np.char.zfill((chunk * CHUNK_ROWS + np.arange(size) // 3 + 1).astype(str), 10).astype(object)
+
+
+def cdhdr_chunk(rng, size, date_format, analyzer, chunk=0):
+    """One chunk of CDHDR change document headers."""
+    dates, times = _dates_and_times(rng, size, date_format)
+    tcode = _pick(rng, ROUTINE_TCODES[:-1] + ['SU01', 'PFCG', 'SM30', 'SE38'], size)
+    return {
+        'object': _pick(rng, CDHDR_OBJECTS, size),
+        'objectid': np.char.zfill(rng.integers(1, 10**8, size).astype(str), 10).astype(object),
+        'changenr': _change_numbers(rng, size, chunk),
+        'user': _pick(rng, USERS, size),
+        'date': dates, 'time': times, 'tcode': tcode,
+        'change_ind': _pick(rng, CHANGE_IND_CODES, size),
+    }
+
+
+def cdpos_chunk(rng, size, date_format, analyzer, chunk=0):
+    """One chunk of CDPOS change document items."""
+    high_risk = sorted(analyzer.HIGH_RISK_TABLES) or [t.upper() for t in analyzer.HIGH_RISK_TABLE_NAMES]
+    tables = np.where(rng.random(size) < CDPOS_HIGH_RISK_RATE,
+                      _pick(rng, high_risk, size), _pick(rng, ROUTINE_TABLES, size))
+    values = rng.integers(0, 100000, (2, size)).astype(str).astype(object)
+    return {
+        'object': _pick(rng, CDHDR_OBJECTS, size),
+        'objectid': np.char.zfill(rng.integers(1, 10**8, size).astype(str), 10).astype(object),
+        'changenr': _change_numbers(rng, size, chunk),
+        'table': tables,
+        'tabkey': np.char.add('100', np.char.zfill(rng.integers(1, 10**12, size).astype(str), 20)).astype(object),
+        'field': _pick(rng, CDPOS_FIELDS, size),
+        'change_ind': _pick(rng, CHANGE_IND_CODES, size),
+        'new_value': values[0], 'old_value': values[1],
+    }
+
+
+CHUNK_GENERATORS = {'SM20': sm20_chunk, 'CDHDR': cdhdr_chunk, 'CDPOS': cdpos_chunk}
+
+# ================================================================================
+# FILE GENERATION
+# ================================================================================
+
+def parse_size(size):
+    """'10k' / '1m' / '10m' or a plain integer row count."""
+    text = str(size).lower()
+    return SIZE_PRESETS[text] if text in SIZE_PRESETS else int(text)
+
+
+def iter_chunks(file_type, rows, seed=42, headers=None, date_format='DD.MM.YYYY'):
+    """Yield DataFrame chunks of a synthetic export with its header spelling applied."""
+    analyzer = _analyzer_lists()
+    spelling = HEADER_STYLES[file_type][headers or DEFAULT_HEADERS[file_type]]
+    generator = CHUNK_GENERATORS[file_type]
+    for chunk, start in enumerate(range(0, rows, CHUNK_ROWS)):
+        size = min(CHUNK_ROWS, rows - start)
+        rng = _rng(seed, chunk)
+        if file_type == 'SM20':
+            columns = generator(rng, size, date_format, analyzer)
+        else:
+            columns = generator(rng, size, date_format, analyzer, chunk)
+        yield pd.DataFrame({spelling[name]: values for name, values in columns.items()})
+
+
+def generate_export(file_type, rows, output_file, seed=42, headers=None, sep='comma',
+                    encoding='utf-8', date_format='DD.MM.YYYY'):
+    """
+    Write a synthetic SAP export.
+
+    Args:
+        file_type: 'SM20', 'CDHDR' or 'CDPOS'
+        rows: Row count (int or preset such as '1m')
+        output_file: Destination; .xlsx writes Excel, anything else delimited text
+        seed: Seed for deterministic output
+        headers: Header spelling from HEADER_STYLES (default per file type)
+        sep: 'comma' or 'tab'
+        encoding: Text encoding for csv output
+        date_format: One of DATE_FORMATS
+
+    Returns:
+        output_file
+    """
+    rows = parse_size(rows)
+    chunks = iter_chunks(file_type, rows, seed, headers, date_format)
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+
+    if output_file.endswith('.xlsx'):
+        if rows > XLSX_MAX_ROWS:
+            raise ValueError(f"xlsx supports at most {XLSX_MAX_ROWS} data rows, got {rows}")
+        pd.concat(chunks, ignore_index=True).to_excel(output_file, index=False)
+        return output_file
+
+    # latin-1/cp1252 cannot hold every character; replace the rare ones like SAP GUI does
+    with open(output_file, 'w', encoding=encoding, errors='replace', newline='') as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, sep=DELIMITERS[sep], index=False, header=(i == 0))
+    return output_file
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Generate synthetic SAP exports')
+    parser.add_argument('file_type', choices=sorted(CHUNK_GENERATORS))
+    parser.add_argument('rows', help="row count or preset: " + ', '.join(SIZE_PRESETS))
+    parser.add_argument('output_file')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--headers', help='header spelling (SM20: gui/technical/short; CDHDR/CDPOS: technical/descriptive)')
+    parser.add_argument('--sep', choices=sorted(DELIMITERS), default='comma')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='utf-8')
+    parser.add_argument('--date-format', choices=sorted(DATE_FORMATS), default='DD.MM.YYYY')
+    args = parser.parse_args()
+
+    if args.headers and args.headers not in HEADER_STYLES[args.file_type]:
+        parser.error(f"Unknown header spelling for {args.file_type}: {args.headers}")
+
+    output_file = generate_export(args.file_type, args.rows, args.output_file, args.seed, args.headers,
+                                  args.sep, args.encoding, args.date_format)
+    print(f"Wrote {parse_size(args.rows)} {args.file_type} rows to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+SAP Archive Input - Streaming access to compressed and archived exports
+Exports can arrive as plain CSV/XLSX, gzip (.gz), Zstandard (.zst) or zip
+archives holding one or more SM20/CDHDR/CDPOS files. Each data file is exposed
+as an ArchiveMember whose open() returns a binary stream that decompresses as
+it is read, so nothing is expanded to disk.
+
+Usage:
+    for member in list_members('exports.zip'):
+        with member.open() as stream:
+            df = pd.read_csv(stream)
+"""
+
+import gzip
+import os
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+# Compression by file extension
+COMPRESSED_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.zip': 'zip',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+# Leading bytes used when the extension does not say (e.g. "export.dat")
+MAGIC_BYTES = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'PK\x03\x04', 'zip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+# Data files recognised inside archives (.xlsx is itself a zip, so it is never sniffed)
+DATA_EXTENSIONS = ('.csv', '.txt', '.tsv', '.xlsx')
+
+# ================================================================================
+# ARCHIVE MEMBERS
+# ================================================================================
+
+class ArchiveMember:
+    """One data file inside an upload (the upload itself when it is not an archive)."""
+
+    def __init__(self, path, compression, name):
+        self.path = path
+        self.compression = compression
+        self.name = name
+
+    @property
+    def file_format(self):
+        return 'xlsx' if self.name.lower().endswith('.xlsx') else 'csv'
+
+    def open(self):
+        """Binary stream of the decompressed member."""
+        if self.compression == 'gzip':
+            return gzip.open(self.path, 'rb')
+        if self.compression == 'zip':
+            # The member stream keeps the archive file open after the ZipFile is closed
+            with zipfile.ZipFile(self.path) as archive:
+                return archive.open(self.name)
+        if self.compression == 'zstd':
+            if zstandard is None:
+                raise ImportError("Reading .zst files requires the 'zstandard' package")
+            return zstandard.ZstdDecompressor().stream_reader(open(self.path, 'rb'), closefd=True)
+        return open(self.path, 'rb')
+
+    def __repr__(self):
+        return f"ArchiveMember({self.name!r}, compression={self.compression})"
+
+
+def compression_of(path):
+    """'gzip', 'zip', 'zstd', or None for an uncompressed file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in COMPRESSED_EXTENSIONS:
+        return COMPRESSED_EXTENSIONS[extension]
+    if extension in DATA_EXTENSIONS:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(4)
+    except OSError:
+        return None
+    for magic, compression in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _is_data_member(info):
+    name = info.filename
+    base = os.path.basename(name)
+    return (not info.is_dir() and not name.startswith('__MACOSX/') and not base.startswith('.')
+            and base.lower().endswith(DATA_EXTENSIONS))
+
+
+def list_members(path):
+    """ArchiveMembers for every data file in path (a single member for non-zip inputs)."""
+    compression = compression_of(path)
+    if compression == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            return [ArchiveMember(path, 'zip', info.filename) for info in archive.infolist() if _is_data_member(info)]
+    name = os.path.basename(path)
+    if compression:
+        stripped, extension = os.path.splitext(name)
+        if extension.lower() in COMPRESSED_EXTENSIONS:
+            name = stripped
+    return [ArchiveMember(path, compression, name)]
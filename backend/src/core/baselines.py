@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+SAP User Baselines - Per-user behaviour history, maintained incrementally
+For every (system, user) the baseline store keeps compact state instead of
+raw history: how often each transaction code, terminal and peer (IP) was
+seen, with its last date, and an hour-of-day histogram. After an analysis
+the new export's aggregates are added to it; past exports are never re-read.
+
+Scoring a new SM20 export against the baseline is a set of vectorized joins
+on (system, user, value) and (system, user, hour), so its cost grows with the
+new data and the size of the state, not with history. Rows deviating from an
+established user's baseline get BASELINE_FLAG labels:
+    NewTCode:<tcode>       tcode the user has never run
+    NewTerminal:<name>     terminal the user has never used
+    NewPeer:<address>      peer address the user has never come from
+    UnusualHour:<hh>       hour holding < UNUSUAL_HOUR_SHARE of the user's activity
+    NewUser                user never seen on a system that has a baseline
+Users with fewer than MIN_HISTORY_EVENTS baseline events are only learned.
+
+Tables are gzip CSVs per system in a local directory or under an S3 prefix.
+Each update records its analysis ID, so applying the same analysis twice
+(e.g. a retried Lambda) does not double its counts. Concurrent updates of the
+same system are not merged; run them one at a time.
+
+Usage:
+    baselines = UserBaselines(baseline_store('s3://bucket/baselines'))
+    baselines.score(df, 'SM20', flag_set, descriptions)      # per chunk
+    baselines.update_from_csv('SM20_analyzed.csv', analysis_id)
+
+    python -m core.baselines update <dir|s3://bucket/prefix> <analyzed.csv> [...]
+    python -m core.baselines show <dir|s3://bucket/prefix> <system> <user>
+"""
+
+import io
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from core.profiling import profile_stage
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+BASELINE_FLAG = 'BASELINE_FLAG'
+BASELINE_DESCRIPTION = 'deviations from user baselines'
+BASELINE_FILE_TYPES = ['SM20']
+
+# Baseline value kinds and the columns they are read from, in preference order
+# (SOURCE_TA is written out as TCODE by the output generator)
+VALUE_KINDS = {
+    'TCODE': ['SOURCE_TA', 'TCODE', 'TRANSACTION_CODE'],
+    'TERMINAL': ['TERMINAL'],
+    'PEER': ['PEER'],
+}
+
+KIND_LABELS = {
+    'TCODE': 'NewTCode',
+    'TERMINAL': 'NewTerminal',
+    'PEER': 'NewPeer',
+}
+
+# Users with less history than this are learned but not scored
+MIN_HISTORY_EVENTS = 50
+
+# An hour is unusual for a user below this share of their activity
+UNUSUAL_HOUR_SHARE = 0.01
+
+# Analysis IDs remembered for idempotent updates
+APPLIED_HISTORY = 1000
+
+VALUES_TABLE = 'values'
+HOURS_TABLE = 'hours'
+APPLIED_FILE = 'applied.json'
+
+# Rows read at a time when learning from an analyzed file
+UPDATE_CHUNK_ROWS = 200000
+
+# ================================================================================
+# BASELINE STORES
+# ================================================================================
+
+def _system_dir(system):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', system) or '_'
+
+
+class LocalBaselineStore:
+    """Baseline tables in a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def read_table(self, system, name):
+        path = self._path(_system_dir(system), f"{name}.csv.gz")
+        if not os.path.exists(path):
+            return None
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+    def write_table(self, system, name, df):
+        path = self._path(_system_dir(system), f"{name}.csv.gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path + '.tmp', index=False, compression='gzip')
+        os.replace(path + '.tmp', path)
+
+    def read_json(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_json(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(name) + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(self._path(name) + '.tmp', self._path(name))
+
+
+class S3BaselineStore:
+    """Baseline tables under an S3 prefix."""
+
+    def __init__(self, bucket, prefix, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self.client = client
+
+    def _get(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def read_table(self, system, name):
+        body = self._get(f"{_system_dir(system)}/{name}.csv.gz")
+        if body is None:
+            return None
+        return pd.read_csv(io.BytesIO(body), compression='gzip', dtype=str, keep_default_na=False)
+
+    def write_table(self, system, name, df):
+        buffer = io.BytesIO()
+        df.to_csv(buffer, index=False, compression={'method': 'gzip'})
+        self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{_system_dir(system)}/{name}.csv.gz",
+                               Body=buffer.getvalue())
+
+    def read_json(self, name):
+        body = self._get(name)
+        return json.loads(body) if body is not None else None
+
+    def write_json(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{name}", Body=json.dumps(data).encode())
+
+
+def baseline_store(location, client=None):
+    """Store at 's3://bucket/prefix' or a local directory."""
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3BaselineStore(bucket, prefix.strip('/') or 'baselines', client)
+    return LocalBaselineStore(location)
+
+# ================================================================================
+# OBSERVATIONS
+# ================================================================================
+
+def _text(df, candidates):
+    """First present candidate column as stripped text ('' if none is present)."""
+    for column in candidates:
+        if column in df.columns:
+            return df[column].fillna('').astype(str).str.strip().to_numpy(dtype=object)
+    return np.full(len(df), '', dtype=object)
+
+
+def _observations(df):
+    """Per-row SYSTEM, USER, HOUR (-1 if unknown), DATE and one column per value kind."""
+    obs = pd.DataFrame({'SYSTEM': _text(df, ['SYSTEM']), 'USER': _text(df, ['USER'])})
+    datetimes = df['DATETIME'] if 'DATETIME' in df.columns else pd.Series(pd.NaT, index=df.index)
+    if not pd.api.types.is_datetime64_any_dtype(datetimes):
+        datetimes = pd.to_datetime(datetimes, errors='coerce')
+    obs['HOUR'] = datetimes.dt.hour.fillna(-1).astype(int).to_numpy()
+    obs['DATE'] = datetimes.dt.strftime('%Y-%m-%d').fillna('').to_numpy()
+    for kind, candidates in VALUE_KINDS.items():
+        obs[kind] = _text(df, candidates)
+    return obs
+
+
+def _aggregate(obs):
+    """(values, hours) deltas of an observation frame."""
+    obs = obs[obs['USER'] != '']
+    values = []
+    for kind in VALUE_KINDS:
+        seen = obs[obs[kind] != '']
+        if len(seen):
+            grouped = seen.groupby(['SYSTEM', 'USER', kind]).agg(COUNT=('DATE', 'size'), LAST_SEEN=('DATE', 'max'))
+            grouped = grouped.reset_index().rename(columns={kind: 'VALUE'})
+            grouped['KIND'] = kind
+            values.append(grouped)
+    values = (pd.concat(values, ignore_index=True) if values
+              else pd.DataFrame(columns=['SYSTEM', 'USER', 'VALUE', 'COUNT', 'LAST_SEEN', 'KIND']))
+    hours = obs[obs['HOUR'] >= 0].groupby(['SYSTEM', 'USER', 'HOUR']).size().rename('COUNT').reset_index()
+    return values, hours
+
+
+def _merge_values(frames):
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=['USER', 'KIND', 'VALUE', 'COUNT', 'LAST_SEEN'])
+    values = pd.concat(frames, ignore_index=True)
+    values['COUNT'] = values['COUNT'].astype(np.int64)
+    return values.groupby(['USER', 'KIND', 'VALUE'], as_index=False).agg(COUNT=('COUNT', 'sum'),
+                                                                          LAST_SEEN=('LAST_SEEN', 'max'))
+
+
+def _merge_hours(frames):
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=['USER', 'HOUR', 'COUNT'])
+    hours = pd.concat(frames, ignore_index=True)
+    hours['HOUR'] = hours['HOUR'].astype(int)
+    hours['COUNT'] = hours['COUNT'].astype(np.int64)
+    return hours.groupby(['USER', 'HOUR'], as_index=False)['COUNT'].sum()
+
+# ================================================================================
+# BASELINES
+# ================================================================================
+
+class UserBaselines:
+    """Scores exports against, and updates, the baselines in a store."""
+
+    def __init__(self, store):
+        self.store = store
+        self._values = {}
+        self._hours = {}
+
+    def _load(self, system):
+        """Baseline tables of one system (cached; the baseline is fixed for a run)."""
+        if system not in self._values:
+            self._values[system] = _merge_values([self.store.read_table(system, VALUES_TABLE)])
+            self._hours[system] = _merge_hours([self.store.read_table(system, HOURS_TABLE)])
+        return self._values[system], self._hours[system]
+
+    def _tables(self, systems):
+        """Values and hours of the given systems, with a SYSTEM column."""
+        values, hours = [], []
+        for system in systems:
+            system_values, system_hours = self._load(system)
+            values.append(system_values.assign(SYSTEM=system))
+            hours.append(system_hours.assign(SYSTEM=system))
+        return pd.concat(values, ignore_index=True), pd.concat(hours, ignore_index=True)
+
+    def score(self, df, file_type, flag_set, descriptions):
+        """Add BASELINE_FLAG to flag_set (and descriptions) for a chunk or whole file."""
+        if file_type not in BASELINE_FILE_TYPES:
+            return
+
+        with profile_stage('detect.BASELINE_FLAG', rows=len(df)):
+            obs = _observations(df)
+            values, hours = self._tables(list(pd.unique(obs['SYSTEM'])))
+
+            # Baseline events per (system, user) decide who is established
+            totals = hours.groupby(['SYSTEM', 'USER'])['COUNT'].sum()
+            users = pd.MultiIndex.from_arrays([obs['SYSTEM'], obs['USER']])
+            total = totals.reindex(users).fillna(0).to_numpy()
+            known = total >= MIN_HISTORY_EVENTS
+            has_user = (obs['USER'] != '').to_numpy()
+
+            dictionary = flag_set.dictionary
+            slots = []
+
+            systems_with_history = set(totals.index.get_level_values(0)) if len(totals) else set()
+            new_user = has_user & (total == 0) & obs['SYSTEM'].isin(systems_with_history).to_numpy()
+            rows = np.flatnonzero(new_user)
+            slots.append((rows, np.full(len(rows), dictionary.add('NewUser'), dtype=np.int32)))
+
+            for kind, label in KIND_LABELS.items():
+                seen_index = pd.MultiIndex.from_frame(values.loc[values['KIND'] == kind, ['SYSTEM', 'USER', 'VALUE']])
+                current = pd.MultiIndex.from_arrays([obs['SYSTEM'], obs['USER'], obs[kind]])
+                new_value = known & (obs[kind] != '').to_numpy() & ~current.isin(seen_index)
+                rows = np.flatnonzero(new_value)
+                slots.append((rows, dictionary.encode((label + ':' + obs[kind].iloc[rows]).to_numpy())))
+
+            hour_counts = hours.set_index(['SYSTEM', 'USER', 'HOUR'])['COUNT']
+            current = pd.MultiIndex.from_arrays([obs['SYSTEM'], obs['USER'], obs['HOUR']])
+            count = hour_counts.reindex(current).fillna(0).to_numpy()
+            unusual = known & (obs['HOUR'] >= 0).to_numpy() & (count < UNUSUAL_HOUR_SHARE * np.maximum(total, 1))
+            rows = np.flatnonzero(unusual)
+            hour_labels = np.array([f'UnusualHour:{hour:02d}' for hour in range(24)], dtype=object)
+            slots.append((rows, dictionary.encode(hour_labels[obs['HOUR'].to_numpy()[rows]])))
+
+            flag_set.add_flag(BASELINE_FLAG, slots)
+
+        descriptions.append((BASELINE_FLAG, BASELINE_DESCRIPTION))
+        print(f"  - Found {flag_set.count(BASELINE_FLAG)} {BASELINE_DESCRIPTION}")
+
+    def update(self, frames, analysis_id=None):
+        """
+        Add the activity in frames (cleaned or analyzed SM20 DataFrames) to the
+        baselines and save them. Returns False if analysis_id was already applied.
+        """
+        applied = self.store.read_json(APPLIED_FILE) or []
+        if analysis_id and analysis_id in applied:
+            print(f"Baselines already include analysis {analysis_id}")
+            return False
+
+        with profile_stage('baseline.update') as stage:
+            value_deltas, hour_deltas = [], []
+            for df in frames:
+                values, hours = _aggregate(_observations(df))
+                value_deltas.append(values)
+                hour_deltas.append(hours)
+                stage.rows = (stage.rows or 0) + len(df)
+            values = pd.concat(value_deltas, ignore_index=True) if value_deltas else pd.DataFrame(columns=['SYSTEM'])
+            hours = pd.concat(hour_deltas, ignore_index=True) if hour_deltas else pd.DataFrame(columns=['SYSTEM'])
+
+            # Only the systems in the new data are read and rewritten
+            for system in sorted(set(values['SYSTEM']) | set(hours['SYSTEM'])):
+                base_values, base_hours = self._load(system)
+                merged_values = _merge_values([base_values, values[values['SYSTEM'] == system].drop(columns='SYSTEM')])
+                merged_hours = _merge_hours([base_hours, hours[hours['SYSTEM'] == system].drop(columns='SYSTEM')])
+                self.store.write_table(system, VALUES_TABLE, merged_values)
+                self.store.write_table(system, HOURS_TABLE, merged_hours)
+                self._values[system], self._hours[system] = merged_values, merged_hours
+
+        if analysis_id:
+            self.store.write_json(APPLIED_FILE, (applied + [analysis_id])[-APPLIED_HISTORY:])
+        return True
+
+    def update_from_csv(self, csv_file, analysis_id=None):
+        """Learn from an analyzed (or cleaned) SM20 CSV, read in chunks."""
+        header = pd.read_csv(csv_file, encoding='utf-8-sig', nrows=0).columns
+        wanted = {'SYSTEM', 'USER', 'DATETIME'} | {column for columns in VALUE_KINDS.values() for column in columns}
+        reader = pd.read_csv(csv_file, encoding='utf-8-sig', usecols=[c for c in header if c in wanted],
+                             dtype=str, keep_default_na=False, chunksize=UPDATE_CHUNK_ROWS)
+        return self.update(reader, analysis_id)
+
+    def profile(self, system, user):
+        """A user's baseline as plain data."""
+        values, hours = self._load(system)
+        user_values = values[values['USER'] == user]
+        histogram = [0] * 24
+        for hour, count in hours.loc[hours['USER'] == user, ['HOUR', 'COUNT']].itertuples(index=False):
+            histogram[int(hour)] = int(count)
+        return {
+            'system': system,
+            'user': user,
+            'events': sum(histogram),
+            'hours': histogram,
+            **{kind.lower() + 's': dict(zip(rows['VALUE'], rows['COUNT'].astype(int)))
+               for kind, rows in ((kind, user_values[user_values['KIND'] == kind]) for kind in VALUE_KINDS)},
+        }
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface - seed baselines from analyzed files or show a user."""
+    if len(sys.argv) < 4 or sys.argv[1] not in ('update', 'show'):
+        print("Usage: python -m core.baselines update <dir|s3://bucket/prefix> <analyzed.csv> [...]")
+        print("       python -m core.baselines show <dir|s3://bucket/prefix> <system> <user>")
+        return
+
+    baselines = UserBaselines(baseline_store(sys.argv[2]))
+    if sys.argv[1] == 'update':
+        for csv_file in sys.argv[3:]:
+            applied = baselines.update_from_csv(csv_file, analysis_id=os.path.abspath(csv_file))
+            print(f"{'Learned from' if applied else 'Skipped'} {csv_file}")
+    else:
+        print(json.dumps(baselines.profile(sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else ''), indent=2))
+
+if __name__ == "__main__":
+    main()
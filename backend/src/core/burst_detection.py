@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+SAP Burst Detection - Sliding-window rate flags for SM20 audit logs
+The row detectors judge each event on its own; bursts only show up as rates:
+a run of failed logons, dozens of SE16N/SM30 table accesses in a minute, or
+rapid repeated debugger events. Each BURST_RULES entry selects events (by
+event code, transaction code or an existing flag), groups them (per user, or
+per user and terminal) and flags every row that sits in a window of
+window_seconds holding at least threshold selected events.
+
+Selected rows are sorted by (group, DATETIME) once, and each row's window
+start is found with a binary search over the sorted keys, so a chunk costs
+O(n log n). Rows in a burst get BURST_FLAG labels, e.g. "Burst:failed_logons".
+
+Windows span chunk boundaries: detect_bursts returns the selected events seen
+so far, with their row numbers in the file and whether they were flagged, and
+the next chunk passes them back as carry. Exports are not always in time
+order, so a later chunk can hold an event from any earlier window; the carry
+therefore keeps every selected event (a small share of the rows), not just
+the last window of each group. Carried events count towards the next chunk's
+windows. A carried row that only joins a burst once a later chunk arrives
+belongs to a chunk that is already written, so it is reported in the returned
+carry instead (late_burst_labels) and the chunked pipeline adds its label to
+the committed output. Flags are therefore the same whatever the chunk size and
+row order.
+
+Usage:
+    flag_set, descriptions = analyze_dataframe(df, 'SM20')
+    carry = detect_bursts(df, 'SM20', flag_set, descriptions, carry, row_offset)
+    late = late_burst_labels(carry)    # {row: [labels]} of earlier chunks
+"""
+
+import numpy as np
+import pandas as pd
+
+from core.flag_set import TRIGGER_SEPARATOR
+from core.profiling import profile_stage
+from core.rule_engine import fingerprint
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+BURST_FLAG = 'BURST_FLAG'
+BURST_DESCRIPTION = 'burst activities (rate-based)'
+BURST_FILE_TYPES = ['SM20']
+
+# Selection: 'events' (EVENT codes), 'tcodes' (TRANSACTION_CODE or SOURCE_TA)
+# or 'flag' (rows where an existing flag fired); 'group' columns missing from
+# the export are ignored.
+BURST_RULES = [
+    {
+        'id': 'failed_logons',
+        'events': ['AU2', 'AUM'],
+        'group': ['USER', 'TERMINAL'],
+        'window_seconds': 300,
+        'threshold': 5,
+    },
+    {
+        'id': 'table_access',
+        'tcodes': ['SE16', 'SE16N', 'SE17', 'SM30', 'SM31', 'SM34'],
+        'group': ['USER'],
+        'window_seconds': 60,
+        'threshold': 20,
+    },
+    {
+        'id': 'debugger',
+        'flag': 'DEBUG_FLAG',
+        'group': ['USER'],
+        'window_seconds': 60,
+        'threshold': 10,
+    },
+]
+
+TCODE_COLUMNS = ['TRANSACTION_CODE', 'SOURCE_TA']
+
+# Columns burst detection reads (added to the projected detection columns)
+BURST_COLUMNS = ['DATETIME', 'USER', 'TERMINAL', 'EVENT'] + TCODE_COLUMNS
+
+BURST_LABEL_PREFIX = 'Burst:'
+
+
+def burst_fingerprint(flag_fingerprints):
+    """Fingerprint of BURST_FLAG: its rules and the fingerprints of the flags they select on."""
+    selected = sorted({rule['flag'] for rule in BURST_RULES if 'flag' in rule})
+    return fingerprint(BURST_RULES, {name: flag_fingerprints.get(name) for name in selected})
+
+# ================================================================================
+# WINDOW SCAN
+# ================================================================================
+
+def burst_mask(group_codes, times, window_seconds, threshold):
+    """
+    Rows that fall in a window of window_seconds with >= threshold rows of the same group.
+
+    Args:
+        group_codes: int array, one group code per row
+        times: int64 array of epoch seconds
+    """
+    n = len(times)
+    if n < threshold:
+        return np.zeros(n, dtype=bool)
+    order = np.lexsort((times, group_codes))
+    t = times[order]
+    # One sorted key: groups are spaced further apart than any window
+    t_min = t.min()
+    span = int(t.max() - t_min) + window_seconds + 1
+    keys = group_codes[order].astype(np.int64) * span + (t - t_min)
+
+    # Window ending at row i covers keys in [key_i - window, key_i]
+    starts = np.searchsorted(keys, keys - window_seconds, side='left')
+    ends = np.arange(n)
+    full = (ends - starts + 1) >= threshold
+
+    # Mark every row inside a full window: +1 at its start, -1 after its end
+    cover = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(cover, starts[full], 1)
+    np.add.at(cover, ends[full] + 1, -1)
+    in_burst = np.empty(n, dtype=bool)
+    in_burst[order] = np.cumsum(cover[:-1]) > 0
+    return in_burst
+
+# ================================================================================
+# RULES
+# ================================================================================
+
+def _epoch_seconds(df):
+    """DATETIME as int64 epoch seconds, with a validity mask."""
+    values = df['DATETIME']
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values, errors='coerce')
+    valid = values.notna().to_numpy()
+    seconds = np.zeros(len(values), dtype=np.int64)
+    seconds[valid] = values[valid].to_numpy().astype('datetime64[s]').astype(np.int64)
+    return seconds, valid
+
+
+def _upper_strip(series):
+    return series.fillna('').astype(str).str.strip().str.upper()
+
+
+def _selected(df, rule, flag_set):
+    """Boolean mask of the rows a rule counts."""
+    if 'events' in rule:
+        if 'EVENT' not in df.columns:
+            return np.zeros(len(df), dtype=bool)
+        return _upper_strip(df['EVENT']).isin(rule['events']).to_numpy()
+    if 'tcodes' in rule:
+        mask = np.zeros(len(df), dtype=bool)
+        for column in TCODE_COLUMNS:
+            if column in df.columns:
+                mask |= _upper_strip(df[column]).isin(rule['tcodes']).to_numpy()
+        return mask
+    if rule.get('flag') in flag_set.flags:
+        return flag_set.mask(rule['flag'])
+    return np.zeros(len(df), dtype=bool)
+
+
+def _group_keys(df, rule, rows):
+    """Group key strings ('USER|TERMINAL') for the selected rows."""
+    columns = [column for column in rule['group'] if column in df.columns]
+    if not columns:
+        return np.full(len(rows), '', dtype=object)
+    keys = df[columns[0]].iloc[rows].fillna('').astype(str)
+    for column in columns[1:]:
+        keys = keys + '|' + df[column].iloc[rows].fillna('').astype(str)
+    return keys.to_numpy(dtype=object)
+
+
+def _empty_carry():
+    return {'groups': [], 'codes': [], 'times': [], 'rows': [], 'flagged': [], 'late': []}
+
+
+def _apply_rule(df, rule, flag_set, times, valid, carried, row_offset):
+    """
+    Burst rows of df for one rule, and the events to carry into the next chunk.
+
+    Returns:
+        (row positions in df, carry): carry holds every selected event so far
+        (group key codes into 'groups', 'times', file 'rows', 'flagged') and
+        the file rows of carried events this chunk put in a burst ('late')
+    """
+    rows = np.flatnonzero(_selected(df, rule, flag_set) & valid)
+    carried = carried or _empty_carry()
+    carried_count = len(carried['codes'])
+    carried_keys = np.array(carried['groups'], dtype=object)[np.array(carried['codes'], dtype=np.int64)]
+    keys = np.concatenate([carried_keys, _group_keys(df, rule, rows)])
+    event_times = np.concatenate([np.array(carried['times'], dtype=np.int64), times[rows]])
+    positions = np.concatenate([np.array(carried['rows'], dtype=np.int64), rows + row_offset])
+    if len(keys) == 0:
+        return rows, _empty_carry()
+
+    group_codes, groups = pd.factorize(keys)
+    in_burst = burst_mask(group_codes, event_times, rule['window_seconds'], rule['threshold'])
+
+    # Carried rows entering a burst now were written unflagged with their chunk
+    flagged = in_burst.copy()
+    flagged[:carried_count] |= np.array(carried['flagged'], dtype=bool)
+    late = in_burst[:carried_count] & ~np.array(carried['flagged'], dtype=bool)
+
+    # A later chunk may hold an event of any earlier window, so every event is kept
+    carry = {'groups': list(groups), 'codes': group_codes.tolist(), 'times': event_times.tolist(),
+             'rows': positions.tolist(), 'flagged': flagged.tolist(),
+             'late': positions[:carried_count][late].tolist()}
+
+    return rows[in_burst[carried_count:]], carry
+
+
+def detect_bursts(df, file_type, flag_set, descriptions, carry=None, row_offset=0):
+    """
+    Add BURST_FLAG to flag_set (and descriptions) for a chunk or whole file.
+
+    Args:
+        df: Cleaned DataFrame with DATETIME
+        file_type: Only BURST_FILE_TYPES are scanned
+        flag_set: FlagSet from detection (rules may select on its flags)
+        descriptions: [(flag column, description)] from detection, extended in place
+        carry: Return value of the previous chunk's call, or None
+        row_offset: Row number of df's first row in the file (chunks after the first)
+
+    Returns:
+        Carry for the next chunk (JSON-serializable)
+    """
+    if file_type not in BURST_FILE_TYPES:
+        return carry
+    carry = carry or {}
+    if 'DATETIME' not in df.columns:
+        print("  - Warning: No DATETIME column, burst detection skipped")
+        return carry
+
+    with profile_stage('detect.BURST_FLAG', rows=len(df)):
+        times, valid = _epoch_seconds(df)
+        slots = []
+        next_carry = {}
+        for rule in BURST_RULES:
+            rows, next_carry[rule['id']] = _apply_rule(df, rule, flag_set, times, valid, carry.get(rule['id']),
+                                                       row_offset)
+            label_id = flag_set.dictionary.add(BURST_LABEL_PREFIX + rule['id'])
+            slots.append((rows, np.full(len(rows), label_id, dtype=np.int32)))
+        flag_set.add_flag(BURST_FLAG, slots)
+
+    descriptions.append((BURST_FLAG, BURST_DESCRIPTION))
+    print(f"  - Found {flag_set.count(BURST_FLAG)} {BURST_DESCRIPTION}")
+    return next_carry
+
+# ================================================================================
+# LATE BURSTS
+# ================================================================================
+
+def late_burst_labels(carry):
+    """
+    {file row: [labels]} of the rows of earlier chunks that the chunk which
+    returned carry put in a burst.
+    """
+    late = {}
+    for rule in BURST_RULES:
+        for row in (carry or {}).get(rule['id'], {}).get('late', []):
+            late.setdefault(row, []).append(BURST_LABEL_PREFIX + rule['id'])
+    return late
+
+
+def merge_burst_labels(value, labels):
+    """A rendered BURST_FLAG value with labels added, in BURST_RULES order."""
+    present = set(value.split(TRIGGER_SEPARATOR)) if value else set()
+    present.update(labels)
+    return TRIGGER_SEPARATOR.join(BURST_LABEL_PREFIX + rule['id'] for rule in BURST_RULES
+                                  if BURST_LABEL_PREFIX + rule['id'] in present)
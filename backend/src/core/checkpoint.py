@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+SAP Analysis Checkpoints - Chunked pipeline that resumes after a crash
+Runs clean -> detect -> enrich over fixed-size chunks of an export. After each
+chunk its enriched output part and the accumulated state (input offset, read
+options, detected DATE/TIME formats, summary, burst windows) are committed to a checkpoint
+store - a local directory or an S3 prefix under the analysis ID. A restarted
+run skips the committed chunks and continues from the next one.
+
+Chunk boundaries, read options and DATE/TIME formats are fixed by the first
+run and kept in the checkpoint, so a resumed run produces output identical to
+an uninterrupted one. Rows that only join a burst once a later chunk is
+processed (see core/burst_detection.py) are recorded in the state; their
+BURST_FLAG labels are added to the committed parts when the output is
+assembled, so the flags do not depend on the chunk size. Chunks are read as text (dtype=str), so values are never
+re-typed differently from one chunk to the next.
+
+Usage:
+    store = checkpoint_store('s3://bucket/checkpoints', analysis_id)   # or a local dir
+    summary = run_checkpointed(input_file, 'SM20', output_file, store, lookup_manager)
+"""
+
+import bisect
+import codecs
+import gc
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+from core.archive_input import list_members
+from core.baselines import BASELINE_FILE_TYPES
+from core.burst_detection import BURST_FLAG, detect_bursts, late_burst_labels, merge_burst_labels
+from core.memory_governor import FixedChunks, MemoryGovernor, MemoryPressure
+from core.profiling import profile_stage
+from core.sap_analyzer import analyze_dataframe, combine_summaries, summarize_flags
+from core.sap_output_generator import PROCESSORS
+from core.sketches import TriageSketches
+from core.sm20_cleaner import ENCODING_OPTIONS, clean_dataframe, detect_file_type
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+# Rows per committed chunk
+CHECKPOINT_CHUNK_ROWS = 200000
+
+# Bump when the state layout changes; older checkpoints are discarded
+CHECKPOINT_VERSION = 5
+
+# Bytes examined when choosing the encoding and delimiter of a CSV
+SNIFF_BYTES = 1024 * 1024
+
+# Rows parsed at a time when skipping committed rows on resume
+SKIP_CHUNK_ROWS = 200000
+
+STATE_FILE = 'state.json'
+PART_TEMPLATE = 'part-{:05d}.csv'
+
+# ================================================================================
+# CHECKPOINT STORES
+# ================================================================================
+
+class LocalCheckpointStore:
+    """Checkpoint state and output parts in a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load_state(self):
+        try:
+            with open(os.path.join(self.directory, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_state(self, state):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_file = os.path.join(self.directory, STATE_FILE + '.tmp')
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_file, os.path.join(self.directory, STATE_FILE))
+
+    def save_part(self, index, local_file):
+        os.makedirs(self.directory, exist_ok=True)
+        part_file = os.path.join(self.directory, PART_TEMPLATE.format(index))
+        shutil.copyfile(local_file, part_file + '.tmp')
+        os.replace(part_file + '.tmp', part_file)
+
+    def fetch_part(self, index, local_file):
+        shutil.copyfile(os.path.join(self.directory, PART_TEMPLATE.format(index)), local_file)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class S3CheckpointStore:
+    """Checkpoint state and output parts under an S3 prefix."""
+
+    def __init__(self, bucket, prefix, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self.client = client
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}"
+
+    def load_state(self):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(STATE_FILE))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def save_state(self, state):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(STATE_FILE), Body=json.dumps(state).encode())
+
+    def save_part(self, index, local_file):
+        self.client.upload_file(local_file, self.bucket, self._key(PART_TEMPLATE.format(index)))
+
+    def fetch_part(self, index, local_file):
+        self.client.download_file(self.bucket, self._key(PART_TEMPLATE.format(index)), local_file)
+
+    def clear(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + '/'):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects})
+
+
+def checkpoint_store(location, analysis_id, client=None):
+    """Store for an analysis: 's3://bucket/prefix' or a local directory."""
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3CheckpointStore(bucket, f"{prefix.strip('/')}/{analysis_id}".lstrip('/'), client)
+    return LocalCheckpointStore(os.path.join(location, analysis_id))
+
+# ================================================================================
+# CHUNKED READING
+# ================================================================================
+
+def _sniff_csv_options(member):
+    """Encoding and delimiter for a CSV member, chosen from its first bytes."""
+    with member.open() as f:
+        sample = f.read(SNIFF_BYTES)
+    encoding = ENCODING_OPTIONS[-1]
+    for candidate in ENCODING_OPTIONS:
+        try:
+            # Incremental decode so a character split at the sample's end is not an error
+            codecs.getincrementaldecoder(candidate)().decode(sample, final=False)
+            encoding = candidate
+            break
+        except UnicodeDecodeError:
+            continue
+    with member.open() as f:
+        header = pd.read_csv(f, encoding=encoding, nrows=50, on_bad_lines='skip')
+    return {'encoding': encoding, 'sep': '\t' if len(header.columns) == 1 else ','}
+
+
+class _ChunkReader:
+    """Reads an export as text DataFrames in chunks of any size (xlsx is loaded once and sliced)."""
+
+    def __init__(self, member, read_options):
+        self._stream = None
+        self._reader = None
+        self._df = None
+        self._position = 0
+        if member.file_format == 'xlsx':
+            with member.open() as f:
+                self._df = pd.read_excel(f if f.seekable() else io.BytesIO(f.read()), dtype=str)
+        else:
+            self._stream = member.open()
+            self._reader = pd.read_csv(self._stream, encoding=read_options['encoding'], sep=read_options['sep'],
+                                       dtype=str, on_bad_lines='skip', encoding_errors='replace', iterator=True)
+
+    def read(self, rows):
+        """Next chunk of up to rows rows, or None at the end."""
+        if self._df is not None:
+            chunk = self._df.iloc[self._position:self._position + rows]
+            self._position += len(chunk)
+        else:
+            try:
+                chunk = self._reader.get_chunk(rows)
+            except StopIteration:
+                return None
+        return chunk.reset_index(drop=True) if len(chunk) else None
+
+    def skip(self, rows):
+        """Discard rows already committed by an earlier run."""
+        while rows > 0:
+            chunk = self.read(min(rows, SKIP_CHUNK_ROWS))
+            if chunk is None:
+                break
+            rows -= len(chunk)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+
+# ================================================================================
+# CHECKPOINTED PIPELINE
+# ================================================================================
+
+def _new_state(input_file, member, file_type):
+    return {
+        'version': CHECKPOINT_VERSION,
+        'input': {'name': member.name, 'size': os.path.getsize(input_file)},
+        'file_type': file_type,
+        'read_options': _sniff_csv_options(member) if member.file_format == 'csv' else {},
+        'datetime_formats': [None, None],
+        'columns': None,
+        'burst_carry': None,
+        'burst_late': {},
+        'part_rows': [],
+        'chunks_done': 0,
+        'rows_done': 0,
+        'summary': None,
+        'completed': False,
+    }
+
+
+def _load_or_start(store, input_file, member, file_type):
+    """The committed state for this input, or a fresh one."""
+    state = store.load_state()
+    if state is not None:
+        same_input = (state.get('version') == CHECKPOINT_VERSION
+                      and state['input'] == {'name': member.name, 'size': os.path.getsize(input_file)}
+                      and state['file_type'] == file_type)
+        if same_input:
+            if state['completed']:
+                print(f"Checkpoint complete ({state['rows_done']} rows), reassembling output")
+            elif state['chunks_done']:
+                print(f"Resuming from checkpoint: {state['chunks_done']} chunks "
+                      f"({state['rows_done']} rows) already committed")
+            return state
+        print("Warning: Checkpoint belongs to a different input, starting over")
+    return _new_state(input_file, member, file_type)
+
+
+def _process_chunk(raw, file_type, state, lookup_manager, governor, baselines=None):
+    """
+    Clean, detect and enrich one chunk; returns (enriched DataFrame, chunk
+    summary, burst carry for the next chunk). Raises MemoryPressure if RSS nears
+    the governor's budget between steps; raw and state['burst_carry'] are left
+    untouched so the chunk can be split and retried.
+    """
+    df, datetime_formats = clean_dataframe(raw.copy(deep=False), file_type, tuple(state['datetime_formats']))
+    state['datetime_formats'] = list(datetime_formats)
+    governor.check('clean')
+
+    flag_set, descriptions = analyze_dataframe(df, file_type)
+    burst_carry = detect_bursts(df, file_type, flag_set, descriptions, state['burst_carry'], sum(state['part_rows']))
+    if baselines is not None:
+        baselines.score(df, file_type, flag_set, descriptions)
+    with profile_stage('analyze.render', rows=len(df)):
+        for flag_name, _ in descriptions:
+            df[flag_name] = flag_set.render(flag_name)
+    summary = summarize_flags(flag_set, descriptions)
+    with profile_stage('analyze.sketches', rows=len(df)):
+        sketches = TriageSketches()
+        sketches.update(df, flag_set)
+        summary['triage'] = sketches.to_dict()
+    governor.check('detect')
+
+    df = PROCESSORS[file_type](df, lookup_manager, flag_set)
+    governor.check('enrich')
+    return df, summary, burst_carry
+
+
+def _record_late_bursts(state, burst_carry):
+    """Add the earlier-chunk rows a chunk put in a burst to state['burst_late'] ({row: [labels]})."""
+    for row, labels in late_burst_labels(burst_carry).items():
+        recorded = state['burst_late'].setdefault(str(row), [])
+        recorded.extend(label for label in labels if label not in recorded)
+
+
+def _part_file(store, local_parts, index, temp_dir):
+    """Local copy of a committed part."""
+    part_file = local_parts.get(index)
+    if part_file is None:
+        part_file = os.path.join(temp_dir, PART_TEMPLATE.format(index))
+        store.fetch_part(index, part_file)
+        local_parts[index] = part_file
+    return part_file
+
+
+def _late_rows_by_part(state):
+    """{part index: {row in part: [labels]}} of the recorded late burst rows."""
+    starts = [0]
+    for rows in state['part_rows']:
+        starts.append(starts[-1] + rows)
+    by_part = {}
+    for row, labels in state['burst_late'].items():
+        row = int(row)
+        index = bisect.bisect_right(starts, row) - 1
+        by_part.setdefault(index, {})[row - starts[index]] = labels
+    return by_part
+
+
+def _patch_part(part_file, index, columns, late_rows):
+    """
+    Read a committed part and add the late BURST_FLAG labels to it.
+
+    Returns:
+        (patched DataFrame, {'burst': rows newly in BURST_FLAG, 'flagged': rows newly flagged})
+    """
+    first = index == 0
+    df = pd.read_csv(part_file, encoding='utf-8-sig' if first else 'utf-8', dtype=str, keep_default_na=False,
+                     header=0 if first else None, names=None if first else columns)
+    flag_columns = [column for column in df.columns if column.endswith(('_FLAG', '_FLAGS'))]
+    rows = sorted(late_rows)
+    before = df[BURST_FLAG].iloc[rows]
+    newly = {'burst': int((before == '').sum()),
+             'flagged': int((df[flag_columns].iloc[rows] == '').all(axis=1).sum())}
+    position = df.columns.get_loc(BURST_FLAG)
+    for row, value in zip(rows, before):
+        df.iat[row, position] = merge_burst_labels(value, late_rows[row])
+    return df, newly
+
+
+def _add_late_bursts_to_summary(store, state, local_parts, temp_dir):
+    """Count the late burst rows in the summary (once, when the last chunk is committed)."""
+    summary = state['summary']
+    for index, late_rows in _late_rows_by_part(state).items():
+        _, newly = _patch_part(_part_file(store, local_parts, index, temp_dir), index, state['columns'], late_rows)
+        summary['flag_counts'][BURST_FLAG] = summary['flag_counts'].get(BURST_FLAG, 0) + newly['burst']
+        summary['flagged_records'] += newly['flagged']
+
+
+def _assemble(store, state, local_parts, output_file, temp_dir):
+    """Concatenate the committed parts, in order, into output_file (with the late burst labels added)."""
+    late_by_part = _late_rows_by_part(state)
+    with profile_stage('checkpoint.assemble', rows=state['rows_done']) as stage:
+        with open(output_file, 'wb') as out:
+            for index in range(state['chunks_done']):
+                part_file = _part_file(store, local_parts, index, temp_dir)
+                if index in late_by_part:
+                    # Committed parts stay as they are, so assembling again gives the same output
+                    df, _ = _patch_part(part_file, index, state['columns'], late_by_part[index])
+                    part_file = os.path.join(temp_dir, 'patched-' + PART_TEMPLATE.format(index))
+                    df.to_csv(part_file, index=False, header=(index == 0), encoding='utf-8-sig' if index == 0 else 'utf-8')
+                with open(part_file, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        stage.bytes_written = os.path.getsize(output_file)
+
+
+def run_checkpointed(input_file, file_type, output_file, store, lookup_manager, member=None,
+                     chunk_rows=CHECKPOINT_CHUNK_ROWS, governor=None, baselines=None):
+    """
+    Clean, analyze and enrich an export chunk by chunk, committing each chunk
+    to store, and write the enriched CSV to output_file.
+
+    Args:
+        input_file: Export path (plain, compressed or archive)
+        file_type: 'SM20', 'CDHDR' or 'CDPOS'
+        output_file: Enriched CSV to write
+        store: LocalCheckpointStore or S3CheckpointStore for this analysis
+        lookup_manager: LookupManager for enrichment
+        member: ArchiveMember of input_file (required for multi-file archives)
+        chunk_rows: Rows per chunk when no governor is given
+        governor: MemoryGovernor sizing chunks to a RAM budget
+        baselines: UserBaselines to score chunks against (adds BASELINE_FLAG);
+            the caller updates them once the run is complete
+
+    Returns:
+        Summary dict (total_records, flagged_records, flag_counts, triage sketches)
+    """
+    if member is None:
+        members = list_members(input_file)
+        if len(members) != 1:
+            raise ValueError(f"{input_file} contains {len(members)} data files; pass the member to run")
+        member = members[0]
+    governor = governor or FixedChunks(chunk_rows)
+
+    state = _load_or_start(store, input_file, member, file_type)
+    local_parts = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if not state['completed']:
+            reader = _ChunkReader(member, state['read_options'])
+            try:
+                reader.skip(state['rows_done'])
+                _run_chunks(reader, file_type, state, store, lookup_manager, governor, local_parts, temp_dir,
+                            baselines)
+            finally:
+                reader.close()
+            if state['burst_late'] and state['summary']:
+                _add_late_bursts_to_summary(store, state, local_parts, temp_dir)
+            state['completed'] = True
+            store.save_state(state)
+
+        _assemble(store, state, local_parts, output_file, temp_dir)
+
+    print(f"Checkpointed run complete: {state['rows_done']} rows in {state['chunks_done']} chunks -> {output_file}")
+    return state['summary'] or {'total_records': 0, 'flagged_records': 0, 'flag_counts': {}}
+
+
+def _split(df, rows):
+    """df in pieces of at most rows rows."""
+    if len(df) <= rows:
+        return [df]
+    return [df.iloc[i:i + rows].reset_index(drop=True) for i in range(0, len(df), rows)]
+
+
+def _run_chunks(reader, file_type, state, store, lookup_manager, governor, local_parts, temp_dir, baselines=None):
+    """Process and commit chunks until the reader is exhausted."""
+    pending = []  # pieces of a chunk that hit MemoryPressure, retried before reading on
+    while True:
+        governor.start_chunk()
+        raw = pending.pop(0) if pending else reader.read(governor.next_chunk_rows())
+        if raw is None:
+            return
+
+        index = state['chunks_done']
+        print(f"\nChunk {index + 1}: rows {state['rows_done'] + 1}-{state['rows_done'] + len(raw)}")
+        try:
+            df, summary, burst_carry = _process_chunk(raw, file_type, state, lookup_manager, governor, baselines)
+        except MemoryPressure as e:
+            if len(raw) <= governor.min_rows:
+                raise
+            df = None
+            gc.collect()
+            size = governor.shrink(len(raw))
+            print(f"Warning: {e}; retrying in chunks of {size} rows")
+            pending = [piece for chunk in [raw] + pending for piece in _split(chunk, size)]
+            continue
+
+        columns = list(df.columns)
+        if state['columns'] is not None and columns != state['columns']:
+            raise ValueError(f"Chunk {index + 1} produced different columns than earlier chunks")
+
+        part_file = os.path.join(temp_dir, PART_TEMPLATE.format(index))
+        with profile_stage('checkpoint.commit', rows=len(df)) as stage:
+            if index == 0:
+                df.to_csv(part_file, index=False, encoding='utf-8-sig')
+            else:
+                df.to_csv(part_file, index=False, header=False, encoding='utf-8')
+            stage.bytes_written = os.path.getsize(part_file)
+            store.save_part(index, part_file)
+
+            # The state is written last: a part only counts once its state is committed
+            state['summary'] = combine_summaries([state['summary'], summary]) if state['summary'] else summary
+            state['columns'] = columns
+            state['burst_carry'] = burst_carry
+            _record_late_bursts(state, burst_carry)
+            state['part_rows'].append(len(df))
+            state['chunks_done'] = index + 1
+            state['rows_done'] += len(raw)
+            store.save_state(state)
+        local_parts[index] = part_file
+
+        governor.finish_chunk(len(raw), df)
+        del df, raw
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface - resumable analysis of one export."""
+    if len(sys.argv) < 4:
+        print("Usage: python -m core.checkpoint <input file> <output csv> <checkpoint dir | s3://bucket/prefix> "
+              "[file type] [baseline dir | s3://bucket/prefix]")
+        print("Re-running the same command after a crash resumes from the last committed chunk.")
+        return
+
+    from core.baselines import UserBaselines, baseline_store
+    from core.sap_output_generator import LookupManager
+    from core.sketches import triage_report
+
+    input_file, output_file, location = sys.argv[1:4]
+    file_type = sys.argv[4] if len(sys.argv) > 4 else detect_file_type(input_file)
+    baselines = UserBaselines(baseline_store(sys.argv[5])) if len(sys.argv) > 5 else None
+    analysis_id = os.path.splitext(os.path.basename(input_file))[0]
+    store = checkpoint_store(location, analysis_id)
+
+    summary = run_checkpointed(input_file, file_type, output_file, store, LookupManager(), governor=MemoryGovernor(),
+                               baselines=baselines)
+    if baselines is not None and file_type in BASELINE_FILE_TYPES:
+        baselines.update_from_csv(output_file, analysis_id)
+    store.clear()
+    if summary.get('triage'):
+        summary['triage'] = triage_report(summary['triage'])
+    print(json.dumps(summary, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+SAP DataFrame Backends - Column kernels behind the cleaner, detectors and enrichment
+The pipeline passes pandas DataFrames between stages (CSV reading and writing,
+FlagSet, checkpoints), but the column work inside the stages goes through a
+backend:
+
+    clean_strings(df, columns)   cleaner normalization: str(), strip, null
+                                 spellings to '', whitespace runs to one space,
+                                 non-printable characters removed
+    factorize(series)            detector encoding: (codes, str() of distinct
+                                 values), missing values render as 'nan'
+    map_lookup(series, lookup)   lookup join: stripped value -> description,
+                                 '' when missing or not found
+
+Backends:
+    pandas  (default) Object-column operations on one core.
+    polars  (if installed) Arrow strings and vectorized, multi-threaded
+            kernels; the string columns of a frame are cleaned in parallel.
+            Meant to match the pandas backend value for value; the kernels
+            are checked on adversarial inputs in tests/test_backend_parity.py.
+
+Select with SAP_DATAFRAME_BACKEND=polars; benchmarks/backend_parity.py compares
+the files both backends produce and their stage times.
+
+Usage:
+    backend = get_backend()
+    df = backend.clean_strings(df, ['USER', 'EVENT'])
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+BACKEND_ENV = 'SAP_DATAFRAME_BACKEND'
+DEFAULT_BACKEND = 'pandas'
+
+# Cell values the cleaner treats as empty
+NULL_STRINGS = ['nan', 'None', 'NaN', 'NULL', '<NA>']
+
+# Python's str.isspace() set: Unicode White_Space plus the \x1c-\x1f separators
+WHITESPACE_CLASS = r'[\s\x1c-\x1f]'
+
+# Characters str.isprintable() rejects once whitespace runs are spaces
+NON_PRINTABLE_PATTERN = r'[\p{C}--\n]'
+
+# ================================================================================
+# PANDAS BACKEND
+# ================================================================================
+
+def _map_unique(series, func):
+    """
+    Apply func once per distinct value of series and broadcast the results.
+    Missing values are passed to func as NaN, exactly once.
+    """
+    codes, uniques = pd.factorize(series)
+    results = np.empty(len(uniques) + 1, dtype=object)
+    results[:len(uniques)] = [func(value) for value in uniques]
+    results[-1] = func(np.nan)  # code -1 marks missing values
+    return pd.Series(results[codes], index=series.index, name=series.name)
+
+
+class PandasBackend:
+    """Reference implementation on pandas object columns."""
+
+    name = 'pandas'
+
+    def clean_strings(self, df, columns):
+        """Clean string columns by stripping whitespace and normalizing."""
+        for col in columns:
+            # Strip whitespace
+            df[col] = df[col].apply(lambda x: str(x).strip() if pd.notna(x) else '')
+            # Replace various null representations with empty string
+            df[col] = df[col].replace(NULL_STRINGS, '')
+            # Clean up extra whitespace
+            df[col] = df[col].str.replace(r'\s+', ' ', regex=True)
+            # Remove non-printable characters except newlines
+            df[col] = df[col].apply(lambda x: ''.join(c for c in x if c.isprintable() or c == '\n') if x else '')
+        return df
+
+    def factorize(self, series):
+        """Codes and str() of the distinct values; missing values get a trailing 'nan'."""
+        codes, uniques = pd.factorize(series)
+        uniques = np.array([str(value) for value in uniques] + ['nan'], dtype=object)
+        codes = np.where(codes < 0, len(uniques) - 1, codes)
+        return codes, uniques
+
+    def map_lookup(self, series, lookup_dict):
+        """Description of each stripped value ('' when missing or unknown)."""
+        return _map_unique(series, lambda x: lookup_dict.get(str(x).strip(), '') if pd.notna(x) else '')
+
+# ================================================================================
+# POLARS BACKEND
+# ================================================================================
+
+def _polars_strings(series):
+    """series as a polars String Series: str() of each value, null where missing."""
+    if series.dtype != object:
+        # Numeric columns: str() once per distinct value
+        codes, uniques = pd.factorize(series)
+        values = np.array([str(value) for value in uniques] + [None], dtype=object)[codes]
+    else:
+        values = series.to_numpy(dtype=object, copy=True)
+        missing = pd.isna(values)
+        values[missing] = None
+        if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            # Mixed objects row by row: factorize would merge True with 1
+            values[~missing] = [str(value) for value in values[~missing]]
+    # From a list: an object array starting with None would be inferred as Object
+    return pl.Series(str(series.name), values.tolist(), dtype=pl.String)
+
+
+def _strip(expr):
+    """str.strip() semantics (Rust's whitespace set lacks \\x1c-\\x1f)."""
+    return expr.str.replace_all(f'^{WHITESPACE_CLASS}+|{WHITESPACE_CLASS}+$', '')
+
+
+class PolarsBackend:
+    """Vectorized, multi-threaded kernels on Arrow strings (requires polars)."""
+
+    name = 'polars'
+
+    def __init__(self):
+        if pl is None:
+            raise ImportError("The polars backend requires the 'polars' package")
+
+    def _clean_expression(self, name):
+        expr = _strip(pl.col(name).fill_null(''))
+        expr = expr.replace(NULL_STRINGS, '')
+        expr = expr.str.replace_all(f'{WHITESPACE_CLASS}+', ' ')
+        return expr.str.replace_all(NON_PRINTABLE_PATTERN, '').alias(name)
+
+    def clean_strings(self, df, columns):
+        """Same result as PandasBackend.clean_strings; columns are cleaned in parallel."""
+        if not columns:
+            return df
+        frame = pl.DataFrame([_polars_strings(df[col]) for col in columns])
+        frame = frame.with_columns([self._clean_expression(str(col)) for col in columns])
+        for col in columns:
+            df[col] = pd.Series(frame[str(col)].to_numpy(), index=df.index, dtype=object)
+        return df
+
+    def factorize(self, series):
+        """Codes and str() of the distinct values; missing values get a trailing 'nan'."""
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            return PandasBackend.factorize(self, series)  # keeps pandas' merging of equal mixed values
+        values = _polars_strings(series)
+        distinct = values.drop_nulls().unique(maintain_order=True)
+        codes = values.replace_strict(distinct, pl.Series(np.arange(len(distinct))), default=len(distinct),
+                                      return_dtype=pl.Int64).to_numpy()
+        return codes, np.array(distinct.to_list() + ['nan'], dtype=object)
+
+    def map_lookup(self, series, lookup_dict):
+        """Description of each stripped value ('' when missing or unknown)."""
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            return PandasBackend.map_lookup(self, series, lookup_dict)
+        keys = pl.DataFrame([_polars_strings(series)]).select(_strip(pl.col(str(series.name)))).to_series()
+        distinct = keys.drop_nulls().unique()
+        found = [lookup_dict.get(key, '') for key in distinct.to_list()]
+        found = [None if pd.isna(value) else str(value) for value in found]
+        mapped = keys.replace_strict(distinct, pl.Series(found, dtype=pl.String), default=None)
+        # NaN descriptions stay missing (written as ''), missing keys map to ''
+        result = mapped.to_numpy()
+        result[keys.is_null().to_numpy()] = ''
+        return pd.Series(result, index=series.index, name=series.name, dtype=object)
+
+# ================================================================================
+# SELECTION
+# ================================================================================
+
+BACKENDS = {
+    'pandas': PandasBackend,
+    'polars': PolarsBackend,
+}
+
+_instances = {}
+
+
+def get_backend(name=None):
+    """
+    The backend named (or set in SAP_DATAFRAME_BACKEND), defaulting to pandas.
+    An unavailable or unknown backend falls back to pandas with a warning.
+    """
+    name = (name or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND).lower()
+    if name not in _instances:
+        try:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown backend '{name}'")
+            _instances[name] = BACKENDS[name]()
+        except (ImportError, ValueError) as e:
+            print(f"Warning: {e}, using the pandas backend")
+            _instances[name] = get_backend(DEFAULT_BACKEND)
+    return _instances[name]
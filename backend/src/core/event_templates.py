@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+SAP Event Templates - EVENT_DESCRIPTION with the event's variables filled in
+The descriptions in data/events.csv are SAP audit log message templates:
+
+    AU2  Logon failed (reason=&B, type=&A, method=&C)
+    AM1  Database error &a in access to &b
+    A03  Breakpoint &9&9&9&9&4 reached
+
+Placeholders are filled from the SM20 variable columns:
+
+    &A / &a, &B / &b, &C / &c    VARIABLE1, VARIABLE2, VARIABLE3
+    &D ... / &d ...              no column in the export: rendered as ''
+    &9&9&9&9&4, &4, &70          old-style placeholders (field lengths); each
+                                 run of them is one slot, and the slots take
+                                 VARIABLE1, VARIABLE2, VARIABLE3 in order
+                                 (later slots are rendered as '')
+
+Anything else after '&' (AB4 "&&&&&", AB5 "&>E5") is literal text, and a
+missing variable value renders as ''.
+
+Each template is compiled once into a render plan, a tuple of literal strings
+and variable indices. Rendering groups the rows by event code and builds each
+group's descriptions with one vectorized concatenation per plan part, so a row
+costs a few string concatenations and no pattern matching. Events without
+placeholders are copied unchanged.
+
+Usage:
+    plans = compile_templates(lookup_manager.events_dict)
+    df['EVENT_DESCRIPTION'] = render_descriptions(df['EVENT'], [df['VARIABLE1'], ...], plans)
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+# Columns placeholder 1, 2, 3 are filled from
+VARIABLE_COLUMNS = ['VARIABLE1', 'VARIABLE2', 'VARIABLE3']
+
+# &<letter>, or a run of &<digits> (one old-style slot)
+PLACEHOLDER_PATTERN = re.compile(r'&([A-Za-z])|((?:&\d+)+)')
+
+# ================================================================================
+# COMPILATION
+# ================================================================================
+
+def compile_template(template):
+    """
+    Render plan of one template: a tuple of literal strings and 0-based
+    variable indices. Adjacent literals are merged; a template without
+    placeholders compiles to (template,).
+    """
+    if not isinstance(template, str):
+        return ('' if pd.isna(template) else str(template),)
+    parts = []
+    position = 0
+    slot = 0
+    for match in PLACEHOLDER_PATTERN.finditer(template):
+        parts.append(template[position:match.start()])
+        if match.group(1):
+            parts.append(ord(match.group(1).upper()) - ord('A'))
+        else:
+            parts.append(slot)
+            slot += 1
+        position = match.end()
+    parts.append(template[position:])
+
+    plan = []
+    for part in parts:
+        if isinstance(part, str) and plan and isinstance(plan[-1], str):
+            plan[-1] += part
+        elif part != '':
+            plan.append(part)
+    return tuple(plan) or ('',)
+
+
+def compile_templates(descriptions):
+    """Render plan of each event code's description ({event: plan})."""
+    return {event: compile_template(description) for event, description in descriptions.items()}
+
+# ================================================================================
+# RENDERING
+# ================================================================================
+
+def _variable_strings(series):
+    """Object array of str() of each value, '' where missing."""
+    values = series.to_numpy(dtype=object, copy=True)
+    missing = pd.isna(values)
+    values[missing] = ''
+    if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        values = np.array([str(value) for value in values], dtype=object)
+    return values
+
+
+def render_descriptions(events, variables, plans):
+    """
+    Description of each row's event with its variables filled in.
+
+    Args:
+        events: Series of event codes (looked up stripped; '' when unknown or missing)
+        variables: Series for placeholders 1, 2, 3 (None where the column is absent)
+        plans: {event: plan} from compile_templates
+
+    Returns:
+        Object Series aligned with events
+    """
+    codes, uniques = pd.factorize(events)
+    result = np.full(len(events), '', dtype=object)
+    if len(uniques) == 0:
+        return pd.Series(result, index=events.index, name=events.name)
+
+    # Rows of each event code, without a boolean mask per group
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    columns = {}
+
+    for code, value in enumerate(uniques):
+        plan = plans.get(str(value).strip())
+        if plan is None:
+            continue
+        rows = order[bounds[code]:bounds[code + 1]]
+        if len(plan) == 1 and isinstance(plan[0], str):
+            result[rows] = plan[0]
+            continue
+        rendered = None
+        for part in plan:
+            if not isinstance(part, str):
+                if part >= len(variables) or variables[part] is None:
+                    continue
+                if part not in columns:
+                    columns[part] = _variable_strings(variables[part])
+                part = columns[part][rows]
+            rendered = part if rendered is None else rendered + part
+        result[rows] = '' if rendered is None else rendered
+
+    return pd.Series(result, index=events.index, name=events.name)
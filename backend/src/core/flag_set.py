@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+SAP Flag Set - Compact integer representation of detection flags
+Each distinct trigger label (e.g. 'Security:TCode:SU01') is interned once in a
+TriggerDictionary and referred to by an integer ID. For every flag, rows keep a
+bitset of the trigger slots that fired, and each slot stores (row, trigger ID)
+pairs for the rows it matched, so mostly-empty flags cost a few bytes per row.
+
+Counting, filtering and summaries work on the IDs and bitsets directly;
+pipe-joined strings are rendered only when a flag column is written out, once
+per distinct trigger combination.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Separator between triggers within a rendered flag value
+TRIGGER_SEPARATOR = ' | '
+
+class TriggerDictionary:
+    """Interns trigger labels as integer IDs (append-only, so IDs are stable)."""
+
+    def __init__(self, labels=None):
+        self.labels = []
+        self._ids = {}
+        for label in labels or []:
+            self.add(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, label):
+        """Return the ID for label, interning it if needed."""
+        label_id = self._ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self._ids[label] = label_id
+            self.labels.append(label)
+        return label_id
+
+    def id_of(self, label):
+        """Return the ID for label, or -1 if it has never been seen."""
+        return self._ids.get(label, -1)
+
+    def label(self, label_id):
+        return self.labels[label_id]
+
+    def encode(self, labels):
+        """Map an array of labels to IDs, interning each distinct label once."""
+        codes, uniques = pd.factorize(np.asarray(labels, dtype=object))
+        ids = np.array([self.add(label) for label in uniques], dtype=np.int32)
+        return ids[codes] if len(ids) else np.zeros(len(codes), dtype=np.int32)
+
+    def rendered(self, label_map=None):
+        """Return labels as an object array, optionally passed through label_map."""
+        if label_map is None:
+            return np.array(self.labels, dtype=object)
+        return np.array([label_map(label) for label in self.labels], dtype=object)
+
+def _bits_dtype(slot_count):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if slot_count <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"Flags support at most 64 trigger slots, got {slot_count}")
+
+class FlagSet:
+    """
+    Detection flags for one DataFrame (or chunk) in integer form.
+
+    For each flag:
+        bits   per-row bitset of fired trigger slots (smallest uint that fits)
+        slots  per trigger slot, (rows, ids) arrays of the rows it matched and
+               the TriggerDictionary ID of the label it produced there
+    """
+
+    def __init__(self, row_count, dictionary=None, index=None):
+        self.row_count = row_count
+        self.dictionary = dictionary if dictionary is not None else TriggerDictionary()
+        self.index = index if index is not None else pd.RangeIndex(row_count)
+        self.flags = []
+        self._bits = {}
+        self._slots = {}
+
+    def add_flag(self, name, slots):
+        """
+        Add a flag from its trigger slots.
+
+        Args:
+            name: Flag column name
+            slots: Ordered list of (rows, ids) arrays, one per trigger
+        """
+        bits = np.zeros(self.row_count, dtype=_bits_dtype(max(len(slots), 1)))
+        stored = []
+        for slot, (rows, ids) in enumerate(slots):
+            rows = np.asarray(rows, dtype=np.int64)
+            bits[rows] |= bits.dtype.type(1 << slot)
+            stored.append((rows, np.asarray(ids, dtype=np.int32)))
+        self.flags.append(name)
+        self._bits[name] = bits
+        self._slots[name] = stored
+
+    # --- Filters -----------------------------------------------------------------
+
+    def bits(self, name):
+        """Per-row bitset of the trigger slots that fired for a flag."""
+        return self._bits[name]
+
+    def mask(self, name):
+        """Boolean mask of rows where the flag fired."""
+        return self._bits[name] != 0
+
+    def count(self, name):
+        """Number of rows where the flag fired."""
+        return int(np.count_nonzero(self._bits[name]))
+
+    def rows_with(self, label, name=None):
+        """Boolean mask of rows carrying a trigger label (in one flag or any)."""
+        mask = np.zeros(self.row_count, dtype=bool)
+        label_id = self.dictionary.id_of(label)
+        if label_id < 0:
+            return mask
+        for flag in [name] if name else self.flags:
+            for rows, ids in self._slots[flag]:
+                mask[rows[ids == label_id]] = True
+        return mask
+
+    # --- Aggregations --------------------------------------------------------------
+
+    def trigger_counts(self, name=None):
+        """Return {label: rows} for one flag or all flags, counted on IDs."""
+        totals = np.zeros(len(self.dictionary), dtype=np.int64)
+        for flag in [name] if name else self.flags:
+            for _, ids in self._slots[flag]:
+                totals += np.bincount(ids, minlength=len(self.dictionary))
+        return {self.dictionary.label(i): int(c) for i, c in enumerate(totals) if c}
+
+    def combination_counts(self, name, top=None):
+        """
+        Count distinct trigger combinations for a flag, most common first.
+        Only the returned combinations are rendered to strings.
+        """
+        rows, codes, combos = self._combinations(name)
+        if not len(rows):
+            return []
+        counts = np.bincount(codes)
+        order = np.argsort(-counts, kind='stable')
+        if top is not None:
+            order = order[:top]
+        labels = self.dictionary.rendered()
+        return [(TRIGGER_SEPARATOR.join(labels[combos[i]]), int(counts[i])) for i in order]
+
+    def summary(self):
+        """Per-flag row counts and trigger counts, computed without rendering rows."""
+        return {
+            name: {'rows': self.count(name), 'triggers': self.trigger_counts(name)}
+            for name in self.flags
+        }
+
+    # --- Rendering ------------------------------------------------------------------
+
+    def render(self, name, label_map=None):
+        """
+        Render a flag as pipe-joined trigger labels ('' where it did not fire).
+
+        Args:
+            name: Flag column name
+            label_map: Optional function applied once per distinct trigger label
+                (e.g. to add lookup descriptions)
+        """
+        output = np.full(self.row_count, '', dtype=object)
+        rows, codes, combos = self._combinations(name)
+        if len(rows):
+            labels = self.dictionary.rendered(label_map)
+            rendered = np.array([TRIGGER_SEPARATOR.join(labels[combo]) for combo in combos], dtype=object)
+            output[rows] = rendered[codes]
+        return pd.Series(output, index=self.index, name=name)
+
+    def render_all(self, label_map=None):
+        """Render every flag, returning {name: Series}."""
+        return {name: self.render(name, label_map) for name in self.flags}
+
+    def _combinations(self, name):
+        """
+        Factorize the flagged rows of a flag by their ordered trigger IDs.
+
+        Returns:
+            (rows, codes, combos): flagged row numbers, a combination code per
+            flagged row, and the ordered ID array for each combination
+        """
+        rows = np.flatnonzero(self._bits[name])
+        slots = self._slots[name]
+        if not len(rows):
+            return rows, np.zeros(0, dtype=np.int64), []
+
+        # Dense (flagged rows x slots) ID matrix, -1 where a slot did not fire
+        position = np.full(self.row_count, -1, dtype=np.int64)
+        position[rows] = np.arange(len(rows))
+        matrix = np.full((len(rows), len(slots)), -1, dtype=np.int64)
+        for slot, (slot_rows, ids) in enumerate(slots):
+            matrix[position[slot_rows], slot] = ids
+
+        codes = np.zeros(len(rows), dtype=np.int64)
+        radix = len(self.dictionary) + 1
+        for slot in range(len(slots)):
+            codes, _ = pd.factorize(codes * radix + matrix[:, slot] + 1)
+
+        first_row = np.zeros(codes.max() + 1, dtype=np.int64)
+        first_row[codes[::-1]] = np.arange(len(rows))[::-1]
+        combos = [matrix[i][matrix[i] >= 0] for i in first_row]
+        return rows, codes, combos
+
+    # --- Construction from rendered strings -------------------------------------------
+
+    @classmethod
+    def from_strings(cls, columns, dictionary=None, index=None):
+        """
+        Build a FlagSet from rendered flag columns (e.g. a re-read analyzed CSV).
+        Each distinct cell value is split once; empty or missing cells are unflagged.
+
+        Args:
+            columns: Dict of flag name -> Series of pipe-joined labels
+        """
+        series_list = list(columns.values())
+        if index is None:
+            index = series_list[0].index if series_list else pd.RangeIndex(0)
+        flag_set = cls(len(index), dictionary, index)
+
+        for name, series in columns.items():
+            codes, uniques = pd.factorize(series)
+            split = []
+            for value in uniques:
+                text = value if isinstance(value, str) else ''
+                split.append([flag_set.dictionary.add(part) for part in text.split(TRIGGER_SEPARATOR)] if text else [])
+            width = max((len(parts) for parts in split), default=0)
+            slots = []
+            for slot in range(width):
+                ids_by_code = np.array([parts[slot] if slot < len(parts) else -1 for parts in split] + [-1], dtype=np.int64)
+                slot_ids = ids_by_code[codes]
+                rows = np.flatnonzero(slot_ids >= 0)
+                slots.append((rows, slot_ids[rows]))
+            flag_set.add_flag(name, slots)
+        return flag_set
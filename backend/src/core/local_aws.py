@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+SAP Local AWS - Filesystem S3 and SQLite DynamoDB stand-ins
+Implements the parts of the boto3 S3 client and DynamoDB table API that the
+handlers and the core stores use, so the Lambda handler logic runs unchanged
+on one machine (see core/local_server.py).
+
+    LocalS3Client(root, base_url)   objects are files under root/<bucket>/<key>;
+                                    presigned URLs point at base_url/s3/...,
+                                    which the local server serves
+    LocalDynamoResource(database)   Table(name).put_item / get_item on a
+                                    SQLite file, one JSON document per key
+
+Both are safe to use from several threads and processes at once: objects are
+written to a temporary file and renamed into place, and SQLite runs in WAL
+mode with a busy timeout.
+
+Usage:
+    s3 = LocalS3Client('.local/s3', 'http://localhost:3001')
+    s3.put_object(Bucket='bkt', Key='a/b.json', Body=b'{}')
+    table = LocalDynamoResource('.local/analyses.db').Table('sapanalyzer4-analyses')
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import uuid
+from urllib.parse import quote, urlencode
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+MULTIPART_DIR = '.multipart'
+
+# Keys returned per list_objects_v2 / list_parts page
+PAGE_SIZE = 1000
+
+COPY_BUFFER_BYTES = 1024 * 1024
+
+# Seconds a SQLite writer waits for a lock held by another process
+SQLITE_TIMEOUT = 30
+
+# ================================================================================
+# S3
+# ================================================================================
+
+class NoSuchKey(Exception):
+    """The object does not exist (mirrors botocore's client.exceptions.NoSuchKey)."""
+
+
+class NoSuchUpload(Exception):
+    """The multipart upload does not exist."""
+
+
+class _Exceptions:
+    NoSuchKey = NoSuchKey
+    NoSuchUpload = NoSuchUpload
+
+
+def _etag(md5):
+    return f'"{md5.hexdigest()}"'
+
+
+def write_stream(path, stream, length=None):
+    """Copy length bytes (or all) of stream to path atomically; returns the ETag."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    md5 = hashlib.md5()
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            remaining = length
+            while remaining is None or remaining > 0:
+                block = stream.read(COPY_BUFFER_BYTES if remaining is None else min(COPY_BUFFER_BYTES, remaining))
+                if not block:
+                    break
+                md5.update(block)
+                out.write(block)
+                if remaining is not None:
+                    remaining -= len(block)
+        if remaining:
+            raise IOError(f"Stream ended {remaining} bytes early")
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return _etag(md5)
+
+
+class _Paginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        marker = None
+        while True:
+            page, marker = self.method(marker=marker, **kwargs)
+            yield page
+            if marker is None:
+                return
+
+
+class LocalS3Client:
+    """The subset of the boto3 S3 client used by the handlers, on the filesystem."""
+
+    exceptions = _Exceptions
+
+    def __init__(self, root, base_url='http://localhost:3001'):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        os.makedirs(self.root, exist_ok=True)
+
+    # --- Paths ------------------------------------------------------------------------
+
+    def object_path(self, bucket, key):
+        """File holding bucket/key; rejects keys that would leave the bucket."""
+        bucket_dir = os.path.join(self.root, bucket)
+        path = os.path.normpath(os.path.join(bucket_dir, *key.split('/')))
+        if bucket.startswith('.') or '/' in bucket or not path.startswith(bucket_dir + os.sep):
+            raise ValueError(f"Invalid bucket or key: {bucket}/{key}")
+        return path
+
+    def _upload_dir(self, upload_id):
+        if not upload_id or not all(c.isalnum() or c == '-' for c in upload_id):
+            raise NoSuchUpload(upload_id)
+        return os.path.join(self.root, MULTIPART_DIR, upload_id)
+
+    # --- Objects ----------------------------------------------------------------------
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        stream = io.BytesIO(Body.encode() if isinstance(Body, str) else Body) if isinstance(Body, (bytes, str)) else Body
+        return {'ETag': write_stream(self.object_path(Bucket, Key), stream)}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self.object_path(Bucket, Key)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            raise NoSuchKey(f"{Bucket}/{Key}")
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            write_stream(self.object_path(Bucket, Key), f)
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        path = self.object_path(Bucket, Key)
+        if not os.path.exists(path):
+            raise NoSuchKey(f"{Bucket}/{Key}")
+        shutil.copyfile(path, Filename)
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        bucket_dir = os.path.join(self.root, Bucket)
+        for obj in Delete.get('Objects', []):
+            path = self.object_path(Bucket, obj['Key'])
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            # S3 has no empty prefixes: remove directories the delete emptied
+            directory = os.path.dirname(path)
+            while directory != bucket_dir:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+            deleted.append({'Key': obj['Key']})
+        return {'Deleted': deleted}
+
+    def _list_objects(self, marker=None, Bucket=None, Prefix='', **kwargs):
+        bucket_dir = os.path.join(self.root, Bucket)
+        keys = []
+        for directory, _, names in os.walk(bucket_dir):
+            for name in names:
+                if name.startswith('.tmp-'):
+                    continue
+                key = os.path.relpath(os.path.join(directory, name), bucket_dir).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+        start = int(marker or 0)
+        page = keys[start:start + PAGE_SIZE]
+        contents = [{'Key': key, 'Size': os.path.getsize(self.object_path(Bucket, key))} for key in page]
+        more = start + PAGE_SIZE < len(keys)
+        return {'Contents': contents, 'KeyCount': len(contents)} if contents else {'KeyCount': 0}, \
+            (start + PAGE_SIZE if more else None)
+
+    # --- Multipart uploads ------------------------------------------------------------
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.object_path(Bucket, Key)  # validate before accepting parts
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, 'upload.json'), 'w') as f:
+            json.dump({'Bucket': Bucket, 'Key': Key}, f)
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _upload(self, upload_id, bucket, key):
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            with open(os.path.join(upload_dir, 'upload.json')) as f:
+                upload = json.load(f)
+        except FileNotFoundError:
+            raise NoSuchUpload(upload_id)
+        if (upload['Bucket'], upload['Key']) != (bucket, key):
+            raise NoSuchUpload(upload_id)
+        return upload_dir
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentLength=None, **kwargs):
+        """Store one part; Body may be bytes or a stream of ContentLength bytes."""
+        upload_dir = self._upload(UploadId, Bucket, Key)
+        stream = io.BytesIO(Body) if isinstance(Body, bytes) else Body
+        etag = write_stream(os.path.join(upload_dir, f'{int(PartNumber):05d}.part'), stream, ContentLength)
+        with open(os.path.join(upload_dir, f'{int(PartNumber):05d}.etag'), 'w') as f:
+            f.write(etag)
+        return {'ETag': etag}
+
+    def _parts(self, upload_dir):
+        parts = []
+        for name in sorted(os.listdir(upload_dir)):
+            if name.endswith('.part'):
+                number = int(name[:-len('.part')])
+                with open(os.path.join(upload_dir, f'{number:05d}.etag')) as f:
+                    etag = f.read()
+                parts.append({'PartNumber': number, 'ETag': etag,
+                              'Size': os.path.getsize(os.path.join(upload_dir, name))})
+        return parts
+
+    def _list_parts(self, marker=None, Bucket=None, Key=None, UploadId=None, **kwargs):
+        parts = self._parts(self._upload(UploadId, Bucket, Key))
+        start = int(marker or 0)
+        return {'Parts': parts[start:start + PAGE_SIZE]}, (start + PAGE_SIZE if start + PAGE_SIZE < len(parts) else None)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload_dir = self._upload(UploadId, Bucket, Key)
+        stored = {part['PartNumber']: part['ETag'] for part in self._parts(upload_dir)}
+        for part in MultipartUpload['Parts']:
+            if stored.get(int(part['PartNumber'])) != part['ETag']:
+                raise ValueError(f"Part {part['PartNumber']} is missing or its ETag does not match")
+
+        readers = [open(os.path.join(upload_dir, f"{int(part['PartNumber']):05d}.part"), 'rb')
+                   for part in MultipartUpload['Parts']]
+        try:
+            etag = write_stream(self.object_path(Bucket, Key), _Concatenated(readers))
+        finally:
+            for reader in readers:
+                reader.close()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        shutil.rmtree(self._upload(UploadId, Bucket, Key), ignore_errors=True)
+        return {}
+
+    # --- Pagination and presigning ----------------------------------------------------
+
+    def get_paginator(self, operation):
+        methods = {'list_objects_v2': self._list_objects, 'list_parts': self._list_parts}
+        if operation not in methods:
+            raise NotImplementedError(f"LocalS3Client has no paginator for {operation}")
+        return _Paginator(methods[operation])
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        """URL of the local server route for a put_object, upload_part or get_object call."""
+        if ClientMethod not in ('put_object', 'upload_part', 'get_object'):
+            raise NotImplementedError(f"LocalS3Client cannot presign {ClientMethod}")
+        url = f"{self.base_url}/s3/{quote(Params['Bucket'])}/{quote(Params['Key'])}"
+        if ClientMethod == 'upload_part':
+            url += '?' + urlencode({'uploadId': Params['UploadId'], 'partNumber': Params['PartNumber']})
+        return url
+
+
+class _Concatenated:
+    """read() across several binary streams in order."""
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+
+    def read(self, size=-1):
+        while self.streams:
+            block = self.streams[0].read(size)
+            if block:
+                return block
+            self.streams.pop(0)
+        return b''
+
+# ================================================================================
+# DYNAMODB
+# ================================================================================
+
+class LocalTable:
+    """put_item / get_item of one table, stored as JSON documents in SQLite."""
+
+    def __init__(self, database, name, key='analysisId'):
+        self.database = database
+        self.name = name
+        self.key = key
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS items (tbl TEXT, pk TEXT, item TEXT, PRIMARY KEY (tbl, pk))')
+
+    def _connect(self):
+        connection = sqlite3.connect(self.database, timeout=SQLITE_TIMEOUT)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def put_item(self, Item, **kwargs):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO items VALUES (?, ?, ?)',
+                                   (self.name, str(Item[self.key]), json.dumps(Item, default=str)))
+        finally:
+            connection.close()
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT item FROM items WHERE tbl = ? AND pk = ?',
+                                     (self.name, str(Key[self.key]))).fetchone()
+        finally:
+            connection.close()
+        return {'Item': json.loads(row[0])} if row else {}
+
+    def scan(self, **kwargs):
+        connection = self._connect()
+        try:
+            rows = connection.execute('SELECT item FROM items WHERE tbl = ?', (self.name,)).fetchall()
+        finally:
+            connection.close()
+        return {'Items': [json.loads(row[0]) for row in rows], 'Count': len(rows)}
+
+
+class LocalDynamoResource:
+    """boto3.resource('dynamodb') stand-in: Table(name) on one SQLite file."""
+
+    def __init__(self, database):
+        self.database = os.path.abspath(database)
+        os.makedirs(os.path.dirname(self.database), exist_ok=True)
+
+    def Table(self, name):
+        return LocalTable(self.database, name)
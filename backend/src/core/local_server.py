@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+SAP Local API Server - The upload, analyze and results API on one machine
+Serves the endpoints of the deployed API with the Lambda handlers themselves
+(handlers/upload.py, analyze.py, get_results.py), backed by the local
+stand-ins of core/local_aws.py instead of AWS:
+
+    POST /upload                 handlers/upload.py (presign and multipart actions)
+    PUT  /s3/<bucket>/<key>      target of the presigned upload and part URLs
+    GET  /s3/<bucket>/<key>      target of the presigned download URLs
+    POST /analyze                queues the analysis and answers 202 at once
+    GET  /results/<analysisId>   handlers/get_results.py
+    GET  /health                 worker pool and queue counts
+
+Objects are files under <data dir>/s3 and the analyses table is
+<data dir>/analyses.db (SQLite). Analyses run in a pool of worker processes
+that load the lookups and compile the rules once; the frontend's polling of
+/results sees them go queued -> processing -> completed (or failed). At most
+MAX_QUEUED_ANALYSES wait for a worker, further requests get 503 with
+Retry-After. Uploads and downloads are served by request threads, so many
+clients can upload while analyses run.
+
+Run from backend/src (lookup files are read from data/). The frontend uses it
+unchanged: its API_BASE_URL defaults to http://localhost:3001.
+
+Usage:
+    python -m core.local_server [--port 3001] [--host 127.0.0.1] [--workers N] [--data-dir .local]
+"""
+
+import json
+import mimetypes
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from core.local_aws import LocalDynamoResource, LocalS3Client, NoSuchUpload
+from core.memory_governor import MEMORY_BUDGET_ENV, default_budget_bytes
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+DEFAULT_PORT = 3001
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_DATA_DIR = '.local'
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+# Analyses waiting for a worker before /analyze answers 503
+MAX_QUEUED_ANALYSES = 100
+RETRY_AFTER_SECONDS = 5
+
+ANALYSIS_TABLE = os.environ.get('ANALYSIS_TABLE', 'sapanalyzer4-analyses')
+
+DOWNLOAD_BUFFER_BYTES = 1024 * 1024
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+    'Access-Control-Expose-Headers': 'ETag',
+}
+
+RESULTS_PATH = re.compile(r'^/results/([^/]+)$')
+
+# ================================================================================
+# HANDLER WIRING
+# ================================================================================
+
+def local_services(data_dir, base_url):
+    """(S3 client, DynamoDB resource) stand-ins rooted at data_dir."""
+    return (LocalS3Client(os.path.join(data_dir, 's3'), base_url),
+            LocalDynamoResource(os.path.join(data_dir, 'analyses.db')))
+
+
+def bind_handlers(s3, dynamodb, analyze=False):
+    """Point the handler modules at the local stand-ins; returns the modules."""
+    # The handlers create boto3 clients at import; they need a region, not credentials
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    from handlers import get_results, upload
+    upload.s3 = s3
+    get_results.s3 = s3
+    get_results.dynamodb = dynamodb
+    modules = {'upload': upload, 'get_results': get_results}
+    if analyze:
+        from handlers import analyze as analyze_module  # warms lookups and rules at import
+        analyze_module.get_client = lambda service: s3
+        analyze_module.get_resource = lambda service: dynamodb
+        modules['analyze'] = analyze_module
+    return modules
+
+# ================================================================================
+# WORKER PROCESSES
+# ================================================================================
+
+_worker_modules = None
+_worker_table = None
+
+
+def _init_worker(data_dir, base_url, budget_mb):
+    """Bind the analyze handler to the local stand-ins once per worker process."""
+    global _worker_modules, _worker_table
+    # The server decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Each worker gets an equal share of the memory budget for its chunks
+    os.environ[MEMORY_BUDGET_ENV] = str(int(budget_mb))
+    s3, dynamodb = local_services(data_dir, base_url)
+    _worker_modules = bind_handlers(s3, dynamodb, analyze=True)
+    _worker_table = dynamodb.Table(ANALYSIS_TABLE)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def run_analysis(event, queued_item):
+    """Mark the analysis processing and run the analyze handler (a worker job); returns its status code."""
+    _worker_table.put_item(Item=dict(queued_item, status='processing',
+                                     startedAt=datetime.utcnow().isoformat()))
+    response = _worker_modules['analyze'].lambda_handler(event, None)
+    sys.stdout.flush()
+    return response['statusCode']
+
+
+class AnalysisQueue:
+    """Bounded queue of analyses in front of the worker pool."""
+
+    def __init__(self, data_dir, base_url, workers, table):
+        self.data_dir = data_dir
+        self.base_url = base_url
+        self.workers = workers
+        self.budget_mb = default_budget_bytes() / 2**20 / workers
+        self.table = table
+        self.lock = threading.Lock()
+        self.pending = {}   # analysisId -> future
+        self.counts = {'completed': 0, 'failed': 0}
+        self.pool = self._new_pool()
+
+    def _new_pool(self):
+        # Workers are started from a clean process, not forked from the request threads
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(self.data_dir, self.base_url, self.budget_mb))
+        # The pool starts a worker per submit while none is idle: start them all now,
+        # so the first analyses do not wait for lookups to load
+        self.warming = [pool.submit(_worker_ready) for _ in range(self.workers)]
+        return pool
+
+    def wait_ready(self):
+        """Block until every worker has started and loaded its lookups."""
+        wait(self.warming)
+
+    def submit(self, event):
+        """Record the analysis as queued and hand it to the pool; False when the queue is full."""
+        analysis_id = event['analysisId']
+        with self.lock:
+            if analysis_id in self.pending:
+                return True
+            if len(self.pending) >= self.workers + MAX_QUEUED_ANALYSES:
+                return False
+            item = {'analysisId': analysis_id, 'timestamp': datetime.utcnow().isoformat(),
+                    'fileType': event.get('fileType', 'SM20'), 'inputKey': event['key'], 'status': 'queued'}
+            self.table.put_item(Item=item)
+            try:
+                future = self.pool.submit(run_analysis, event, item)
+            except BrokenProcessPool:
+                self.pool = self._new_pool()
+                future = self.pool.submit(run_analysis, event, item)
+            self.pending[analysis_id] = future
+        future.add_done_callback(lambda done: self._finished(analysis_id, item, done))
+        return True
+
+    def _finished(self, analysis_id, item, future):
+        try:
+            status_code = future.result()
+        except Exception as e:
+            # The worker died (e.g. killed for memory): the handler could not record the failure
+            print(f"Warning: analysis {analysis_id} failed in its worker: {e}")
+            self.table.put_item(Item=dict(item, status='failed', error=f"Worker failed: {e}", resumable=True,
+                                          timestamp=datetime.utcnow().isoformat()))
+            status_code = 500
+            if isinstance(e, BrokenProcessPool):
+                with self.lock:
+                    if self.pool._broken:
+                        self.pool.shutdown(wait=False)
+                        self.pool = self._new_pool()
+        with self.lock:
+            self.pending.pop(analysis_id, None)
+            self.counts['completed' if status_code == 200 else 'failed'] += 1
+
+    def status(self):
+        with self.lock:
+            running = sum(1 for future in self.pending.values() if future.running())
+            return {'workers': self.workers, 'running': running, 'queued': len(self.pending) - running,
+                    'completed': self.counts['completed'], 'failed': self.counts['failed']}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+# ================================================================================
+# HTTP SERVER
+# ================================================================================
+
+class LocalApiHandler(BaseHTTPRequestHandler):
+    """Routes requests to the handlers; the server carries s3, modules and queue."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status_code, body=b'', headers=None):
+        self.send_response(status_code)
+        for name, value in dict(CORS_HEADERS, **(headers or {})).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, status_code, body, headers=None):
+        self._send(status_code, json.dumps(body, default=str).encode(),
+                   dict({'Content-Type': 'application/json'}, **(headers or {})))
+
+    def _send_lambda(self, response):
+        headers = dict(response.get('headers') or {}, **{'Content-Type': 'application/json'})
+        self._send(response['statusCode'], response.get('body', '').encode(), headers)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length).decode('utf-8') if length else '{}'
+
+    def _object(self, path):
+        """(bucket, key) of an /s3/<bucket>/<key> path."""
+        bucket, _, key = unquote(path[len('/s3/'):]).partition('/')
+        return bucket, key
+
+    # --- Methods ----------------------------------------------------------------------
+
+    def do_OPTIONS(self):
+        self._send(204)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path.rstrip('/')
+        try:
+            if path == '/upload':
+                self._send_lambda(self.server.modules['upload'].lambda_handler({'body': self._read_body()}, None))
+            elif path == '/analyze':
+                self._analyze(json.loads(self._read_body()))
+            else:
+                self._send_json(404, {'error': f"No route for POST {path}"})
+        except json.JSONDecodeError as e:
+            self._send_json(400, {'error': f"Invalid JSON body: {e}"})
+
+    def _analyze(self, event):
+        missing = [field for field in ('bucket', 'key', 'analysisId') if not event.get(field)]
+        if missing:
+            self._send_json(400, {'error': f"Missing fields: {', '.join(missing)}"})
+        elif not os.path.exists(self.server.s3.object_path(event['bucket'], event['key'])):
+            self._send_json(404, {'error': f"No uploaded file at {event['bucket']}/{event['key']}"})
+        elif not self.server.queue.submit(event):
+            self._send_json(503, {'error': 'Analysis queue is full'}, {'Retry-After': str(RETRY_AFTER_SECONDS)})
+        else:
+            self._send_json(202, {'analysisId': event['analysisId'], 'status': 'queued',
+                                  'statusUrl': f"/results/{event['analysisId']}"})
+
+    def do_PUT(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith('/s3/'):
+            self._send_json(404, {'error': f"No route for PUT {url.path}"})
+            return
+        if 'Content-Length' not in self.headers:
+            self._send_json(411, {'error': 'Content-Length required'})
+            return
+        bucket, key = self._object(url.path)
+        query = parse_qs(url.query)
+        length = int(self.headers['Content-Length'])
+        try:
+            if 'uploadId' in query:
+                response = self.server.s3.upload_part(Bucket=bucket, Key=key, UploadId=query['uploadId'][0],
+                                                      PartNumber=int(query['partNumber'][0]),
+                                                      Body=self.rfile, ContentLength=length)
+            else:
+                response = self.server.s3.put_object(Bucket=bucket, Key=key, Body=_Limited(self.rfile, length))
+        except NoSuchUpload:
+            self._send_json(404, {'error': 'No such upload'})
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': str(e)})
+        else:
+            self._send(200, headers={'ETag': response['ETag']})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip('/')
+        match = RESULTS_PATH.match(path)
+        if match:
+            event = {'pathParameters': {'analysisId': unquote(match.group(1))}}
+            self._send_lambda(self.server.modules['get_results'].lambda_handler(event, None))
+        elif path.startswith('/s3/'):
+            self._download(*self._object(path))
+        elif path == '/health':
+            self._send_json(200, self.server.queue.status())
+        else:
+            self._send_json(404, {'error': f"No route for GET {path}"})
+
+    do_HEAD = do_GET
+
+    def _download(self, bucket, key):
+        try:
+            path = self.server.s3.object_path(bucket, key)
+            size = os.path.getsize(path)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except OSError:
+            self._send_json(404, {'error': 'NoSuchKey'})
+            return
+        self.send_response(200)
+        for name, value in CORS_HEADERS.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', mimetypes.guess_type(key)[0] or 'application/octet-stream')
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(key)}"')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(DOWNLOAD_BUFFER_BYTES)
+                if not block:
+                    break
+                self.wfile.write(block)
+
+
+class _Limited:
+    """read() of at most length bytes of a stream (the request body)."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        block = self.stream.read(self.remaining if size < 0 else min(size, self.remaining))
+        self.remaining -= len(block)
+        return block
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, data_dir=DEFAULT_DATA_DIR, workers=DEFAULT_WORKERS,
+                  verbose=False):
+    """HTTP server with the handlers bound and the analysis pool started (not yet serving)."""
+    server = ThreadingHTTPServer((host, port), LocalApiHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    base_url = f"http://{'localhost' if host in ('127.0.0.1', '0.0.0.0', '') else host}:{server.server_address[1]}"
+    data_dir = os.path.abspath(data_dir)
+    server.s3, dynamodb = local_services(data_dir, base_url)
+    server.modules = bind_handlers(server.s3, dynamodb)
+    server.queue = AnalysisQueue(data_dir, base_url, workers, dynamodb.Table(ANALYSIS_TABLE))
+    server.queue.wait_ready()
+    server.base_url = base_url
+    return server
+
+
+def main():
+    """Command line interface."""
+    args = sys.argv[1:]
+    if '--help' in args or '-h' in args:
+        print("Usage: python -m core.local_server [--port 3001] [--host 127.0.0.1] [--workers N] "
+              "[--data-dir .local] [--verbose]")
+        return
+
+    options = {'--port': str(DEFAULT_PORT), '--host': DEFAULT_HOST, '--workers': str(DEFAULT_WORKERS),
+               '--data-dir': DEFAULT_DATA_DIR}
+    verbose = False
+    while args:
+        argument = args.pop(0)
+        if argument in options and args:
+            options[argument] = args.pop(0)
+        elif argument == '--verbose':
+            verbose = True
+        else:
+            print(f"Warning: ignoring unknown argument {argument}")
+
+    server = create_server(options['--host'], int(options['--port']), options['--data-dir'],
+                           max(1, int(options['--workers'])), verbose)
+    # serve_forever() returns once another thread calls shutdown()
+    stop = lambda signum, frame: threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Local API on {server.base_url} ({server.queue.workers} analysis workers, "
+          f"data in {os.path.abspath(options['--data-dir'])})")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    finally:
+        print("Stopping: waiting for running analyses")
+        server.queue.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+SAP Memory Governor - Chunk sizing under a fixed RAM budget
+How many rows fit in memory depends on row width, the number of text columns
+and how long the flag strings get, none of which is known before reading the
+file. The governor measures bytes per row on the first (probe) chunk - from
+the RSS growth across cleaning, detection and enrichment, and from the deep
+size of the enriched chunk - and sizes later chunks so peak RSS stays under
+the budget.
+
+While a chunk is processed, the pipeline calls check() between steps. When RSS
+passes the pressure threshold, check() raises MemoryPressure; the pipeline
+drops the chunk's intermediates, splits the chunk and retries the halves,
+and later chunks are sized from the raised bytes-per-row estimate.
+
+The budget comes from, in order: the budget_mb argument, $SAP_ANALYZER_MEMORY_MB,
+the Lambda function's memory size, or half of physical memory.
+
+Usage:
+    governor = MemoryGovernor()
+    rows = governor.next_chunk_rows()
+    governor.start_chunk()
+    ... governor.check('clean') ...
+    governor.finish_chunk(rows, df)
+"""
+
+import os
+
+from core.profiling import current_rss_bytes, get_profiler
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+# Environment variable with the RAM budget in MB
+MEMORY_BUDGET_ENV = 'SAP_ANALYZER_MEMORY_MB'
+
+# Set by Lambda to the function's configured memory
+LAMBDA_MEMORY_ENV = 'AWS_LAMBDA_FUNCTION_MEMORY_SIZE'
+
+# Chunks are sized to peak at this fraction of the budget
+TARGET_FRACTION = 0.75
+
+# RSS above this fraction of the budget aborts the chunk for a smaller retry
+PRESSURE_FRACTION = 0.9
+
+# Rows read before anything is known about the file
+PROBE_CHUNK_ROWS = 20000
+
+MIN_CHUNK_ROWS = 1000
+MAX_CHUNK_ROWS = 1000000
+
+
+class MemoryPressure(Exception):
+    """RSS approached the budget while a chunk was being processed."""
+
+# ================================================================================
+# GOVERNOR
+# ================================================================================
+
+def default_budget_bytes():
+    """RAM budget from the environment, Lambda's memory size, or half of physical memory."""
+    for env in (MEMORY_BUDGET_ENV, LAMBDA_MEMORY_ENV):
+        value = os.environ.get(env)
+        if value:
+            return int(float(value) * 2**20)
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (ValueError, OSError, AttributeError):
+        return 2 * 2**30
+
+
+class MemoryGovernor:
+    """Sizes chunks from measured bytes per row so peak RSS stays under budget."""
+
+    def __init__(self, budget_mb=None, initial_rows=PROBE_CHUNK_ROWS,
+                 min_rows=MIN_CHUNK_ROWS, max_rows=MAX_CHUNK_ROWS):
+        self.budget_bytes = int(budget_mb * 2**20) if budget_mb else default_budget_bytes()
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.chunk_rows = max(min_rows, min(initial_rows, max_rows))
+        self.bytes_per_row = None
+        self.baseline_bytes = 0
+        self.peak_bytes = 0
+        self.retries = 0
+
+    @property
+    def pressure_bytes(self):
+        return self.budget_bytes * PRESSURE_FRACTION
+
+    def next_chunk_rows(self):
+        """Rows to read for the next chunk."""
+        return self.chunk_rows
+
+    def start_chunk(self):
+        """Record RSS before a chunk is read."""
+        self.baseline_bytes = current_rss_bytes()
+        self.peak_bytes = self.baseline_bytes
+
+    def check(self, step=''):
+        """Sample RSS between pipeline steps; raise MemoryPressure near the budget."""
+        rss = current_rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, rss)
+        if rss > self.pressure_bytes:
+            raise MemoryPressure(f"RSS {rss / 2**20:.0f} MB after {step or 'step'} exceeds "
+                                 f"{PRESSURE_FRACTION:.0%} of the {self.budget_bytes / 2**20:.0f} MB budget")
+
+    def finish_chunk(self, rows, df=None):
+        """
+        Update bytes per row from a processed chunk and size the next one.
+        The deep size of the enriched chunk is only taken for the probe chunk,
+        where RSS growth alone can under-count memory the allocator reused.
+        """
+        self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+        if not rows:
+            return self.chunk_rows
+        measured = (self.peak_bytes - self.baseline_bytes) / rows
+        if self.bytes_per_row is None and df is not None:
+            measured = max(measured, df.memory_usage(index=True, deep=True).sum() / rows)
+        # Only ever grow the estimate quickly; shrink it slowly
+        if self.bytes_per_row is None or measured > self.bytes_per_row:
+            self.bytes_per_row = measured
+        else:
+            self.bytes_per_row = 0.8 * self.bytes_per_row + 0.2 * measured
+        self._resize()
+        return self.chunk_rows
+
+    def shrink(self, rows):
+        """After MemoryPressure on a chunk of `rows`, halve the chunk size."""
+        self.retries += 1
+        self.chunk_rows = max(self.min_rows, rows // 2)
+        if self.bytes_per_row:
+            # The estimate was too low for this chunk
+            self.bytes_per_row *= 2
+        get_profiler().count('memory.chunk_retries', self.retries)
+        return self.chunk_rows
+
+    def _resize(self):
+        # RSS before the chunk is the steady state the next chunk starts from
+        headroom = self.budget_bytes * TARGET_FRACTION - self.baseline_bytes
+        if self.bytes_per_row and headroom > 0:
+            rows = int(headroom / max(self.bytes_per_row, 1))
+        else:
+            rows = self.min_rows
+        self.chunk_rows = max(self.min_rows, min(rows, self.max_rows))
+        profiler = get_profiler()
+        profiler.count('memory.budget_mb', round(self.budget_bytes / 2**20))
+        profiler.count('memory.bytes_per_row', round(self.bytes_per_row or 0))
+        profiler.count('memory.chunk_rows', self.chunk_rows)
+
+
+class FixedChunks:
+    """Fixed chunk size with the MemoryGovernor interface (no memory checks)."""
+
+    def __init__(self, chunk_rows):
+        self.chunk_rows = chunk_rows
+        self.min_rows = chunk_rows
+
+    def next_chunk_rows(self):
+        return self.chunk_rows
+
+    def start_chunk(self):
+        pass
+
+    def check(self, step=''):
+        pass
+
+    def finish_chunk(self, rows, df=None):
+        return self.chunk_rows
+
+    def shrink(self, rows):
+        raise MemoryPressure("Fixed chunk sizes cannot shrink")
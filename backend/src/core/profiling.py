@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+SAP Pipeline Profiler - Per-stage timing and resource instrumentation
+Records wall time, CPU time, rows/sec, RSS and bytes read/written for each
+pipeline stage (cleaning, each detector, enrichment, S3 transfers) and emits
+a structured JSON report. A stage's peak RSS is the highest current RSS
+sampled while it ran (every RSS_SAMPLE_INTERVAL seconds), not the process
+high-water mark, which goes stale after the first peak and in warm containers.
+
+Stages are recorded against the active profiler; when no run is active the
+instrumentation is a no-op, so the CLI tools pay nothing for it.
+
+Profiling mode is chosen with SAP_ANALYZER_PROFILE:
+    (unset) / off   timings and resource counters only
+    cprofile        cProfile each top-level stage; top functions go in the report
+    sample          sample the main thread's stack every
+                    SAP_ANALYZER_PROFILE_INTERVAL seconds (default 0.005)
+
+Usage:
+    with profile_run('analysis-123') as profiler:
+        with profile_stage('clean.read', bytes_read=size) as stage:
+            df = ...
+            stage.rows = len(df)
+    report = profiler.report()
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+PROFILE_MODE_ENV = 'SAP_ANALYZER_PROFILE'
+PROFILE_INTERVAL_ENV = 'SAP_ANALYZER_PROFILE_INTERVAL'
+PROFILE_MODES = ['off', 'cprofile', 'sample']
+
+# Number of functions / stacks kept per stage in the report
+PROFILE_TOP_N = 15
+
+# Seconds between current-RSS samples while a run is active
+RSS_SAMPLE_INTERVAL = 0.01
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# ================================================================================
+# RESOURCE COUNTERS
+# ================================================================================
+
+def current_rss_bytes():
+    """Current resident set size (Linux /proc; falls back to the peak elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes():
+    """Process high-water RSS so far (over the whole process lifetime)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _io_counters():
+    """(bytes read, bytes written) through read/write syscalls, if available."""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+# ================================================================================
+# STAGE RECORDS
+# ================================================================================
+
+class StageRecord:
+    """Measurements for one pipeline stage; rows/bytes may be set by the caller."""
+
+    def __init__(self, name, rows=None, bytes_read=None, bytes_written=None):
+        self.name = name
+        self.rows = rows
+        self.bytes_read = bytes_read
+        self.bytes_written = bytes_written
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rss_start_bytes = 0
+        self.rss_end_bytes = 0
+        self.peak_rss_bytes = 0
+        self.io_read_bytes = None
+        self.io_write_bytes = None
+        self.profile = None
+        self.error = None
+
+    def to_dict(self):
+        record = {
+            'name': self.name,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'rows': self.rows,
+            'rows_per_sec': round(self.rows / self.wall_seconds, 1) if self.rows and self.wall_seconds > 0 else None,
+            'rss_start_mb': round(self.rss_start_bytes / 2**20, 1),
+            'rss_end_mb': round(self.rss_end_bytes / 2**20, 1),
+            'peak_rss_mb': round(self.peak_rss_bytes / 2**20, 1),
+            'bytes_read': self.bytes_read if self.bytes_read is not None else self.io_read_bytes,
+            'bytes_written': self.bytes_written if self.bytes_written is not None else self.io_write_bytes,
+        }
+        if self.profile is not None:
+            record['profile'] = self.profile
+        if self.error is not None:
+            record['error'] = self.error
+        return record
+
+class _StackSampler:
+    """Background thread that samples a target thread's stack at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        total = sum(self.samples.values())
+        return {
+            'samples': total,
+            'interval_seconds': self.interval,
+            'top_stacks': [
+                {'stack': stack, 'samples': count, 'share': round(count / total, 4)}
+                for stack, count in self.samples.most_common(PROFILE_TOP_N)
+            ],
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < 8:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[' <- '.join(stack)] += 1
+
+class _RssSampler:
+    """Background thread raising the peak RSS of the open stages and of the run."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.open_records = []
+        self.peak_bytes = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        """Current RSS, recorded as a peak candidate for the run and every open stage."""
+        rss = current_rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, rss)
+        for record in list(self.open_records):
+            record.peak_rss_bytes = max(record.peak_rss_bytes, rss)
+        return rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+# ================================================================================
+# PROFILER
+# ================================================================================
+
+class PipelineProfiler:
+    """Collects StageRecords for one pipeline run."""
+
+    def __init__(self, run_name='pipeline', mode=None):
+        mode = (mode or os.environ.get(PROFILE_MODE_ENV) or 'off').lower()
+        if mode not in PROFILE_MODES:
+            print(f"Warning: Unknown {PROFILE_MODE_ENV}={mode}, profiling disabled")
+            mode = 'off'
+        self.run_name = run_name
+        self.mode = mode
+        self.interval = float(os.environ.get(PROFILE_INTERVAL_ENV, '0.005'))
+        self.stages = []
+        self.counters = {}
+        self.started_at = datetime.utcnow().isoformat()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._depth = 0
+        self._rss = _RssSampler(RSS_SAMPLE_INTERVAL)
+        self._rss.start()
+
+    def close(self):
+        """Stop sampling RSS (the recorded stages and report stay available)."""
+        self._rss.stop()
+
+    @contextmanager
+    def stage(self, name, rows=None, bytes_read=None, bytes_written=None):
+        """Measure the enclosed block as a pipeline stage."""
+        record = StageRecord(name, rows, bytes_read, bytes_written)
+        capture = self._depth == 0 and self.mode != 'off'
+        profiler = sampler = None
+        if capture and self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+        elif capture and self.mode == 'sample':
+            sampler = _StackSampler(threading.get_ident(), self.interval)
+
+        io_start = _io_counters()
+        record.rss_start_bytes = record.peak_rss_bytes = self._rss.sample()
+        self._rss.open_records.append(record)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        self._depth += 1
+        if profiler is not None:
+            profiler.enable()
+        if sampler is not None:
+            sampler.start()
+        try:
+            yield record
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                record.profile = _summarize_cprofile(profiler)
+            if sampler is not None:
+                record.profile = sampler.stop()
+            self._depth -= 1
+            record.wall_seconds = time.perf_counter() - start_wall
+            record.cpu_seconds = time.process_time() - start_cpu
+            record.rss_end_bytes = self._rss.sample()
+            self._rss.open_records.remove(record)
+            io_end = _io_counters()
+            if io_start and io_end:
+                record.io_read_bytes = io_end[0] - io_start[0]
+                record.io_write_bytes = io_end[1] - io_start[1]
+            self.stages.append(record)
+
+    def count(self, name, value):
+        """Record a run-level counter (e.g. candidate ratio)."""
+        self.counters[name] = value
+
+    def report(self):
+        """Return the run report as a JSON-serializable dict."""
+        return {
+            'run': self.run_name,
+            'started_at': self.started_at,
+            'profile_mode': self.mode,
+            'wall_seconds': round(time.perf_counter() - self._start_wall, 6),
+            'cpu_seconds': round(time.process_time() - self._start_cpu, 6),
+            'peak_rss_mb': round(self._rss.peak_bytes / 2**20, 1),
+            'process_peak_rss_mb': round(peak_rss_bytes() / 2**20, 1),
+            'counters': self.counters,
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+
+    def summary(self):
+        """
+        Report with the stages aggregated by name (count, totals, maxima) and
+        no per-stage profiles, so its size does not grow with the chunk count.
+        """
+        report = self.report()
+        aggregated = {}
+        for stage in self.stages:
+            entry = aggregated.setdefault(stage.name, {
+                'name': stage.name, 'count': 0, 'wall_seconds': 0.0, 'max_wall_seconds': 0.0,
+                'cpu_seconds': 0.0, 'rows': None, 'peak_rss_mb': 0.0, 'bytes_read': None,
+                'bytes_written': None, 'errors': 0,
+            })
+            record = stage.to_dict()
+            entry['count'] += 1
+            entry['wall_seconds'] += stage.wall_seconds
+            entry['max_wall_seconds'] = max(entry['max_wall_seconds'], stage.wall_seconds)
+            entry['cpu_seconds'] += stage.cpu_seconds
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'], record['peak_rss_mb'])
+            for field in ('rows', 'bytes_read', 'bytes_written'):
+                if record[field] is not None:
+                    entry[field] = (entry[field] or 0) + record[field]
+            if stage.error is not None:
+                entry['errors'] += 1
+        for entry in aggregated.values():
+            entry['rows_per_sec'] = (round(entry['rows'] / entry['wall_seconds'], 1)
+                                     if entry['rows'] and entry['wall_seconds'] > 0 else None)
+            for field in ('wall_seconds', 'max_wall_seconds', 'cpu_seconds'):
+                entry[field] = round(entry[field], 6)
+        report['stages'] = list(aggregated.values())
+        return report
+
+    def write_report(self, report_file):
+        """Write the JSON report to a file and return its path."""
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return report_file
+
+class _NullProfiler:
+    """Stand-in used when no run is active."""
+
+    @contextmanager
+    def stage(self, name, rows=None, bytes_read=None, bytes_written=None):
+        yield StageRecord(name, rows, bytes_read, bytes_written)
+
+    def count(self, name, value):
+        pass
+
+def _summarize_cprofile(profiler):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    top = []
+    for (filename, line, func), (_, calls, tottime, cumtime, _) in sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_N]:
+        top.append({
+            'function': f"{os.path.basename(filename)}:{line}({func})",
+            'calls': calls,
+            'tottime': round(tottime, 6),
+            'cumtime': round(cumtime, 6),
+        })
+    return {'top_functions': top}
+
+# ================================================================================
+# ACTIVE PROFILER
+# ================================================================================
+
+_NULL_PROFILER = _NullProfiler()
+_active = threading.local()
+
+def get_profiler():
+    """Return the profiler for the current run, or a no-op profiler."""
+    return getattr(_active, 'profiler', None) or _NULL_PROFILER
+
+def profile_stage(name, rows=None, bytes_read=None, bytes_written=None):
+    """Context manager recording a stage on the active profiler (no-op if none)."""
+    return get_profiler().stage(name, rows, bytes_read, bytes_written)
+
+@contextmanager
+def profile_run(run_name='pipeline', mode=None):
+    """Activate a PipelineProfiler for the enclosed pipeline run."""
+    previous = getattr(_active, 'profiler', None)
+    profiler = PipelineProfiler(run_name, mode)
+    _active.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active.profiler = previous
+        profiler.close()
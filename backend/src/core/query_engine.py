@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+SAP Query Engine - Embedded SQL over analyzed results and lookup tables
+Registers the pipeline outputs - cleaned, analyzed and enriched CSVs, any
+number of months of them, and the partitioned result store - plus the lookup
+tables as SQL views, so auditors can ask ad-hoc questions past Excel's row
+limit.
+
+Views (one per file type and stage; all matching files are unioned by column
+name, with the source file in SOURCE_FILE):
+    sm20_cleaned, sm20_analyzed, sm20_enriched, sm20_store   (same for cdhdr_*, cdpos_*)
+    lookup_events, lookup_tcodes, lookup_fields, lookup_object_classes,
+    lookup_change_indicators, lookup_activities, high_risk_tables,
+    high_risk_tcodes (and lookup_tables when data/tables.csv is present)
+
+Engines:
+    duckdb  (if installed) Views scan the files in place with projection and
+            filter pushdown and vectorized execution; store views read only
+            the hive partitions a WHERE clause on sap_system/year/month/day allows.
+    sqlite  (standard library fallback) Files are loaded once into tables with
+            indexes on the user/tcode/object/date columns. With a database
+            file, loads are cached and only redone when a source file changes.
+
+Columns are text in both engines (CAST for arithmetic). CDHDR and CDPOS
+exports with descriptive headers ('Table Name', 'Object Value') are exposed
+under the technical names (TABNAME, OBJECTID), so one query fits both shapes.
+
+Usage:
+    engine = QueryEngine(database='output/query.db')
+    engine.register_directory('output')
+    engine.register_lookups()
+    df = engine.query("SELECT USER, COUNT(*) FROM sm20_enriched WHERE DEBUG_FLAG <> '' GROUP BY USER")
+
+    python -m core.query_engine [--db FILE] [--engine duckdb|sqlite] [--source PATH ...]
+                                [--out FILE.csv] "<SQL>" | <example name> | --views
+"""
+
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from core.profiling import profile_stage
+from core.result_store import ResultStore, STORE_FILE, FILE_EXTENSIONS, PARTITION_KEYS
+from core.sm20_cleaner import ENCODING_OPTIONS
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+FILE_TYPES = ['SM20', 'CDHDR', 'CDPOS']
+
+# Output stage of a file, from its name
+STAGE_PATTERNS = [
+    ('enriched', re.compile(r'SAP_Analysis_Report_.*_(SM20|CDHDR|CDPOS)\.csv$', re.IGNORECASE)),
+    ('analyzed', re.compile(r'(SM20|CDHDR|CDPOS).*_analyzed\.csv$', re.IGNORECASE)),
+    ('cleaned', re.compile(r'(SM20|CDHDR|CDPOS).*_cleaned\.csv$', re.IGNORECASE)),
+]
+
+# Lookup views: (view name, file under the data directory)
+LOOKUP_VIEWS = [
+    ('lookup_events', 'events.csv'),
+    ('lookup_tcodes', 'tcodes.csv'),
+    ('lookup_fields', 'fields.csv'),
+    ('lookup_object_classes', 'object class.csv'),
+    ('lookup_change_indicators', 'change indicators.csv'),
+    ('lookup_activities', 'ACTVT.csv'),
+    ('high_risk_tables', 'high_risk_tables.csv'),
+    ('high_risk_tcodes', 'high_risk_tcodes.csv'),
+    ('lookup_tables', 'tables.csv'),
+]
+
+# SQLite indexes are created on these columns where a table has them
+INDEX_COLUMNS = ['USER', 'USERNAME', 'TCODE', 'SOURCE_TA', 'TRANSACTION_CODE', 'EVENT', 'SYSTEM',
+                 'OBJECTCLAS', 'OBJECTID', 'CHANGENR', 'TABNAME', 'DATE', 'UDATE'] + PARTITION_KEYS
+
+# Descriptive export headers -> technical names in the CDHDR/CDPOS views
+COLUMN_ALIASES = {
+    'CDHDR': {'OBJECT': 'OBJECTCLAS', 'OBJECT VALUE': 'OBJECTID', 'USER': 'USERNAME', 'DATE': 'UDATE',
+              'TIME': 'UTIME', 'CHANGE IND': 'CHANGE_IND'},
+    'CDPOS': {'OBJECT': 'OBJECTCLAS', 'OBJECT VALUE': 'OBJECTID', 'TABLE NAME': 'TABNAME', 'FIELD NAME': 'FNAME',
+              'CHANGE INDICATOR': 'CHNGIND', 'NEW VALUE': 'VALUE_NEW', 'OLD VALUE': 'VALUE_OLD'},
+}
+
+# Rows inserted per batch when loading a CSV into SQLite
+SQLITE_LOAD_CHUNK_ROWS = 100000
+
+SOURCES_TABLE = '_sources'
+
+# Named queries for the CLI
+EXAMPLE_QUERIES = {
+    'high_risk_tcode_changes': """
+        -- Users with high-risk transaction activity in SM20 and the CDPOS field changes they made
+        WITH risky AS (
+            SELECT USER, COUNT(*) AS high_risk_events
+            FROM sm20_enriched WHERE HIGH_RISK_TCODE_FLAG <> '' GROUP BY USER
+        )
+        SELECT r.USER, r.high_risk_events, p.TABNAME, p.FNAME, COUNT(*) AS changes
+        FROM risky r
+        JOIN cdhdr_enriched h ON h.USERNAME = r.USER
+        JOIN cdpos_enriched p ON p.OBJECTCLAS = h.OBJECTCLAS AND p.OBJECTID = h.OBJECTID
+                              AND p.CHANGENR = h.CHANGENR
+        GROUP BY r.USER, r.high_risk_events, p.TABNAME, p.FNAME
+        ORDER BY changes DESC
+        LIMIT 100
+    """,
+    'debug_by_user': """
+        SELECT USER, COUNT(*) AS debug_events
+        FROM sm20_enriched WHERE DEBUG_FLAG <> ''
+        GROUP BY USER ORDER BY debug_events DESC LIMIT 50
+    """,
+    'flag_totals': """
+        SELECT 'DEBUG_FLAG' AS flag, COUNT(*) AS rows_flagged FROM sm20_enriched WHERE DEBUG_FLAG <> ''
+        UNION ALL SELECT 'TABLE_MAINT_FLAG', COUNT(*) FROM sm20_enriched WHERE TABLE_MAINT_FLAG <> ''
+        UNION ALL SELECT 'HIGH_RISK_TCODE_FLAG', COUNT(*) FROM sm20_enriched WHERE HIGH_RISK_TCODE_FLAG <> ''
+        UNION ALL SELECT 'OTHER_FLAGS', COUNT(*) FROM sm20_enriched WHERE OTHER_FLAGS <> ''
+    """,
+}
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _normalize_column(name):
+    """Lookup headers as SQL-friendly names ('Event Description' -> EVENT_DESCRIPTION)."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', name.strip()).strip('_').upper()
+
+
+def _aliased_columns(columns, aliases):
+    """Column names with descriptive headers renamed (kept when the technical one is also present)."""
+    return [aliases[c] if c in aliases and aliases[c] not in columns else c for c in columns]
+
+
+def _alias_select(columns, aliases):
+    """
+    SELECT items exposing descriptive headers under their technical names.
+    Files of both shapes unioned by name fill each other's gaps (COALESCE).
+    """
+    sources = {aliases[c]: c for c in columns if c in aliases}
+    items = []
+    for column in columns:
+        if column in aliases:
+            if aliases[column] not in columns:
+                items.append(f"{_quote(column)} AS {_quote(aliases[column])}")
+        elif column in sources:
+            items.append(f"COALESCE({_quote(column)}, {_quote(sources[column])}) AS {_quote(column)}")
+        else:
+            items.append(_quote(column))
+    return items
+
+
+def _alias_frame(df, aliases):
+    """df with descriptive headers renamed; where both shapes are present the columns are merged."""
+    for column, target in aliases.items():
+        if column not in df.columns:
+            continue
+        if target in df.columns:
+            df[target] = df[target].where(df[target].notna() & (df[target].astype(str) != ''), df[column])
+            df = df.drop(columns=[column])
+        else:
+            df = df.rename(columns={column: target})
+    return df
+
+
+def _csv_encoding(path):
+    """First encoding the whole file decodes with."""
+    for encoding in ENCODING_OPTIONS:
+        try:
+            with open(path, encoding=encoding) as f:
+                for _ in f:
+                    pass
+            return encoding
+        except UnicodeError:
+            continue
+    return 'latin-1'
+
+
+def classify_output(path):
+    """(view name, file type) for a pipeline output file, or None."""
+    name = os.path.basename(path)
+    for stage, pattern in STAGE_PATTERNS:
+        match = pattern.search(name)
+        if match:
+            return f"{match.group(1).lower()}_{stage}", match.group(1).upper()
+    return None
+
+# ================================================================================
+# QUERY ENGINE
+# ================================================================================
+
+class QueryEngine:
+    """SQL views over result files, the result store and lookups (DuckDB or SQLite)."""
+
+    def __init__(self, database=None, engine=None):
+        engine = engine or ('duckdb' if duckdb is not None else 'sqlite')
+        if engine == 'duckdb' and duckdb is None:
+            raise ImportError("The duckdb engine requires the 'duckdb' package")
+        if engine not in ('duckdb', 'sqlite'):
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
+        self.database = database or ':memory:'
+        if engine == 'duckdb':
+            self.connection = duckdb.connect(self.database)
+        else:
+            self.connection = sqlite3.connect(self.database)
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} (name TEXT PRIMARY KEY, signature TEXT)")
+        self.registered = {}
+
+    # --- Registration -----------------------------------------------------------------
+
+    def register_files(self, name, paths, normalize_columns=False, aliases=None):
+        """Register CSV files (unioned by column name) as view `name`; aliases renames columns."""
+        paths = sorted(os.path.abspath(path) for path in paths)
+        if not paths:
+            return
+        with profile_stage(f'query.register.{name}'):
+            if self.engine == 'duckdb':
+                self._duckdb_csv_view(name, paths, normalize_columns, aliases or {})
+            else:
+                self._sqlite_load(name, paths, normalize_columns, aliases or {})
+        self.registered[name] = paths
+
+    def register_directory(self, directory):
+        """Register every cleaned/analyzed/enriched output under directory (recursively)."""
+        if os.path.exists(os.path.join(directory, STORE_FILE)):
+            return self.register_store(directory)
+        groups, file_types = {}, {}
+        for path in glob.glob(os.path.join(directory, '**', '*.csv'), recursive=True):
+            classified = classify_output(path)
+            if classified:
+                groups.setdefault(classified[0], []).append(path)
+                file_types[classified[0]] = classified[1]
+        for name, paths in sorted(groups.items()):
+            self.register_files(name, paths, aliases=COLUMN_ALIASES.get(file_types[name]))
+        return sorted(groups)
+
+    def register_store(self, location):
+        """Register a result store (core/result_store.py) as sm20_store, cdhdr_store, cdpos_store."""
+        store = ResultStore(location)
+        names = []
+        for file_type in FILE_TYPES:
+            name = f"{file_type.lower()}_store"
+            keys = store.partitions(file_type)
+            if not keys:
+                continue
+            with profile_stage(f'query.register.{name}'):
+                aliases = COLUMN_ALIASES.get(file_type, {})
+                local = not location.startswith('s3://')
+                if self.engine == 'duckdb' and local:
+                    # Hive partitioning lets DuckDB skip partitions from the WHERE clause
+                    pattern = os.path.join(os.path.abspath(location), file_type, '**',
+                                           '*' + FILE_EXTENSIONS[store.file_format])
+                    reader = 'read_parquet' if store.file_format == 'parquet' else 'read_csv'
+                    options = "hive_partitioning=true, union_by_name=true"
+                    if store.file_format != 'parquet':
+                        options += ", header=true, all_varchar=true"
+                    source = f"{reader}('{pattern}', {options})"
+                    columns = [column[0] for column in
+                               self.connection.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+                    self.connection.execute(f"CREATE OR REPLACE VIEW {_quote(name)} AS "
+                                            f"SELECT {', '.join(_alias_select(columns, aliases))} FROM {source}")
+                else:
+                    # S3 stores (and SQLite) load the rows; SQLite reuses an identical earlier load
+                    signature = json.dumps([keys, aliases] if aliases else keys)
+                    if self.engine == 'duckdb' or self._sqlite_signature(name) != signature:
+                        self._register_frame(name, _alias_frame(store.read(file_type), aliases), signature)
+            self.registered[name] = [location]
+            names.append(name)
+        return names
+
+    def register_lookups(self, data_dir='data'):
+        """Register the lookup CSVs as views with normalized column names."""
+        names = []
+        for name, filename in LOOKUP_VIEWS:
+            path = os.path.join(data_dir, filename)
+            if os.path.exists(path):
+                self.register_files(name, [path], normalize_columns=True)
+                names.append(name)
+        return names
+
+    def register_source(self, source):
+        """Register a directory, result store (dir or s3://) or single output file."""
+        if source.startswith('s3://'):
+            return self.register_store(source)
+        if os.path.isdir(source):
+            return self.register_directory(source)
+        classified = classify_output(source)
+        if classified is None:
+            raise ValueError(f"Cannot tell the file type and stage of {source}; use register_files()")
+        self.register_files(classified[0], [source], aliases=COLUMN_ALIASES.get(classified[1]))
+        return [classified[0]]
+
+    # --- DuckDB -------------------------------------------------------------------------
+
+    def _duckdb_csv_view(self, name, paths, normalize_columns, aliases):
+        file_list = ', '.join("'" + path.replace("'", "''") + "'" for path in paths)
+        source = (f"read_csv([{file_list}], header=true, all_varchar=true, union_by_name=true, "
+                  f"filename=true)")
+        columns = [column[0] for column in self.connection.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+                   if column[0] != 'filename']
+        if normalize_columns:
+            select = ', '.join(f"{_quote(column)} AS {_quote(_normalize_column(column))}" for column in columns)
+        else:
+            select = ', '.join(_alias_select(columns, aliases) + ['filename AS SOURCE_FILE'])
+        self.connection.execute(f"CREATE OR REPLACE VIEW {_quote(name)} AS SELECT {select} FROM {source}")
+
+    # --- SQLite -------------------------------------------------------------------------
+
+    def _sqlite_signature(self, name):
+        row = self.connection.execute(f"SELECT signature FROM {SOURCES_TABLE} WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _sqlite_load(self, name, paths, normalize_columns, aliases):
+        """Load CSVs into table `name` unless it already holds exactly these file versions."""
+        signature = json.dumps([(path, os.path.getmtime(path), os.path.getsize(path)) for path in paths]
+                               + ([aliases] if aliases else []))
+        if self._sqlite_signature(name) == signature:
+            return
+
+        encodings = {path: _csv_encoding(path) if normalize_columns else 'utf-8-sig' for path in paths}
+        headers = {}
+        columns = []
+        for path in paths:
+            header = list(pd.read_csv(path, encoding=encodings[path], nrows=0).columns)
+            if normalize_columns:
+                header = [_normalize_column(column) for column in header]
+            headers[path] = _aliased_columns(header, aliases)
+            for column in headers[path]:
+                if column not in columns:
+                    columns.append(column)
+        if not normalize_columns:
+            columns.append('SOURCE_FILE')
+
+        cursor = self.connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        cursor.execute(f"CREATE TABLE {_quote(name)} ({', '.join(_quote(c) + ' TEXT' for c in columns)})")
+        insert = (f"INSERT INTO {_quote(name)} ({', '.join(_quote(c) for c in columns)}) "
+                  f"VALUES ({', '.join('?' for _ in columns)})")
+        rows = 0
+        for path in paths:
+            reader = pd.read_csv(path, encoding=encodings[path], dtype=str, keep_default_na=False,
+                                 chunksize=SQLITE_LOAD_CHUNK_ROWS)
+            for chunk in reader:
+                chunk.columns = headers[path]
+                if not normalize_columns:
+                    chunk['SOURCE_FILE'] = path
+                chunk = chunk.reindex(columns=columns, fill_value='')
+                cursor.executemany(insert, chunk.itertuples(index=False, name=None))
+                rows += len(chunk)
+        self._sqlite_finish(name, columns, signature)
+        print(f"Loaded {rows} rows into {name} from {len(paths)} files")
+
+    def _register_frame(self, name, df, signature=None):
+        """Register an in-memory DataFrame (SQLite: as an indexed table)."""
+        if self.engine == 'duckdb':
+            self.connection.register(f"{name}_frame", df)
+            self.connection.execute(f"CREATE OR REPLACE VIEW {_quote(name)} AS SELECT * FROM {_quote(name + '_frame')}")
+            return
+        df.astype(str).to_sql(name, self.connection, if_exists='replace', index=False,
+                              chunksize=SQLITE_LOAD_CHUNK_ROWS)
+        self._sqlite_finish(name, list(df.columns), signature or '')
+
+    def _sqlite_finish(self, name, columns, signature):
+        for column in columns:
+            if column in INDEX_COLUMNS:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {_quote('idx_' + name + '_' + column)} "
+                                        f"ON {_quote(name)} ({_quote(column)})")
+        self.connection.execute(f"INSERT OR REPLACE INTO {SOURCES_TABLE} (name, signature) VALUES (?, ?)",
+                                (name, signature))
+        self.connection.commit()
+
+    # --- Queries ------------------------------------------------------------------------
+
+    def query(self, sql, params=None):
+        """Run SQL and return a DataFrame."""
+        with profile_stage('query.execute') as stage:
+            if self.engine == 'duckdb':
+                df = self.connection.execute(sql, params or []).fetchdf()
+            else:
+                df = pd.read_sql_query(sql, self.connection, params=params)
+            stage.rows = len(df)
+        return df
+
+    def views(self):
+        """Registered view names and their sources."""
+        return dict(self.registered)
+
+    def close(self):
+        self.connection.close()
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface - run SQL (or a named example) over outputs and lookups."""
+    args = sys.argv[1:]
+    options = {'--db': None, '--engine': None, '--out': None}
+    sources = []
+    statement = None
+    list_views = False
+    while args:
+        argument = args.pop(0)
+        if argument == '--source' and args:
+            sources.append(args.pop(0))
+        elif argument in options and args:
+            options[argument] = args.pop(0)
+        elif argument == '--views':
+            list_views = True
+        else:
+            statement = argument
+
+    if statement is None and not list_views:
+        print("Usage: python -m core.query_engine [--db FILE] [--engine duckdb|sqlite] [--source PATH ...]")
+        print("                                   [--out FILE.csv] \"<SQL>\" | <example> | --views")
+        print("Sources default to the output directory; lookups come from data/.")
+        print(f"Examples: {', '.join(EXAMPLE_QUERIES)}")
+        return
+
+    engine = QueryEngine(options['--db'], options['--engine'])
+    print(f"Query engine: {engine.engine}")
+    for source in sources or ['output']:
+        if os.path.exists(source) or source.startswith('s3://'):
+            engine.register_source(source)
+        else:
+            print(f"Warning: Source not found: {source}")
+    engine.register_lookups()
+
+    if list_views:
+        for name, paths in sorted(engine.views().items()):
+            print(f"  {name}: {len(paths)} source(s)")
+        if statement is None:
+            return
+
+    sql = EXAMPLE_QUERIES.get(statement, statement)
+    start = time.perf_counter()
+    df = engine.query(sql)
+    print(f"{len(df)} rows in {time.perf_counter() - start:.2f}s")
+    if options['--out']:
+        df.to_csv(options['--out'], index=False, encoding='utf-8-sig')
+        print(f"Saved to {options['--out']}")
+    else:
+        with pd.option_context('display.max_rows', 100, 'display.width', 200):
+            print(df.head(100).to_string())
+    engine.close()
+
+if __name__ == "__main__":
+    main()
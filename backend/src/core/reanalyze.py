@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+SAP Re-analysis - Recompute only the flags whose rules changed
+Every analyzed file (output/*_analyzed.csv) is written with a manifest,
+<file>.flags.json, holding a fingerprint per flag column: a hash of the
+flag's rules in the rule pack, the lookup data they use (high_risk_tcodes.csv,
+high_risk_tables.csv, ...) and the rule engine version. BURST_FLAG's
+fingerprint covers its rules and the flags it selects on.
+
+After a rule or lookup change, re-analysis compares the recorded fingerprints
+with the current ones and, per file:
+
+    - skips it when nothing changed
+    - reads only the columns the changed flags' rules need from the analyzed
+      file itself (it holds the cleaned data) or from the cleaned file
+    - evaluates only those flags, keeps the other flag columns as stored,
+      drops flags the rule pack no longer defines for the file type, and
+      rewrites the file and its manifest
+
+Adding one entry to high_risk_tcodes.csv therefore recomputes
+HIGH_RISK_TCODE_FLAG (and any flag using the same lookup) instead of
+re-running clean + analyze over every historical file. Files without a
+manifest have all their rule flags recomputed once. BASELINE_FLAG is not
+rule-derived and is kept as stored.
+
+Regenerate the enriched reports from the updated analyzed files with
+python -m core.sap_output_generator.
+
+Usage:
+    python -m core.reanalyze [analyzed.csv | directory ...] [--cleaned FILE] [--force]
+"""
+
+import glob
+import os
+import sys
+import time
+
+import pandas as pd
+
+from core import sap_analyzer
+from core.burst_detection import BURST_COLUMNS, BURST_FLAG, BURST_RULES, detect_bursts
+from core.flag_set import FlagSet
+from core.profiling import profile_stage
+from core.sm20_cleaner import detect_file_type
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+DEFAULT_DIRECTORY = 'output'
+ANALYZED_PATTERN = '*_analyzed.csv'
+
+# Flags other components add; kept as stored
+KEPT_FLAGS = ['BASELINE_FLAG']
+
+# ================================================================================
+# PLANNING
+# ================================================================================
+
+def plan(analyzed_file, file_type, header, force=False):
+    """
+    Flags to recompute and to drop for one file.
+
+    Returns:
+        (current fingerprints, [flags to recompute], [flag columns to drop])
+    """
+    current = sap_analyzer.flag_fingerprints(file_type)
+    manifest = sap_analyzer.read_flag_manifest(analyzed_file) or {}
+    recorded = manifest.get('flags', {})
+    stale = [flag for flag, value in current.items()
+             if force or flag not in header or recorded.get(flag) != value]
+    # Flags the manifest lists that the rule pack no longer defines for this file type
+    dropped = [flag for flag in recorded if flag not in current and flag in header and flag not in KEPT_FLAGS]
+    return current, stale, dropped
+
+
+def _burst_dependencies():
+    return [rule['flag'] for rule in BURST_RULES if 'flag' in rule]
+
+# ================================================================================
+# RE-ANALYSIS
+# ================================================================================
+
+def reanalyze_file(analyzed_file, cleaned_file=None, force=False):
+    """
+    Bring the flags of one analyzed file up to date with the current rules.
+
+    Args:
+        analyzed_file: Output of analyze_sap_activities (cleaned columns + flags)
+        cleaned_file: Read the rule inputs from here instead of analyzed_file
+        force: Recompute every rule flag
+
+    Returns:
+        {'file', 'file_type', 'rows', 'recomputed', 'dropped', 'kept', 'seconds'}
+    """
+    start = time.perf_counter()
+    file_type = detect_file_type(analyzed_file)
+    header = list(pd.read_csv(analyzed_file, encoding='utf-8-sig', nrows=0).columns)
+    current, stale, dropped = plan(analyzed_file, file_type, header, force)
+    flag_columns = [column for column in header if column.endswith(('_FLAG', '_FLAGS'))]
+    result = {'file': analyzed_file, 'file_type': file_type, 'recomputed': stale, 'dropped': dropped,
+              'kept': [flag for flag in flag_columns if flag not in stale and flag not in dropped]}
+    if sap_analyzer.DETECTION_RULES is None:
+        print(f"Warning: No compiled rule pack, cannot re-analyze {analyzed_file}")
+        return dict(result, recomputed=[], dropped=[], rows=None, seconds=0.0)
+    if not stale and not dropped:
+        return dict(result, rows=(sap_analyzer.read_flag_manifest(analyzed_file) or {}).get('rows'),
+                    seconds=round(time.perf_counter() - start, 3))
+
+    rules = sap_analyzer.DETECTION_RULES
+    rule_flags = [flag for flag in stale if flag != BURST_FLAG]
+    columns = rules.fields_for(file_type, rule_flags)
+    if BURST_FLAG in stale:
+        columns += [column for column in BURST_COLUMNS if column not in columns]
+    source = cleaned_file or analyzed_file
+    with profile_stage('reanalyze.read') as stage:
+        df = sap_analyzer._read_detection_columns(source, file_type, columns)
+        stage.rows = len(df)
+
+    new_columns = {}
+    if rule_flags:
+        flag_set = rules.evaluate_flag_set(df, file_type, flag_names=rule_flags)
+        for flag in rule_flags:
+            new_columns[flag] = flag_set.render(flag).to_numpy()
+    if BURST_FLAG in stale:
+        # Bursts select on other flags: the recomputed ones, or the stored ones
+        dependencies = _burst_dependencies()
+        stored = [flag for flag in dependencies if flag not in new_columns and flag in header]
+        values = {}
+        if stored:
+            stored_df = pd.read_csv(analyzed_file, encoding='utf-8-sig', usecols=stored, dtype=str, keep_default_na=False)
+            values.update({flag: stored_df[flag] for flag in stored})
+        values.update({flag: pd.Series(new_columns[flag], index=df.index)
+                       for flag in dependencies if flag in new_columns})
+        burst_set = FlagSet.from_strings(values, index=df.index)
+        detect_bursts(df, file_type, burst_set, [])
+        new_columns[BURST_FLAG] = burst_set.render(BURST_FLAG).to_numpy()
+
+    # Rewrite: stored columns pass through, recomputed flags replace theirs
+    temp_file = analyzed_file + '.tmp'
+    with profile_stage('reanalyze.write', rows=len(df)):
+        _rewrite(analyzed_file, temp_file, new_columns, dropped)
+        os.replace(temp_file, analyzed_file)
+    order = [flag for flag in header if flag in current] + [flag for flag in current if flag not in header]
+    sap_analyzer.write_flag_manifest(analyzed_file, file_type, len(df), {flag: current[flag] for flag in order})
+    return dict(result, rows=len(df), seconds=round(time.perf_counter() - start, 3))
+
+
+def _rewrite(input_file, output_file, new_columns, dropped):
+    """Copy input_file with new_columns replaced (or appended) and dropped columns removed."""
+    start = 0
+    reader = pd.read_csv(input_file, encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                         chunksize=sap_analyzer.PASSTHROUGH_CHUNK_ROWS)
+    try:
+        with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+            for chunk in reader:
+                stop = start + len(chunk)
+                for flag, values in new_columns.items():
+                    chunk[flag] = values[start:stop]
+                chunk.drop(columns=dropped).to_csv(f, index=False, header=(start == 0))
+                start = stop
+        rows = len(next(iter(new_columns.values()))) if new_columns else start
+        if start != rows:
+            raise ValueError(f"{input_file} has {start} rows but re-analysis produced {rows}")
+    except BaseException:
+        os.remove(output_file)
+        raise
+
+
+def analyzed_files(paths):
+    """Analyzed CSVs named by paths (files, or directories searched for *_analyzed.csv)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', ANALYZED_PATTERN), recursive=True)))
+        else:
+            files.append(path)
+    return files
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface."""
+    args = sys.argv[1:]
+    if '--help' in args or '-h' in args:
+        print("Usage: python -m core.reanalyze [analyzed.csv | directory ...] [--cleaned FILE] [--force]")
+        print(f"Default: every {ANALYZED_PATTERN} under {DEFAULT_DIRECTORY}/")
+        return
+
+    cleaned_file = None
+    force = False
+    paths = []
+    while args:
+        argument = args.pop(0)
+        if argument == '--cleaned' and args:
+            cleaned_file = args.pop(0)
+        elif argument == '--force':
+            force = True
+        else:
+            paths.append(argument)
+
+    files = analyzed_files(paths or [DEFAULT_DIRECTORY])
+    if not files:
+        print(f"No analyzed files found ({ANALYZED_PATTERN})")
+        return
+    if cleaned_file and len(files) > 1:
+        print("Warning: --cleaned applies to a single analyzed file; reading the analyzed files instead")
+        cleaned_file = None
+
+    start = time.perf_counter()
+    updated = 0
+    for analyzed_file in files:
+        result = reanalyze_file(analyzed_file, cleaned_file, force)
+        if result['recomputed'] or result['dropped']:
+            updated += 1
+            changes = ', '.join(result['recomputed'] + [f"-{flag}" for flag in result['dropped']])
+            print(f"  {analyzed_file}: recomputed {changes} over {result['rows']} rows in {result['seconds']:.2f}s")
+        else:
+            print(f"  {analyzed_file}: up to date")
+    print(f"\n{updated} of {len(files)} files updated in {time.perf_counter() - start:.1f}s")
+    if updated:
+        print("Regenerate the enriched reports with: python -m core.sap_output_generator")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+SAP Result Diff - Which rows gained or lost flags between two analyses
+Compares two analyzed/enriched CSVs of overlapping data, e.g. before and after
+a change to high_risk_tcodes.csv or the rule pack, or an old export against a
+re-export. Rows are aligned on a stable key: the data columns both files share
+(flag columns and lookup descriptions excluded, since those are what a rule or
+lookup change alters), or the columns given. Identical rows are paired in file
+order.
+
+Every flag column is compared trigger by trigger (' | '-separated), giving:
+
+    diff CSV       one line per changed (row, flag): STATUS (changed,
+                   row_added, row_removed), ROW_BEFORE / ROW_AFTER (1-based
+                   data rows), the key, FLAG, BEFORE, AFTER and the triggers
+                   ADDED / REMOVED
+    summary        row counts (matched, added, removed, and changed: matched
+                   rows whose flags differ) and, per flag, rows that gained,
+                   lost or changed it and the gained / lost count of every
+                   trigger
+
+Files larger than the memory budget (core/memory_governor.py) are hash
+partitioned on the key: each file is read once, its key, row number and flag
+columns are written to per-partition files, and the partitions are compared
+one at a time. The diff CSV is in file order within each partition.
+
+Usage:
+    summary = diff_results('before.csv', 'after.csv', 'diff.csv')
+
+    python -m core.result_diff <before.csv> <after.csv> [diff.csv] [--key COL,COL] [--partitions N]
+"""
+
+import json
+import math
+import os
+import pickle
+import sys
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from core.flag_set import TRIGGER_SEPARATOR
+from core.memory_governor import default_budget_bytes
+from core.profiling import profile_stage
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+FLAG_SUFFIXES = ('_FLAG', '_FLAGS')
+
+# Columns derived from others or from lookups; not part of the default key
+DERIVED_COLUMNS = ['KEY', 'DATETIME']
+DERIVED_SUFFIXES = ('_DESCRIPTION',)
+
+READ_CHUNK_ROWS = 200000
+
+# In-memory bytes per CSV byte when a partition is compared
+MEMORY_EXPANSION = 4
+MAX_PARTITIONS = 256
+
+HASH_COLUMN = '_KEY_HASH'
+ROW_COLUMN = '_ROW'
+OCCURRENCE_COLUMN = '_OCCURRENCE'
+SUFFIXES = ('_before', '_after')
+
+STATUS_CHANGED = 'changed'
+STATUS_ADDED = 'row_added'
+STATUS_REMOVED = 'row_removed'
+
+# Trigger deltas printed by the command line
+TOP_TRIGGERS = 20
+
+# ================================================================================
+# COLUMNS AND READING
+# ================================================================================
+
+def is_flag_column(column):
+    return column.endswith(FLAG_SUFFIXES)
+
+
+def read_header(path):
+    return list(pd.read_csv(path, encoding='utf-8-sig', nrows=0).columns)
+
+
+def default_key_columns(before_columns, after_columns):
+    """Data columns present in both files, in the after file's order."""
+    shared = set(before_columns)
+    return [column for column in after_columns
+            if column in shared and not is_flag_column(column)
+            and column not in DERIVED_COLUMNS and not column.endswith(DERIVED_SUFFIXES)]
+
+
+def _key_hash(frame, key_columns):
+    return pd.util.hash_pandas_object(frame[key_columns], index=False).to_numpy()
+
+
+def read_chunks(path, key_columns, flags):
+    """Chunks of key and flag columns with the key hash and 1-based row number (absent flags are '')."""
+    header = read_header(path)
+    missing = [column for column in key_columns if column not in header]
+    if missing:
+        raise ValueError(f"{path} has no key column(s): {', '.join(missing)}")
+    reader = pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                         usecols=[column for column in header if column in set(key_columns) | set(flags)],
+                         chunksize=READ_CHUNK_ROWS)
+    row = 0
+    for chunk in reader:
+        for flag in flags:
+            if flag not in chunk.columns:
+                chunk[flag] = ''
+        chunk[HASH_COLUMN] = _key_hash(chunk, key_columns)
+        chunk[ROW_COLUMN] = np.arange(row + 1, row + len(chunk) + 1)
+        row += len(chunk)
+        yield chunk[[HASH_COLUMN, ROW_COLUMN] + key_columns + flags]
+
+
+def partition_file(path, key_columns, flags, partitions, work_dir, side):
+    """Append the file's rows to work_dir/<side>-<partition>.pkl by key hash; returns its row count."""
+    handles = [open(os.path.join(work_dir, f'{side}-{partition:04d}.pkl'), 'wb') for partition in range(partitions)]
+    rows = 0
+    try:
+        for chunk in read_chunks(path, key_columns, flags):
+            rows += len(chunk)
+            assignment = chunk[HASH_COLUMN].to_numpy() % np.uint64(partitions)
+            for partition, part in chunk.groupby(assignment, sort=False):
+                # Temporary files of this process: pickled frames avoid re-parsing text
+                pickle.dump(part, handles[int(partition)], protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for handle in handles:
+            handle.close()
+    return rows
+
+
+def read_partition(path, key_columns, flags):
+    """The frames partition_file() appended to path, concatenated."""
+    frames = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                frames.append(pickle.load(f))
+            except EOFError:
+                break
+    if not frames:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in
+                             [(HASH_COLUMN, np.uint64), (ROW_COLUMN, np.int64)] + [(c, object) for c in key_columns + flags]})
+    return pd.concat(frames, ignore_index=True)
+
+# ================================================================================
+# COMPARISON
+# ================================================================================
+
+def _split(value):
+    return set(value.split(TRIGGER_SEPARATOR)) if value else set()
+
+
+def _align(before, after, on):
+    """Outer join on the key, pairing the n-th occurrence of a key in each file."""
+    for frame in (before, after):
+        frame[OCCURRENCE_COLUMN] = frame.groupby(on, sort=False).cumcount()
+    return before.merge(after, on=on + [OCCURRENCE_COLUMN], how='outer', suffixes=SUFFIXES, indicator=True)
+
+
+class DiffSummary:
+    """Row and trigger deltas accumulated over the compared partitions."""
+
+    def __init__(self, key_columns, flags):
+        self.key_columns = key_columns
+        self.flags = flags
+        self.rows = Counter()
+        self.flag_rows = {flag: Counter() for flag in flags}
+        self.triggers = {flag: {'gained': Counter(), 'lost': Counter()} for flag in flags}
+
+    def to_dict(self):
+        return {
+            'key_columns': self.key_columns,
+            'rows': {name: int(self.rows[name]) for name in ('before', 'after', 'matched', 'added', 'removed', 'changed')},
+            'flags': {
+                flag: {
+                    'gained_rows': int(self.flag_rows[flag]['gained']),
+                    'lost_rows': int(self.flag_rows[flag]['lost']),
+                    'changed_rows': int(self.flag_rows[flag]['changed']),
+                    'triggers': {
+                        trigger: {'gained': int(self.triggers[flag]['gained'][trigger]),
+                                  'lost': int(self.triggers[flag]['lost'][trigger]),
+                                  'net': int(self.triggers[flag]['gained'][trigger] - self.triggers[flag]['lost'][trigger])}
+                        for trigger in sorted(set(self.triggers[flag]['gained']) | set(self.triggers[flag]['lost']))
+                    },
+                }
+                for flag in self.flags
+            },
+        }
+
+
+def compare_frames(before, after, key_columns, flags, summary):
+    """Diff rows (see the module docstring) of two aligned frames; adds their deltas to summary."""
+    merged = _align(before, after, [HASH_COLUMN])
+    both = (merged['_merge'] == 'both').to_numpy()
+    if both.any():
+        collided = np.zeros(len(merged), dtype=bool)
+        for column in key_columns:
+            collided |= both & (merged[column + SUFFIXES[0]] != merged[column + SUFFIXES[1]]).to_numpy()
+        if collided.any():
+            # 64-bit hash collision between different keys: align on the key values themselves
+            before = before.drop(columns=OCCURRENCE_COLUMN)
+            after = after.drop(columns=OCCURRENCE_COLUMN)
+            merged = _align(before, after, [HASH_COLUMN] + key_columns)
+            both = (merged['_merge'] == 'both').to_numpy()
+    # Key values from whichever side has the row
+    from_after = (merged['_merge'] != 'left_only').to_numpy()
+    for column in key_columns:
+        if column + SUFFIXES[1] in merged.columns:
+            merged[column] = np.where(from_after, merged[column + SUFFIXES[1]], merged[column + SUFFIXES[0]])
+
+    status = np.where(both, STATUS_CHANGED,
+                      np.where(merged['_merge'].to_numpy() == 'right_only', STATUS_ADDED, STATUS_REMOVED))
+    summary.rows['before'] += len(before)
+    summary.rows['after'] += len(after)
+    summary.rows['matched'] += int(both.sum())
+    summary.rows['added'] += int((status == STATUS_ADDED).sum())
+    summary.rows['removed'] += int((status == STATUS_REMOVED).sum())
+
+    details = []
+    changed_rows = np.zeros(len(merged), dtype=bool)
+    for flag in flags:
+        old = merged[flag + SUFFIXES[0]].fillna('').to_numpy(dtype=object)
+        new = merged[flag + SUFFIXES[1]].fillna('').to_numpy(dtype=object)
+        differs = old != new
+        if not differs.any():
+            continue
+        changed_rows |= differs
+        old_set, new_set = old != '', new != ''
+        summary.flag_rows[flag]['gained'] += int((differs & ~old_set & new_set).sum())
+        summary.flag_rows[flag]['lost'] += int((differs & old_set & ~new_set).sum())
+        summary.flag_rows[flag]['changed'] += int((differs & old_set & new_set).sum())
+
+        # Trigger sets compared once per distinct (before, after) pair
+        pairs = pd.DataFrame({'BEFORE': old[differs], 'AFTER': new[differs]})
+        deltas = {}
+        for (old_value, new_value), count in pairs.groupby(['BEFORE', 'AFTER'], sort=False).size().items():
+            old_triggers, new_triggers = _split(old_value), _split(new_value)
+            added, removed = sorted(new_triggers - old_triggers), sorted(old_triggers - new_triggers)
+            deltas[(old_value, new_value)] = (TRIGGER_SEPARATOR.join(added), TRIGGER_SEPARATOR.join(removed))
+            for trigger in added:
+                summary.triggers[flag]['gained'][trigger] += count
+            for trigger in removed:
+                summary.triggers[flag]['lost'][trigger] += count
+
+        detail = merged.loc[differs, [ROW_COLUMN + SUFFIXES[0], ROW_COLUMN + SUFFIXES[1]] + key_columns]
+        detail.columns = ['ROW_BEFORE', 'ROW_AFTER'] + key_columns
+        detail.insert(0, 'STATUS', status[differs])
+        detail['FLAG'] = flag
+        detail['BEFORE'] = pairs['BEFORE'].to_numpy()
+        detail['AFTER'] = pairs['AFTER'].to_numpy()
+        changes = [deltas[pair] for pair in zip(detail['BEFORE'], detail['AFTER'])]
+        detail['ADDED'] = [added for added, _ in changes]
+        detail['REMOVED'] = [removed for _, removed in changes]
+        details.append(detail)
+
+    summary.rows['changed'] += int((changed_rows & both).sum())
+    if not details:
+        return pd.DataFrame(columns=['STATUS', 'ROW_BEFORE', 'ROW_AFTER'] + key_columns +
+                            ['FLAG', 'BEFORE', 'AFTER', 'ADDED', 'REMOVED'])
+    result = pd.concat(details)
+    for column in ('ROW_BEFORE', 'ROW_AFTER'):
+        result[column] = result[column].astype('Int64')
+    # File order: by the after row, removed rows at their before position
+    order = result['ROW_AFTER'].fillna(result['ROW_BEFORE']).astype(np.int64)
+    return result.iloc[np.lexsort((result['ROW_BEFORE'].fillna(0).to_numpy(), order.to_numpy()))]
+
+# ================================================================================
+# DIFF
+# ================================================================================
+
+def partition_count(before_file, after_file):
+    """Partitions needed for a partition of both files to fit the memory budget."""
+    size = os.path.getsize(before_file) + os.path.getsize(after_file)
+    return min(MAX_PARTITIONS, max(1, math.ceil(size * MEMORY_EXPANSION / default_budget_bytes())))
+
+
+def diff_results(before_file, after_file, output_file=None, key_columns=None, partitions=None, work_dir=None):
+    """
+    Compare two analyzed CSVs and write the per-row diff to output_file (if given).
+
+    Args:
+        before_file, after_file: Analyzed or enriched CSVs of the same file type
+        output_file: Diff CSV (one line per changed row and flag)
+        key_columns: Columns identifying a row (default: shared data columns)
+        partitions: Hash partitions (default: sized to the memory budget)
+        work_dir: Directory for the partition files (default: system temp)
+
+    Returns:
+        Summary dict (rows, per-flag and per-trigger deltas)
+    """
+    before_columns, after_columns = read_header(before_file), read_header(after_file)
+    key_columns = key_columns or default_key_columns(before_columns, after_columns)
+    if not key_columns:
+        raise ValueError("The files share no data columns to align rows on; pass key columns")
+    flags = [column for column in after_columns if is_flag_column(column)]
+    flags += [column for column in before_columns if is_flag_column(column) and column not in flags]
+    partitions = partitions or partition_count(before_file, after_file)
+
+    summary = DiffSummary(key_columns, flags)
+    written = False
+
+    def write(diff):
+        nonlocal written
+        if output_file is not None and (len(diff) or not written):
+            diff.to_csv(output_file, mode='a' if written else 'w', header=not written, index=False,
+                        encoding='utf-8-sig' if not written else 'utf-8')
+            written = True
+
+    if partitions == 1:
+        with profile_stage('diff.read') as stage:
+            before = pd.concat(read_chunks(before_file, key_columns, flags), ignore_index=True)
+            after = pd.concat(read_chunks(after_file, key_columns, flags), ignore_index=True)
+            stage.rows = len(before) + len(after)
+        with profile_stage('diff.compare', rows=len(before) + len(after)):
+            write(compare_frames(before, after, key_columns, flags, summary))
+    else:
+        with tempfile.TemporaryDirectory(dir=work_dir, prefix='result_diff_') as temp_dir:
+            with profile_stage('diff.partition') as stage:
+                stage.rows = (partition_file(before_file, key_columns, flags, partitions, temp_dir, 'before') +
+                              partition_file(after_file, key_columns, flags, partitions, temp_dir, 'after'))
+            with profile_stage('diff.compare', rows=stage.rows):
+                for partition in range(partitions):
+                    before = read_partition(os.path.join(temp_dir, f'before-{partition:04d}.pkl'), key_columns, flags)
+                    after = read_partition(os.path.join(temp_dir, f'after-{partition:04d}.pkl'), key_columns, flags)
+                    write(compare_frames(before, after, key_columns, flags, summary))
+
+    result = summary.to_dict()
+    result.update({'before': before_file, 'after': after_file, 'partitions': partitions})
+    return result
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def print_summary(summary, top=TOP_TRIGGERS):
+    rows = summary['rows']
+    print(f"Rows: {rows['before']} before, {rows['after']} after, {rows['matched']} matched, "
+          f"{rows['added']} added, {rows['removed']} removed; {rows['changed']} with flag changes")
+    print(f"\n{'flag':<24} {'gained':>9} {'lost':>9} {'changed':>9}")
+    for flag, counts in summary['flags'].items():
+        print(f"{flag:<24} {counts['gained_rows']:>9} {counts['lost_rows']:>9} {counts['changed_rows']:>9}")
+
+    deltas = [(flag, trigger, counts) for flag, flag_counts in summary['flags'].items()
+              for trigger, counts in flag_counts['triggers'].items()]
+    if deltas:
+        deltas.sort(key=lambda delta: (-abs(delta[2]['net']), delta[0], delta[1]))
+        print(f"\n{'flag':<24} {'trigger':<40} {'gained':>8} {'lost':>8} {'net':>8}")
+        for flag, trigger, counts in deltas[:top]:
+            print(f"{flag:<24} {trigger[:40]:<40} {counts['gained']:>8} {counts['lost']:>8} {counts['net']:>+8}")
+
+
+def main():
+    """Command line interface - diff two analyzed files."""
+    args = sys.argv[1:]
+    options = {'--key': None, '--partitions': None}
+    positional = []
+    while args:
+        argument = args.pop(0)
+        if argument in options and args:
+            options[argument] = args.pop(0)
+        else:
+            positional.append(argument)
+    if len(positional) < 2:
+        print("Usage: python -m core.result_diff <before.csv> <after.csv> [diff.csv] [--key COL,COL] [--partitions N]")
+        print("Writes the per-row diff (default result_diff.csv) and its _summary.json.")
+        return
+
+    output_file = positional[2] if len(positional) > 2 else 'result_diff.csv'
+    summary = diff_results(positional[0], positional[1], output_file,
+                           key_columns=options['--key'].split(',') if options['--key'] else None,
+                           partitions=int(options['--partitions']) if options['--partitions'] else None)
+    summary_file = os.path.splitext(output_file)[0] + '_summary.json'
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print_summary(summary)
+    print(f"\nSaved diff to {output_file} and summary to {summary_file}")
+
+if __name__ == "__main__":
+    main()
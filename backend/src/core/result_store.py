@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+SAP Result Store - Hive-partitioned analysis results by system and date
+Enriched results are appended to one dataset per file type, partitioned
+Hive-style:
+
+    {root}/SM20/sap_system=PRD/year=2024/month=03/day=05/part-{analysis}-00000.parquet
+
+Readers pass partition filters and only the matching partitions are listed
+and read. Equality filters on leading keys narrow the listing prefix itself,
+so "debug events on PRD in March 2024" lists
+{root}/SM20/sap_system=PRD/year=2024/month=03/ and nothing else.
+
+Partitions come from SYSTEM and the row's date (SM20 DATETIME, CDHDR UDATE).
+Rows without one (all of CDPOS, which has neither) land in the
+__HIVE_DEFAULT_PARTITION__ value. Partition columns are not stored in the files;
+read() adds them back as sap_system/year/month/day (named so they do not
+clash with the SYSTEM column in case-insensitive SQL).
+
+Files are Parquet when pyarrow is installed, gzip CSV otherwise; a store keeps
+the format it was created with. All columns are stored as text. Appending the
+same analysis ID again replaces that analysis' files (a manifest lists them).
+The root is a local directory or s3://bucket/prefix.
+
+Usage:
+    store = ResultStore('s3://bucket/store')
+    store.append_csv('SM20_analyzed.csv', 'SM20', analysis_id)
+    debug = store.read('SM20', {'sap_system': 'PRD', 'year': 2024, 'month': 3}, flag='DEBUG_FLAG')
+
+    python -m core.result_store append <root> <analyzed.csv> [file type]
+    python -m core.result_store read <root> <file type> [key=value ...] [flag=FLAG] [out.csv]
+"""
+
+import io
+import json
+import os
+import re
+import sys
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from core.profiling import profile_stage
+from core.sm20_cleaner import detect_file_type, parse_sap_datetime
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+PARTITION_KEYS = ['sap_system', 'year', 'month', 'day']
+
+# Hive's name for a missing partition value
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# Date column per file type ('DATETIME' is ISO text, others are SAP dates)
+PARTITION_DATE_COLUMNS = {
+    'SM20': ['DATETIME', 'DATE'],
+    'CDHDR': ['UDATE'],
+    'CDPOS': [],
+}
+
+SYSTEM_COLUMNS = ['SYSTEM']
+
+FILE_EXTENSIONS = {'parquet': '.parquet', 'csv': '.csv.gz'}
+
+STORE_FILE = '_store.json'
+MANIFEST_DIR = '_manifests'
+
+# Rows appended at a time from an analyzed CSV
+APPEND_CHUNK_ROWS = 200000
+
+def _safe(value):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(value)) or DEFAULT_PARTITION
+
+# ================================================================================
+# FILE BACKENDS
+# ================================================================================
+
+class LocalFiles:
+    """Store files in a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list(self, prefix):
+        base = os.path.join(self.root, prefix)
+        if not os.path.isdir(base):
+            return []
+        keys = []
+        for directory, _, files in os.walk(base):
+            for name in files:
+                if not name.endswith('.tmp'):
+                    keys.append(os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/'))
+        return sorted(keys)
+
+    def read(self, key):
+        try:
+            with open(os.path.join(self.root, key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.root, key))
+            except FileNotFoundError:
+                pass
+
+
+class S3Files:
+    """Store files under an S3 prefix."""
+
+    def __init__(self, bucket, prefix, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def list(self, prefix):
+        keys = []
+        start = len(self._key(''))
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys.extend(obj['Key'][start:] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def read(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def write(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def delete(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), 1000):
+            objects = [{'Key': self._key(key)} for key in keys[start:start + 1000]]
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects})
+
+
+def _files(location, client=None):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3Files(bucket, prefix, client)
+    return LocalFiles(location)
+
+# ================================================================================
+# PARTITIONING
+# ================================================================================
+
+def partition_values(df, file_type, system=None):
+    """DataFrame of sap_system/year/month/day partition values for each row of df."""
+    if system is not None:
+        systems = pd.Series(system, index=df.index)
+    else:
+        column = next((c for c in SYSTEM_COLUMNS if c in df.columns), None)
+        systems = df[column].fillna('').astype(str).str.strip() if column else pd.Series('', index=df.index)
+
+    dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    column = next((c for c in PARTITION_DATE_COLUMNS.get(file_type, []) if c in df.columns), None)
+    if column == 'DATETIME':
+        dates = pd.to_datetime(df[column], errors='coerce')
+    elif column:
+        dates = parse_sap_datetime(df[column].fillna('').astype(str))[0]
+
+    parts = pd.DataFrame({
+        'sap_system': systems.where(systems != '', DEFAULT_PARTITION).map(_safe),
+        'year': dates.dt.strftime('%Y'),
+        'month': dates.dt.strftime('%m'),
+        'day': dates.dt.strftime('%d'),
+    }, index=df.index)
+    return parts.fillna(DEFAULT_PARTITION)
+
+
+def _normalize_filter(key, value):
+    """Filter values as the partition strings they match (year 2024, month 3 -> '2024', '03')."""
+    values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+    width = {'month': 2, 'day': 2}.get(key)
+    result = set()
+    for item in values:
+        text = _safe(item) if key == 'sap_system' else str(item)
+        if width and text.isdigit():
+            text = text.zfill(width)
+        result.add(text)
+    return result
+
+
+def _partition_of(key):
+    """{'sap_system': ..., 'year': ...} parsed from a file key's key=value directories."""
+    return dict(part.split('=', 1) for part in key.split('/')[:-1] if '=' in part)
+
+# ================================================================================
+# RESULT STORE
+# ================================================================================
+
+class ResultStore:
+    """Append and read partitioned results under a local or S3 root."""
+
+    def __init__(self, location, client=None, file_format=None):
+        self.files = _files(location, client)
+        settings = json.loads(self.files.read(STORE_FILE) or 'null')
+        if settings is None:
+            file_format = file_format or ('parquet' if pq is not None else 'csv')
+            settings = {'format': file_format, 'partition_keys': PARTITION_KEYS}
+            self.files.write(STORE_FILE, json.dumps(settings).encode())
+        self.file_format = settings['format']
+        if self.file_format == 'parquet' and pq is None:
+            raise ImportError("This result store holds Parquet files; reading it requires the 'pyarrow' package")
+
+    # --- Encoding ---------------------------------------------------------------------
+
+    def _encode(self, df):
+        buffer = io.BytesIO()
+        if self.file_format == 'parquet':
+            df.to_parquet(buffer, index=False)
+        else:
+            df.to_csv(buffer, index=False, compression={'method': 'gzip'})
+        return buffer.getvalue()
+
+    def _decode(self, data, columns=None):
+        if self.file_format == 'parquet':
+            if columns is not None:
+                available = set(pq.read_schema(io.BytesIO(data)).names)
+                columns = [column for column in columns if column in available]
+            return pd.read_parquet(io.BytesIO(data), columns=columns)
+        usecols = (lambda column: column in columns) if columns is not None else None
+        return pd.read_csv(io.BytesIO(data), compression='gzip', dtype=str, keep_default_na=False, usecols=usecols)
+
+    # --- Writing ------------------------------------------------------------------------
+
+    def _manifest_key(self, file_type, analysis_id):
+        return f"{MANIFEST_DIR}/{file_type}/{_safe(analysis_id)}.json"
+
+    def append(self, frames, file_type, analysis_id, system=None):
+        """
+        Append an analysis' results (a DataFrame or an iterable of chunks).
+        Files of an earlier append with the same analysis_id are replaced.
+
+        Returns:
+            Number of rows appended
+        """
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+        manifest_key = self._manifest_key(file_type, analysis_id)
+        previous = json.loads(self.files.read(manifest_key) or '[]')
+        self.files.delete(previous)
+
+        written = []
+        rows = 0
+        with profile_stage('store.append') as stage:
+            for df in frames:
+                df = df.fillna('').astype(str)
+                parts = partition_values(df, file_type, system)
+                for values, positions in parts.groupby(PARTITION_KEYS, sort=True).indices.items():
+                    directory = '/'.join(f"{key}={value}" for key, value in zip(PARTITION_KEYS, values))
+                    name = f"part-{_safe(analysis_id)}-{len(written):05d}{FILE_EXTENSIONS[self.file_format]}"
+                    key = f"{file_type}/{directory}/{name}"
+                    self.files.write(key, self._encode(df.iloc[positions].reset_index(drop=True)))
+                    written.append(key)
+                rows += len(df)
+            stage.rows = rows
+        self.files.write(manifest_key, json.dumps(written).encode())
+        print(f"Appended {rows} {file_type} rows in {len(written)} partition files")
+        return rows
+
+    def append_csv(self, csv_file, file_type, analysis_id, system=None):
+        """Append an analyzed CSV, read in chunks as text."""
+        reader = pd.read_csv(csv_file, encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                             chunksize=APPEND_CHUNK_ROWS)
+        return self.append(reader, file_type, analysis_id, system)
+
+    def remove(self, file_type, analysis_id):
+        """Delete an analysis' files."""
+        manifest_key = self._manifest_key(file_type, analysis_id)
+        self.files.delete(json.loads(self.files.read(manifest_key) or '[]') + [manifest_key])
+
+    # --- Reading ------------------------------------------------------------------------
+
+    def partitions(self, file_type, filters=None):
+        """Keys of the files in partitions matching filters ({key: value or [values]})."""
+        filters = {key: _normalize_filter(key, value) for key, value in (filters or {}).items()}
+        unknown = set(filters) - set(PARTITION_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown partition keys: {sorted(unknown)} (use {PARTITION_KEYS})")
+
+        # Single-valued filters on leading keys become the listing prefix
+        prefix = f"{file_type}/"
+        for key in PARTITION_KEYS:
+            if len(filters.get(key, ())) != 1:
+                break
+            prefix += f"{key}={next(iter(filters[key]))}/"
+
+        keys = []
+        for key in self.files.list(prefix):
+            partition = _partition_of(key)
+            if all(partition.get(name) in allowed for name, allowed in filters.items()):
+                keys.append(key)
+        return keys
+
+    def read(self, file_type, filters=None, columns=None, flag=None):
+        """
+        Rows of the matching partitions, with sap_system/year/month/day columns.
+
+        Args:
+            file_type: 'SM20', 'CDHDR' or 'CDPOS'
+            filters: {'sap_system': 'PRD', 'year': 2024, 'month': [3, 4], ...}
+            columns: Columns to read (default all)
+            flag: Keep only rows where this flag column is set
+        """
+        read_columns = None
+        if columns is not None:
+            read_columns = list(columns) + ([flag] if flag and flag not in columns else [])
+
+        frames = []
+        keys = self.partitions(file_type, filters)
+        with profile_stage('store.read') as stage:
+            for key in keys:
+                df = self._decode(self.files.read(key), read_columns)
+                if flag:
+                    df = df[df[flag].fillna('') != ''] if flag in df.columns else df.iloc[0:0]
+                for name, value in _partition_of(key).items():
+                    df[name] = value
+                frames.append(df)
+            result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns or [])
+            stage.rows = len(result)
+        print(f"Read {len(result)} {file_type} rows from {len(keys)} partition files")
+        return result
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface - append analyzed files or read partitions."""
+    if len(sys.argv) < 4 or sys.argv[1] not in ('append', 'read'):
+        print("Usage: python -m core.result_store append <root> <analyzed.csv> [file type]")
+        print("       python -m core.result_store read <root> <file type> [key=value ...] [flag=FLAG] [out.csv]")
+        print(f"Partition keys: {', '.join(PARTITION_KEYS)} (several values: month=3,4)")
+        return
+
+    store = ResultStore(sys.argv[2])
+    if sys.argv[1] == 'append':
+        csv_file = sys.argv[3]
+        file_type = sys.argv[4] if len(sys.argv) > 4 else detect_file_type(csv_file)
+        store.append_csv(csv_file, file_type, os.path.splitext(os.path.basename(csv_file))[0])
+        return
+
+    filters, flag, output_file = {}, None, None
+    for argument in sys.argv[4:]:
+        if '=' not in argument:
+            output_file = argument
+            continue
+        key, value = argument.split('=', 1)
+        if key == 'flag':
+            flag = value
+        else:
+            filters[key] = value.split(',') if ',' in value else value
+    df = store.read(sys.argv[3], filters, flag=flag)
+    if output_file:
+        df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        print(f"Saved {len(df)} rows to {output_file}")
+    else:
+        print(df.head(20).to_string())
+
+if __name__ == "__main__":
+    main()
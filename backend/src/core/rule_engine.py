@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+SAP Detection Rule Engine - Declarative rules compiled to vectorized plans
+Loads detection rules from a JSON (or YAML) rule pack and compiles them into a
+single evaluation plan that runs column-wise over a DataFrame or chunk.
+
+Rule pack format:
+    {
+      "version": 1,
+      "flags": [
+        {
+          "name": "DEBUG_FLAG",               # output column
+          "file_types": ["SM20"],             # file types that get this flag
+          "description": "debugging activities",
+          "dedupe_segment": 1,                # optional, drop triggers whose
+                                              # label.split(':')[n] repeats
+          "triggers": [
+            {
+              "id": "debug_event",            # unique within the flag
+              "field": "EVENT",               # column to test
+              "normalize": "upper_strip",     # raw|strip|upper|lower|upper_strip
+              "op": "in",                     # see OPERATIONS
+              "values": ["A03", "A18"],       # or "$CONTEXT_NAME"
+              "label": "Event:{value}"        # trigger label template
+            }
+          ]
+        }
+      ]
+    }
+
+Operations:
+    in            normalized value is in `values`
+    equals        normalized value equals `value`
+    contains      normalized value contains the literal `value`
+    contains_any  first literal of `values` (list order) found in the value;
+                  `pattern` may wrap each literal, e.g. "activity {value}"
+    regex_any     first entry of `values` whose `pattern` matches, with the
+                  entry regex-escaped into the pattern, e.g. "\\b{value}\\b"
+    regex         `pattern` matches; named groups are available to the label
+
+Trigger options:
+    requires / unless   ids of earlier triggers in the same flag that must /
+                        must not have matched on the row
+    refine              {"pattern", "label"}: regex (with {value} substituted)
+                        tried on matched rows; when it matches, the refine label
+                        is used and {match} holds its first group
+    extra               named values pulled from other columns, optionally
+                        mapped through a context dict ("map": "$NAME")
+    label_when_blank    label used when any extra value is empty
+
+Label templates use {name} or {name|filter|...} with filters upper, lower and
+underscore (spaces to underscores). Available names: value, alias (second item
+of a [literal, alias] pair), category (context dict value for `in` matches),
+column, match, named regex groups and extra values.
+
+Labels are rendered once per distinct capture and broadcast to matching rows,
+so a rule costs a few column operations instead of a Python pass per row.
+
+Before the triggers run, a candidate prefilter derived from the pack keeps only
+rows (and distinct values) that could match: exact sets via isin and all
+substring literals in one combined scan per column. regex_any patterns must
+contain {value} unconditionally for this to hold; a free-form `regex` trigger
+disables the prefilter for its file type.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.dataframe_backend import get_backend
+from core.flag_set import FlagSet
+from core.profiling import get_profiler, profile_stage
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+# Built-in rule pack reproducing the original detection flags
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'detection_rules.json')
+
+# Environment variable that points at an alternative rule pack
+RULES_FILE_ENV = 'SAP_ANALYZER_RULES'
+
+OPERATIONS = ['in', 'equals', 'contains', 'contains_any', 'regex_any', 'regex']
+
+NORMALIZATIONS = ['raw', 'strip', 'upper', 'lower', 'upper_strip']
+
+LABEL_FILTERS = {
+    'upper': str.upper,
+    'lower': str.lower,
+    'underscore': lambda text: text.replace(' ', '_'),
+}
+
+# Part of every flag fingerprint; bump when a change to this module alters the
+# labels an unchanged rule pack produces, so stored flags are recomputed
+ENGINE_VERSION = 1
+
+_PLACEHOLDER = re.compile(r'\{([A-Za-z_][A-Za-z0-9_ ]*)((?:\|[a-z_]+)*)\}')
+
+# ================================================================================
+# RULE PACK LOADING
+# ================================================================================
+
+def rules_file_path(rules_file=None):
+    """Resolve the rule pack path: explicit argument, $SAP_ANALYZER_RULES, then the built-in pack."""
+    return rules_file or os.environ.get(RULES_FILE_ENV) or DEFAULT_RULES_FILE
+
+
+def load_rule_pack(rules_file=None):
+    """
+    Load a rule pack definition from JSON or YAML.
+
+    Args:
+        rules_file: Path to the rule pack; defaults to $SAP_ANALYZER_RULES or
+            the built-in data/detection_rules.json
+
+    Returns:
+        Rule pack as a dict
+    """
+    rules_file = rules_file_path(rules_file)
+
+    with open(rules_file, encoding='utf-8') as f:
+        if rules_file.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required for YAML rule packs (pip install pyyaml)")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+# ================================================================================
+# FINGERPRINTS
+# ================================================================================
+
+def _canonical(value):
+    """JSON-serializable form of a context value with a stable order."""
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonical(item) for item in value), key=repr)
+    if isinstance(value, dict):
+        return sorted(([str(key), _canonical(item)] for key, item in value.items()), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value if isinstance(value, (str, int, bool)) or value is None else str(value)
+
+
+def _context_references(spec):
+    """Names of the "$NAME" context entries a rule spec uses."""
+    if isinstance(spec, str):
+        return {spec[1:]} if spec.startswith('$') else set()
+    if isinstance(spec, dict):
+        spec = list(spec.values())
+    if isinstance(spec, list):
+        return set().union(*[_context_references(item) for item in spec])
+    return set()
+
+
+def fingerprint(*parts):
+    """Short stable hash of JSON-serializable parts."""
+    text = json.dumps([_canonical(part) for part in parts], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+# ================================================================================
+# LABEL TEMPLATES
+# ================================================================================
+
+def _compile_template(template):
+    """Split a label template into literal text and (name, filters) parts."""
+    parts = []
+    pos = 0
+    for match in _PLACEHOLDER.finditer(template):
+        if match.start() > pos:
+            parts.append(template[pos:match.start()])
+        filters = [name for name in match.group(2).split('|') if name]
+        for name in filters:
+            if name not in LABEL_FILTERS:
+                raise ValueError(f"Unknown label filter '{name}' in template: {template}")
+        parts.append((match.group(1), filters))
+        pos = match.end()
+    if pos < len(template):
+        parts.append(template[pos:])
+    return parts
+
+def _render_template(parts, values):
+    out = []
+    for part in parts:
+        if isinstance(part, tuple):
+            text = str(values.get(part[0], ''))
+            for name in part[1]:
+                text = LABEL_FILTERS[name](text)
+            out.append(text)
+        else:
+            out.append(part)
+    return ''.join(out)
+
+# ================================================================================
+# COMPILED TRIGGERS
+# ================================================================================
+
+def _resolve(spec, context):
+    """Resolve a "$NAME" reference against the compile context."""
+    if isinstance(spec, str) and spec.startswith('$'):
+        name = spec[1:]
+        if name not in context:
+            raise ValueError(f"Rule references unknown context '{spec}'")
+        return context[name]
+    return spec
+
+def _literal_entries(values):
+    """Normalize a values list into (literal, alias) pairs, keeping order."""
+    entries = []
+    for item in values:
+        if isinstance(item, (list, tuple)):
+            entries.append((str(item[0]), str(item[1])))
+        else:
+            entries.append((str(item), str(item)))
+    return entries
+
+class CompiledTrigger:
+    """One trigger of a flag, ready to evaluate against normalized columns."""
+
+    def __init__(self, spec, context, known_ids):
+        self.id = spec.get('id')
+        if not self.id:
+            raise ValueError(f"Trigger is missing an id: {spec}")
+        self.field = spec['field']
+        self.normalize = spec.get('normalize', 'raw')
+        self.op = spec['op']
+        if self.op not in OPERATIONS:
+            raise ValueError(f"Trigger '{self.id}' uses unknown op '{self.op}'")
+        if self.normalize not in NORMALIZATIONS:
+            raise ValueError(f"Trigger '{self.id}' uses unknown normalization '{self.normalize}'")
+
+        for dep in spec.get('requires', []) + spec.get('unless', []):
+            if dep not in known_ids:
+                raise ValueError(f"Trigger '{self.id}' depends on '{dep}', which is not an earlier trigger in its flag")
+        self.requires = list(spec.get('requires', []))
+        self.unless = list(spec.get('unless', []))
+
+        self.categories = {}
+        self.pattern = spec.get('pattern', '{value}')
+        if self.op == 'in':
+            values = _resolve(spec['values'], context)
+            if isinstance(values, dict):
+                self.categories = {str(k): str(v) for k, v in values.items()}
+            self.values = {str(v) for v in values}
+        elif self.op in ('equals', 'contains'):
+            self.values = str(spec['value'])
+        elif self.op in ('contains_any', 'regex_any'):
+            values = _resolve(spec['values'], context)
+            self.values = _literal_entries(values)
+            if isinstance(values, dict):
+                self.categories = {str(k): str(v) for k, v in values.items()}
+            if self.op == 'regex_any':
+                self.regexes = [re.compile(self.pattern.replace('{value}', re.escape(lit))) for lit, _ in self.values]
+                screen = '|'.join(f'(?:{regex.pattern})' for regex in self.regexes)
+            else:
+                screen = '|'.join(re.escape(self.pattern.replace('{value}', lit)) for lit, _ in self.values)
+            # One pass finds the values any entry matches; entries are then tried in order on those only
+            self.screen = re.compile(screen) if self.values else None
+        elif self.op == 'regex':
+            self.regex = re.compile(spec['pattern'])
+
+        self.refine = None
+        if 'refine' in spec:
+            self.refine = {
+                'pattern': spec['refine']['pattern'],
+                'label': _compile_template(spec['refine']['label']),
+            }
+
+        self.extra = {}
+        for name, extra in spec.get('extra', {}).items():
+            self.extra[name] = {
+                'field': extra['field'],
+                'normalize': extra.get('normalize', 'raw'),
+                'map': _resolve(extra['map'], context) if 'map' in extra else None,
+            }
+
+        self.label = _compile_template(spec['label'])
+        self.label_when_blank = _compile_template(spec['label_when_blank']) if 'label_when_blank' in spec else None
+
+    def columns(self):
+        """Return the (field, normalize) pairs this trigger reads."""
+        cols = [(self.field, self.normalize)]
+        cols.extend((extra['field'], extra['normalize']) for extra in self.extra.values())
+        return cols
+
+    def evaluate(self, rows, columns, all_rows=False, value_hits=None):
+        """
+        Evaluate on the candidate rows.
+
+        Matching runs once per distinct normalized value of self.field and is
+        broadcast back to the rows through the column codes.
+
+        Args:
+            rows: Positional row numbers of the candidates
+            columns: Encoded column cache, (field, normalize) -> EncodedColumn
+            all_rows: True when rows covers the whole frame
+            value_hits: Optional boolean array over the column's distinct
+                values; values marked False are known not to match
+
+        Returns:
+            (matched_rows, labels) as aligned ndarrays
+        """
+        column = columns[(self.field, self.normalize)]
+        row_codes = column.codes[rows]
+        present = np.arange(len(column.uniques)) if all_rows else np.unique(row_codes)
+        if value_hits is not None:
+            present = present[value_hits[present]]
+
+        hit, captures = self._match(column.uniques[present])
+        hit_codes = present[hit]
+        hit_by_code = np.zeros(len(column.uniques), dtype=bool)
+        hit_by_code[hit_codes] = True
+        matched = rows[hit_by_code[row_codes]]
+        if not len(matched):
+            return matched, np.array([], dtype=object)
+
+        captures = {name: values[hit] for name, values in captures.items()}
+        captures['column'] = np.full(len(hit_codes), self.field, dtype=object)
+        if self.categories:
+            captures['category'] = np.array([self.categories.get(v, '') for v in captures['value']], dtype=object)
+        if self.refine is not None:
+            captures['match'] = self._refine(column.uniques[hit_codes], captures['value'])
+
+        # Position of each hit value within the capture arrays
+        position = np.full(len(column.uniques), -1, dtype=np.int64)
+        position[hit_codes] = np.arange(len(hit_codes))
+        keys = [position[column.codes[matched]]]
+        extra_columns = [columns[(extra['field'], extra['normalize'])] for extra in self.extra.values()]
+        keys.extend(extra_column.codes[matched] for extra_column in extra_columns)
+
+        # Render once per distinct (value, extras) combination
+        if len(keys) == 1:
+            codes, combos = pd.factorize(keys[0])
+            combos = [(combo,) for combo in combos]
+        else:
+            codes, combos = pd.MultiIndex.from_arrays(keys).factorize()
+        cache = {}
+        rendered = []
+        for combo in combos:
+            values = {name: captures[name][combo[0]] for name in captures}
+            for (name, extra), extra_column, code in zip(self.extra.items(), extra_columns, combo[1:]):
+                value = extra_column.uniques[code]
+                values[name] = extra['map'].get(value, value) if extra['map'] is not None else value
+            key = tuple(values.values())
+            if key not in cache:
+                cache[key] = self._label(values)
+            rendered.append(cache[key])
+        return matched, np.array(rendered, dtype=object)[codes]
+
+    def _match(self, text):
+        """
+        Apply the operation to an array of distinct normalized values.
+        Returns (hit, captures) with capture arrays aligned to text.
+        """
+        captures = {}
+        if self.op == 'in':
+            hit = pd.Series(text, dtype=object).isin(self.values).to_numpy(dtype=bool)
+            captures['value'] = text
+        elif self.op == 'equals':
+            hit = np.fromiter((value == self.values for value in text), dtype=bool, count=len(text))
+            captures['value'] = text
+        elif self.op == 'contains':
+            hit = np.fromiter((self.values in value for value in text), dtype=bool, count=len(text))
+            captures['value'] = np.full(len(text), self.values, dtype=object)
+        elif self.op == 'regex':
+            found = [self.regex.search(value) for value in text]
+            hit = np.array([match is not None for match in found], dtype=bool)
+            captures['value'] = text
+            for name in self.regex.groupindex:
+                captures[name] = np.array([match.group(name) or '' if match else '' for match in found], dtype=object)
+        else:
+            hit, chosen = self._first_of(text)
+            literals = np.array([lit for lit, _ in self.values] + [''], dtype=object)
+            aliases = np.array([alias for _, alias in self.values] + [''], dtype=object)
+            captures['value'] = literals[chosen]
+            captures['alias'] = aliases[chosen]
+        return hit, captures
+
+    def _first_of(self, text):
+        """Return (hit, index of first matching entry) for contains_any/regex_any."""
+        missing = len(self.values)
+        chosen = np.full(len(text), missing, dtype=np.int64)
+        if self.screen is None:
+            return chosen < missing, chosen
+        search = self.screen.search
+        open_rows = np.flatnonzero(np.fromiter((search(value) is not None for value in text), dtype=bool, count=len(text)))
+        for i, (literal, _) in enumerate(self.values):
+            if not len(open_rows):
+                break
+            if self.op == 'contains_any':
+                needle = self.pattern.replace('{value}', literal)
+                found = np.fromiter((needle in text[j] for j in open_rows), dtype=bool, count=len(open_rows))
+            else:
+                search = self.regexes[i].search
+                found = np.fromiter((search(text[j]) is not None for j in open_rows), dtype=bool, count=len(open_rows))
+            chosen[open_rows[found]] = i
+            open_rows = open_rows[~found]
+        return chosen < missing, chosen
+
+    def _refine(self, text, values):
+        """Run the refine regex with each value substituted; '' where it fails."""
+        patterns = {}
+        result = np.full(len(text), '', dtype=object)
+        for i, (value_text, value) in enumerate(zip(text, values)):
+            if value not in patterns:
+                patterns[value] = re.compile(self.refine['pattern'].replace('{value}', re.escape(value)))
+            match = patterns[value].search(value_text)
+            if match:
+                result[i] = match.group(1) if match.re.groups else match.group(0)
+        return result
+
+    def _label(self, values):
+        """Pick the applicable template for one capture combination and render it."""
+        if self.refine is not None and values.get('match'):
+            template = self.refine['label']
+        elif self.label_when_blank is not None and any(values[name] == '' for name in self.extra):
+            template = self.label_when_blank
+        else:
+            template = self.label
+        return _render_template(template, values)
+
+def _map_values(values, func):
+    """Apply func once per distinct value of an object array."""
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([func(v) for v in uniques] + [''], dtype=object)
+    return mapped[codes]
+
+class EncodedColumn:
+    """A normalized column stored as integer codes into its distinct values."""
+
+    def __init__(self, codes, uniques):
+        self.codes = codes
+        self.uniques = uniques
+
+class CompiledFlag:
+    """A flag column and its ordered triggers."""
+
+    def __init__(self, spec, context):
+        self.name = spec['name']
+        self.file_types = [ft.upper() for ft in spec.get('file_types', [])]
+        self.description = spec.get('description', self.name)
+        self.dedupe_segment = spec.get('dedupe_segment')
+        # Changes when the flag's rules, the context data they use or the engine change
+        references = sorted(_context_references(spec))
+        self.fingerprint = fingerprint(ENGINE_VERSION, spec, {name: context.get(name) for name in references})
+        self.triggers = []
+        known_ids = set()
+        for trigger_spec in spec.get('triggers', []):
+            trigger = CompiledTrigger(trigger_spec, context, known_ids)
+            if trigger.id in known_ids:
+                raise ValueError(f"Duplicate trigger id '{trigger.id}' in flag {self.name}")
+            known_ids.add(trigger.id)
+            self.triggers.append(trigger)
+
+    def _dedupe_key(self, label):
+        if ':' not in label:
+            return label
+        pieces = label.split(':')
+        return pieces[self.dedupe_segment] if self.dedupe_segment < len(pieces) else label
+
+class CandidateFilter:
+    """
+    Cheap superset test for a set of flags: a row is a candidate when any of
+    their triggers could match it. Each (field, normalize) column is tested
+    once over its distinct values - exact values with isin, and every
+    substring literal (contains/contains_any patterns, regex_any values) with
+    a single combined case-insensitive scan. A free-form 'regex' trigger
+    cannot be reduced to literals, so it makes every row a candidate.
+    """
+
+    def __init__(self, flags):
+        self.exhaustive = False
+        self.sets = {}
+        literals = {}
+        self.triggers_per_column = {}
+        for flag in flags:
+            for trigger in flag.triggers:
+                key = (trigger.field, trigger.normalize)
+                self.triggers_per_column[key] = self.triggers_per_column.get(key, 0) + 1
+                if trigger.op == 'in':
+                    self.sets.setdefault(key, set()).update(trigger.values)
+                elif trigger.op == 'equals':
+                    self.sets.setdefault(key, set()).add(trigger.values)
+                elif trigger.op == 'contains':
+                    literals.setdefault(key, set()).add(trigger.values)
+                elif trigger.op == 'contains_any':
+                    literals.setdefault(key, set()).update(trigger.pattern.replace('{value}', lit) for lit, _ in trigger.values)
+                elif trigger.op == 'regex_any':
+                    literals.setdefault(key, set()).update(lit for lit, _ in trigger.values)
+                else:
+                    self.exhaustive = True
+        # Matched against lower-cased values; longest first so the alternation
+        # settles on specific literals
+        self.scans = {
+            key: re.compile('|'.join(re.escape(lit) for lit in sorted({l.lower() for l in lits}, key=len, reverse=True)))
+            for key, lits in literals.items()
+        }
+
+    def candidates(self, columns, row_count):
+        """
+        Return (rows, value_hits): the positional row numbers that could match
+        any trigger, and per (field, normalize) column a boolean array over its
+        distinct values marking the ones that could (None when exhaustive).
+        """
+        if self.exhaustive:
+            return np.arange(row_count), None
+        mask = np.zeros(row_count, dtype=bool)
+        value_hits = {}
+        for key in set(self.sets) | set(self.scans):
+            column = columns[key]
+            hit = np.zeros(len(column.uniques), dtype=bool)
+            if key in self.sets:
+                hit |= pd.Series(column.uniques, dtype=object).isin(self.sets[key]).to_numpy(dtype=bool)
+            if key in self.scans:
+                search = self.scans[key].search
+                todo = np.flatnonzero(~hit)
+                hit[todo] = np.fromiter((search(value.lower()) is not None for value in column.uniques[todo]),
+                                        dtype=bool, count=len(todo))
+            value_hits[key] = hit
+            mask |= hit[column.codes]
+        return np.flatnonzero(mask), value_hits
+
+    def value_scans(self, columns, value_hits):
+        """(distinct values the triggers still scan, distinct values the prefilter spared them)."""
+        scanned = skipped = 0
+        for key, count in self.triggers_per_column.items():
+            total = len(columns[key].uniques)
+            kept = int(value_hits[key].sum()) if value_hits and key in value_hits else total
+            scanned += count * kept
+            skipped += count * (total - kept)
+        return scanned, skipped
+
+class CompiledRuleSet:
+    """
+    Evaluation plan for a whole rule pack.
+
+    Every column used by any rule is factorized once per evaluation and each
+    (column, normalization) pair is shared by all triggers of all flags;
+    operations then run over distinct values rather than rows.
+    """
+
+    def __init__(self, rule_pack, context=None):
+        context = context or {}
+        self.version = rule_pack.get('version', 1)
+        self.flags = [CompiledFlag(spec, context) for spec in rule_pack.get('flags', [])]
+        names = [flag.name for flag in self.flags]
+        if len(names) != len(set(names)):
+            raise ValueError("Rule pack defines the same flag more than once")
+        self._candidate_filters = {}
+
+    def flags_for(self, file_type):
+        """Return the compiled flags that apply to a file type, in pack order."""
+        return [flag for flag in self.flags if file_type.upper() in flag.file_types]
+
+    def fingerprints(self, file_type):
+        """Fingerprint of each flag for a file type, by flag name."""
+        return {flag.name: flag.fingerprint for flag in self.flags_for(file_type)}
+
+    def candidate_filter(self, file_type, flag_names=None):
+        """Return the (cached) CandidateFilter for a file type's flags (or the named ones)."""
+        key = (file_type.upper(), tuple(flag_names) if flag_names is not None else None)
+        if key not in self._candidate_filters:
+            self._candidate_filters[key] = CandidateFilter(self._selected_flags(file_type, flag_names))
+        return self._candidate_filters[key]
+
+    def _selected_flags(self, file_type, flag_names=None):
+        flags = self.flags_for(file_type)
+        if flag_names is None:
+            return flags
+        return [flag for flag in flags if flag.name in flag_names]
+
+    def fields_for(self, file_type, flag_names=None):
+        """Return the input columns the flags for a file type (or the named ones) read, in first-use order."""
+        fields = []
+        for flag in self._selected_flags(file_type, flag_names):
+            for trigger in flag.triggers:
+                for field, _ in trigger.columns():
+                    if field not in fields:
+                        fields.append(field)
+        return fields
+
+    def evaluate(self, df, file_type):
+        """
+        Evaluate every flag for file_type over df.
+
+        Returns:
+            Dict of flag name -> Series of pipe-joined trigger labels ('' when
+            nothing matched), aligned to df.index
+        """
+        return self.evaluate_flag_set(df, file_type).render_all()
+
+    def evaluate_flag_set(self, df, file_type, dictionary=None, prefilter=True, flag_names=None):
+        """
+        Evaluate every flag for file_type over df into a FlagSet.
+
+        Args:
+            df: DataFrame or chunk to evaluate
+            file_type: 'SM20', 'CDHDR' or 'CDPOS'
+            dictionary: Optional TriggerDictionary to share trigger IDs across
+                chunks or files
+            prefilter: Run triggers only on rows the CandidateFilter keeps;
+                other rows are left unflagged
+            flag_names: Evaluate only these flags (e.g. the ones whose rules
+                changed, see core/reanalyze.py)
+
+        Returns:
+            FlagSet with one integer-encoded flag per applicable rule flag
+        """
+        flags = self._selected_flags(file_type, flag_names)
+        with profile_stage('detect.encode_columns', rows=len(df)):
+            columns = self._encode_columns(df, flags)
+        n = len(df)
+        candidates = np.arange(n)
+        flag_set = FlagSet(n, dictionary, df.index)
+
+        value_hits = None
+        prefilter_start = time.perf_counter()
+        if prefilter:
+            candidate_filter = self.candidate_filter(file_type, flag_names)
+            with profile_stage('detect.prefilter', rows=n):
+                candidates, value_hits = candidate_filter.candidates(columns, n)
+        prefilter_seconds = time.perf_counter() - prefilter_start
+
+        triggers_start = time.perf_counter()
+        for flag in flags:
+            with profile_stage(f'detect.{flag.name}', rows=len(candidates)):
+                slots = self._evaluate_flag(flag, columns, n, candidates, value_hits, flag_set.dictionary)
+                flag_set.add_flag(flag.name, slots)
+        triggers_seconds = time.perf_counter() - triggers_start
+
+        if prefilter:
+            self._report_prefilter(candidate_filter, columns, n, candidates, value_hits,
+                                   prefilter_seconds, triggers_seconds)
+        return flag_set
+
+    def _report_prefilter(self, candidate_filter, columns, n, candidates, value_hits, prefilter_seconds, triggers_seconds):
+        """
+        Record the candidate ratio and time saved on the active profiler.
+        Trigger cost tracks the distinct values scanned, so the time saved is
+        estimated from the scans the prefilter skipped.
+        """
+        profiler = get_profiler()
+        scanned, skipped = candidate_filter.value_scans(columns, value_hits)
+        estimated = triggers_seconds * skipped / scanned if scanned else 0.0
+        profiler.count('detect.rows', n)
+        profiler.count('detect.candidate_rows', len(candidates))
+        profiler.count('detect.candidate_ratio', round(len(candidates) / n, 4) if n else 0.0)
+        profiler.count('detect.prefilter_seconds', round(prefilter_seconds, 4))
+        profiler.count('detect.values_skipped', skipped)
+        profiler.count('detect.estimated_seconds_saved', round(estimated - prefilter_seconds, 4))
+
+    def _evaluate_flag(self, flag, columns, n, candidates, value_hits, dictionary):
+        """Evaluate one flag's triggers on the candidate rows, returning its (rows, ids) slots."""
+        slots = []
+        matched_by_id = {}
+        keys_so_far = []
+        all_rows = len(candidates) == n
+        for trigger in flag.triggers:
+            rows = candidates
+            if trigger.requires or trigger.unless:
+                keep = np.zeros(n, dtype=bool)
+                keep[candidates] = True
+                for dep in trigger.requires:
+                    keep &= matched_by_id[dep]
+                for dep in trigger.unless:
+                    keep &= ~matched_by_id[dep]
+                rows = np.flatnonzero(keep)
+
+            hits = value_hits.get((trigger.field, trigger.normalize)) if value_hits else None
+            matched, labels = trigger.evaluate(rows, columns, all_rows=all_rows and rows is candidates, value_hits=hits)
+
+            mask = np.zeros(n, dtype=bool)
+            mask[matched] = True
+            matched_by_id[trigger.id] = mask
+
+            if flag.dedupe_segment is not None and len(matched):
+                keys = _map_values(labels, flag._dedupe_key)
+                keep = np.ones(len(matched), dtype=bool)
+                for earlier_mask, earlier_keys in keys_so_far:
+                    keep &= ~(earlier_mask[matched] & (earlier_keys[matched] == keys))
+                full_keys = np.full(n, None, dtype=object)
+                full_keys[matched] = keys
+                keys_so_far.append((mask, full_keys))
+                matched, labels = matched[keep], labels[keep]
+
+            slots.append((matched, dictionary.encode(labels)))
+        return slots
+
+    def _encode_columns(self, df, flags):
+        """
+        Factorize each column used by flags once and normalize its distinct
+        values, so every (field, normalize) pair is computed exactly once.
+        """
+        needed = []
+        for flag in flags:
+            for trigger in flag.triggers:
+                for key in trigger.columns():
+                    if key not in needed:
+                        needed.append(key)
+
+        raw = {}
+        columns = {}
+        for field, normalize in needed:
+            if field not in raw:
+                raw[field] = _encode_field(df, field)
+            codes, uniques = raw[field]
+            normalized = _normalize(pd.Series(uniques, dtype=object), normalize).to_numpy(dtype=object)
+            columns[(field, normalize)] = EncodedColumn(codes, normalized)
+        return columns
+
+def _encode_field(df, field):
+    """Factorize a column into codes and str() of its distinct values ('' if absent)."""
+    if field not in df.columns:
+        return np.zeros(len(df), dtype=np.int64), np.array([''], dtype=object)
+    return get_backend().factorize(df[field])  # missing values render as 'nan'
+
+def _normalize(series, mode):
+    if mode == 'strip':
+        return series.str.strip()
+    if mode == 'upper':
+        return series.str.upper()
+    if mode == 'lower':
+        return series.str.lower()
+    if mode == 'upper_strip':
+        return series.str.upper().str.strip()
+    return series
+
+def compile_rules(rule_pack=None, context=None):
+    """
+    Compile a rule pack into a CompiledRuleSet.
+
+    Args:
+        rule_pack: Rule pack dict or path; defaults to the built-in pack
+        context: Named sets/dicts that rules reference as "$NAME"
+    """
+    if rule_pack is None or isinstance(rule_pack, str):
+        rule_pack = load_rule_pack(rule_pack)
+    return CompiledRuleSet(rule_pack, context)
+
+def main():
+    """Command line interface - validate a rule pack."""
+    rules_file = sys.argv[1] if len(sys.argv) > 1 else None
+    pack = load_rule_pack(rules_file)
+    context = {'HIGH_RISK_TCODES': {}, 'HIGH_RISK_TABLES': set(), 'CHANGE_INDICATORS': {}}
+    rule_set = compile_rules(pack, context)
+    for flag in rule_set.flags:
+        print(f"{flag.name} ({', '.join(flag.file_types)}): {len(flag.triggers)} triggers")
+
+if __name__ == "__main__":
+    main()
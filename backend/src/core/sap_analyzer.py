@@ -8,12 +8,26 @@ Output: Original data + multiple flag columns with detailed trigger information
 """
 
 import pandas as pd
+import numpy as np
 import sys
 import os
 import glob
+import json
 import re
 
+if __package__ in (None, ''):
+    # Run as a script (python core/sap_analyzer.py): make the core package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.burst_detection import BURST_COLUMNS, BURST_FILE_TYPES, BURST_FLAG, burst_fingerprint, detect_bursts
+from core.flag_set import FlagSet
+from core.profiling import profile_stage
+from core.rule_engine import compile_rules, rules_file_path
+from core.sketches import merge_triage
+
 # === CONSTANTS ===
+# These lists back the per-row detect_* functions. The compiled detection plan
+# is built from data/detection_rules.json, whose built-in pack mirrors them.
 
 # Debugging detection constants
 DEBUG_EVENT_CODES = [
@@ -114,17 +128,50 @@ CHANGE_INDICATORS = {
     'K': 'Key Delete'
 }
 
+# Columns the per-row detectors read, by file type (projection when the rule pack is unavailable)
+LEGACY_DETECTION_COLUMNS = {
+    'SM20': ['EVENT', 'TRANSACTION_CODE', 'MESSAGE_TEXT', 'ABAP_SOURCE', 'SOURCE_TA',
+             'VARIABLE1', 'VARIABLE2', 'VARIABLE3'],
+    'CDHDR': ['TRANSACTION_CODE', 'MESSAGE_TEXT'],
+    'CDPOS': ['TABLE NAME', 'CHANGE INDICATOR'],
+}
+
+# Rows per chunk when streaming passthrough columns to the analyzed output
+PASSTHROUGH_CHUNK_ROWS = 200000
+
+# Lookup files behind the high-risk detectors
+HIGH_RISK_TABLES_FILE = 'data/high_risk_tables.csv'
+HIGH_RISK_TCODES_FILE = 'data/high_risk_tcodes.csv'
+
 # === GLOBAL VARIABLES ===
 HIGH_RISK_TABLES = set()
 HIGH_RISK_TCODES = {}
 
+# (absolute path, mtime_ns, size) of the files the detection state was built from
+DETECTION_DATA_SIGNATURE = ()
+
+def detection_data_files():
+    """Files the detection state is built from (lookup CSVs and the active rule pack)."""
+    return [HIGH_RISK_TABLES_FILE, HIGH_RISK_TCODES_FILE, rules_file_path()]
+
+def _detection_data_signature():
+    """DETECTION_DATA_SIGNATURE of the detection data files as they are now."""
+    signature = []
+    for path in map(os.path.abspath, detection_data_files()):
+        try:
+            st = os.stat(path)
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
 def _load_lookup_data():
     """Load lookup data from CSV files."""
     global HIGH_RISK_TABLES, HIGH_RISK_TCODES
     
     # Load high-risk tables
     try:
-        hr_tables_df = pd.read_csv('data/high_risk_tables.csv')
+        hr_tables_df = pd.read_csv(HIGH_RISK_TABLES_FILE)
         HIGH_RISK_TABLES = set(hr_tables_df['Table'].str.upper())
         print(f"Loaded {len(HIGH_RISK_TABLES)} high-risk tables for monitoring")
     except Exception as e:
@@ -133,7 +180,7 @@ def _load_lookup_data():
     
     # Load high-risk transaction codes
     try:
-        df = pd.read_csv('data/high_risk_tcodes.csv')
+        df = pd.read_csv(HIGH_RISK_TCODES_FILE)
         HIGH_RISK_TCODES = dict(zip(df['TCode'].str.upper(), df['Category']))
         print(f"Loaded {len(HIGH_RISK_TCODES)} high-risk transaction codes")
     except Exception as e:
@@ -141,8 +188,70 @@ def _load_lookup_data():
         HIGH_RISK_TCODES = {}
 
 # Load lookup data when module is imported
+DETECTION_DATA_SIGNATURE = _detection_data_signature()
 _load_lookup_data()
 
+# Compiled detection plan built from data/detection_rules.json
+DETECTION_RULES = None
+
+def _compile_detection_rules():
+    """Compile the detection rule pack against the loaded lookup data."""
+    global DETECTION_RULES
+    
+    try:
+        DETECTION_RULES = compile_rules(context={
+            'HIGH_RISK_TCODES': HIGH_RISK_TCODES,
+            'HIGH_RISK_TABLES': HIGH_RISK_TABLES,
+            'CHANGE_INDICATORS': CHANGE_INDICATORS,
+        })
+        print(f"Compiled {len(DETECTION_RULES.flags)} detection flags from rule pack")
+    except Exception as e:
+        print(f"Warning: Could not compile detection rules, using per-row detectors: {e}")
+        DETECTION_RULES = None
+
+_compile_detection_rules()
+
+def reload_detection_data():
+    """Reload the high-risk lookups and recompile the rule pack (after the data files change)."""
+    global DETECTION_DATA_SIGNATURE
+    DETECTION_DATA_SIGNATURE = _detection_data_signature()
+    _load_lookup_data()
+    _compile_detection_rules()
+    return DETECTION_RULES
+
+# Sidecar of an analyzed file recording which rules produced its flags
+FLAG_MANIFEST_SUFFIX = '.flags.json'
+
+def flag_fingerprints(file_type):
+    """
+    Fingerprint of each rule-derived flag of a file type: a hash of its rules,
+    the lookup data they use and the engine version (see core/reanalyze.py).
+    Empty when the per-row detectors are in use.
+    """
+    if DETECTION_RULES is None:
+        return {}
+    fingerprints = DETECTION_RULES.fingerprints(file_type)
+    if file_type in BURST_FILE_TYPES:
+        fingerprints[BURST_FLAG] = burst_fingerprint(fingerprints)
+    return fingerprints
+
+def flag_manifest_path(analyzed_file):
+    return analyzed_file + FLAG_MANIFEST_SUFFIX
+
+def write_flag_manifest(analyzed_file, file_type, rows, fingerprints):
+    """Record the fingerprints of the flags in analyzed_file next to it."""
+    manifest = {'file_type': file_type, 'rows': rows, 'rules_file': rules_file_path(), 'flags': fingerprints}
+    with open(flag_manifest_path(analyzed_file), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def read_flag_manifest(analyzed_file):
+    """The manifest written with analyzed_file, or None."""
+    try:
+        with open(flag_manifest_path(analyzed_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 # === HELPER FUNCTIONS ===
 
 def _check_text_for_pattern(text, pattern):
@@ -418,10 +527,144 @@ def detect_other_flags(row):
     else:
         return ''
 
-def analyze_sap_activities(input_file, output_file=None):
+# Per-row detectors used when the rule pack cannot be compiled:
+# (flag column, detector, description, file types)
+LEGACY_DETECTORS = [
+    ('DEBUG_FLAG', detect_debugging, 'debugging activities', ['SM20']),
+    ('TABLE_MAINT_FLAG', detect_table_maintenance, 'table maintenance activities', ['SM20']),
+    ('HIGH_RISK_TCODE_FLAG', detect_high_risk_tcode, 'high-risk transaction code activities', ['SM20', 'CDHDR']),
+    ('HIGH_RISK_TABLE_FLAG', detect_high_risk_table, 'high-risk table modifications', ['CDPOS']),
+    ('OTHER_FLAGS', detect_other_flags, 'other flag activities (Security/Config/Transport/JobSchedule)', ['SM20']),
+]
+
+def detect_flags(df, file_type, dictionary=None):
+    """
+    Compute every detection flag for a file type.
+    
+    Returns:
+        (FlagSet, [(flag column, description), ...]) in output column order
+    """
+    if DETECTION_RULES is not None:
+        flag_set = DETECTION_RULES.evaluate_flag_set(df, file_type, dictionary)
+        descriptions = [(flag.name, flag.description) for flag in DETECTION_RULES.flags_for(file_type)]
+        return flag_set, descriptions
+    
+    detectors = [entry for entry in LEGACY_DETECTORS if file_type in entry[3]]
+    columns = {}
+    for name, detector, _, _ in detectors:
+        with profile_stage(f'detect.{name}', rows=len(df)):
+            columns[name] = df.apply(detector, axis=1) if len(df) else pd.Series('', index=df.index, dtype=object)
+    flag_set = FlagSet.from_strings(columns, dictionary, df.index)
+    return flag_set, [(name, description) for name, _, description, _ in detectors]
+
+def detection_columns(file_type):
+    """Columns detection reads for a file type; everything else is passthrough."""
+    if DETECTION_RULES is not None:
+        columns = DETECTION_RULES.fields_for(file_type)
+    else:
+        columns = list(LEGACY_DETECTION_COLUMNS.get(file_type, []))
+    if file_type in BURST_FILE_TYPES:
+        columns += [column for column in BURST_COLUMNS if column not in columns]
+    return columns
+
+def _read_detection_columns(input_file, file_type, columns=None):
+    """Read only the detection columns (or the given ones) of a cleaned CSV, as strings."""
+    header = pd.read_csv(input_file, encoding='utf-8-sig', nrows=0).columns
+    wanted = set(detection_columns(file_type) if columns is None else columns)
+    usecols = [col for col in header if col in wanted]
+    if not usecols:
+        usecols = list(header[:1])  # keep the row count
+    return pd.read_csv(input_file, encoding='utf-8-sig', usecols=usecols,
+                       dtype={col: str for col in usecols})
+
+def _write_with_passthrough(input_file, output_file, flag_columns):
+    """
+    Stream the input CSV to output_file in chunks, with its columns passed
+    through as text and the flag columns attached positionally.
+    """
+    start = 0
+    reader = pd.read_csv(input_file, encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                         chunksize=PASSTHROUGH_CHUNK_ROWS)
+    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+        for chunk in reader:
+            stop = start + len(chunk)
+            for flag_name, values in flag_columns.items():
+                chunk[flag_name] = values[start:stop]
+            chunk.to_csv(f, index=False, header=(start == 0))
+            start = stop
+        if start == 0:
+            header = pd.read_csv(input_file, encoding='utf-8-sig', nrows=0).columns
+            pd.DataFrame(columns=list(header) + [c for c in flag_columns if c not in header]).to_csv(f, index=False)
+    
+    rows = len(next(iter(flag_columns.values()))) if flag_columns else start
+    if start != rows:
+        raise ValueError(f"Passthrough read {start} rows but detection produced {rows}")
+
+def analyze_dataframe(df, file_type, dictionary=None):
+    """
+    Run detection on an in-memory DataFrame and report what was found.
+    Flags stay integer-encoded; call flag_set.render(name) to get the strings.
+    
+    Returns:
+        (FlagSet, [(flag column, description), ...])
+    """
+    print("\nApplying activity detection...")
+    
+    flag_set, descriptions = detect_flags(df, file_type, dictionary)
+    if not descriptions:
+        print("  - Warning: Unknown file type, no flags applied")
+    
+    for flag_name, description in descriptions:
+        print(f"  - Found {flag_set.count(flag_name)} {description}")
+    
+    # Show sample of activities found for each flag
+    for flag_name, description in descriptions:
+        if flag_set.count(flag_name) > 0:
+            print(f"\nSample {description}:")
+            for pattern, count in flag_set.combination_counts(flag_name, top=5):
+                print(f"  {pattern}: {count} occurrences")
+    
+    return flag_set, descriptions
+
+def summarize_flags(flag_set, descriptions):
+    """Summary shown by the frontend, computed on the flag bitsets."""
+    flagged = np.zeros(flag_set.row_count, dtype=bool)
+    for flag_name, _ in descriptions:
+        flagged |= flag_set.mask(flag_name)
+    return {
+        'total_records': flag_set.row_count,
+        'flagged_records': int(flagged.sum()),
+        'flag_counts': {flag_name: flag_set.count(flag_name) for flag_name, _ in descriptions},
+    }
+
+def combine_summaries(summaries):
+    """Totals across chunks, or across the exports of a multi-file upload."""
+    if len(summaries) == 1:
+        return summaries[0]
+    flag_counts = {}
+    for summary in summaries:
+        for flag_name, count in summary['flag_counts'].items():
+            flag_counts[flag_name] = flag_counts.get(flag_name, 0) + count
+    combined = {
+        'total_records': sum(summary['total_records'] for summary in summaries),
+        'flagged_records': sum(summary['flagged_records'] for summary in summaries),
+        'flag_counts': flag_counts,
+    }
+    # Triage sketches (core/sketches.py) merge like the counts do
+    triage = [summary['triage'] for summary in summaries if summary.get('triage')]
+    if triage:
+        combined['triage'] = merge_triage(triage)
+    return combined
+
+def analyze_sap_activities(input_file, output_file=None, projection=True):
     """
     Analyze a cleaned SAP file for multiple activity types.
     Detects file type (SM20, CDHDR, CDPOS) and applies appropriate flags.
+    
+    With projection (the default) only the detection columns are loaded; the
+    other columns are streamed from the input to the output at write time, so
+    wide exports never sit in memory in full. The returned DataFrame then holds
+    the detection columns plus the flag columns.
     """
     print(f"\nAnalyzing SAP activities in: {input_file}")
     
@@ -439,91 +682,24 @@ def analyze_sap_activities(input_file, output_file=None):
     
     # Read the cleaned CSV
     try:
-        df = pd.read_csv(input_file, encoding='utf-8-sig')
+        with profile_stage('analyze.read', bytes_read=os.path.getsize(input_file)) as stage:
+            if projection:
+                df = _read_detection_columns(input_file, file_type)
+            else:
+                df = pd.read_csv(input_file, encoding='utf-8-sig')
+            stage.rows = len(df)
         print(f"Loaded {len(df)} records")
     except Exception as e:
         print(f"Error reading file: {e}")
         return None
     
-    # Apply detection functions based on file type
-    print("\nApplying activity detection...")
+    flag_set, descriptions = analyze_dataframe(df, file_type)
+    detect_bursts(df, file_type, flag_set, descriptions)
     
-    if file_type == 'SM20':
-        # SM20 gets all flags
-        # Add DEBUG_FLAG column
-        df['DEBUG_FLAG'] = df.apply(detect_debugging, axis=1)
-        debug_count = (df['DEBUG_FLAG'] != '').sum()
-        print(f"  - Found {debug_count} debugging activities")
-        
-        # Add TABLE_MAINT_FLAG column
-        df['TABLE_MAINT_FLAG'] = df.apply(detect_table_maintenance, axis=1)
-        table_maint_count = (df['TABLE_MAINT_FLAG'] != '').sum()
-        print(f"  - Found {table_maint_count} table maintenance activities")
-        
-        # Add HIGH_RISK_TCODE_FLAG column
-        df['HIGH_RISK_TCODE_FLAG'] = df.apply(detect_high_risk_tcode, axis=1)
-        high_risk_count = (df['HIGH_RISK_TCODE_FLAG'] != '').sum()
-        print(f"  - Found {high_risk_count} high-risk transaction code activities")
-        
-        # Add OTHER_FLAGS column (Security, Config, Transport, Job Schedule)
-        df['OTHER_FLAGS'] = df.apply(detect_other_flags, axis=1)
-        other_flags_count = (df['OTHER_FLAGS'] != '').sum()
-        print(f"  - Found {other_flags_count} other flag activities (Security/Config/Transport/JobSchedule)")
-        
-    elif file_type == 'CDHDR':
-        # CDHDR gets HIGH_RISK_TCODE_FLAG
-        df['HIGH_RISK_TCODE_FLAG'] = df.apply(detect_high_risk_tcode, axis=1)
-        high_risk_count = (df['HIGH_RISK_TCODE_FLAG'] != '').sum()
-        print(f"  - Found {high_risk_count} high-risk transaction code activities")
-        
-    elif file_type == 'CDPOS':
-        # CDPOS gets HIGH_RISK_TABLE_FLAG
-        df['HIGH_RISK_TABLE_FLAG'] = df.apply(detect_high_risk_table, axis=1)
-        high_risk_table_count = (df['HIGH_RISK_TABLE_FLAG'] != '').sum()
-        print(f"  - Found {high_risk_table_count} high-risk table modifications")
-    
-    else:
-        print("  - Warning: Unknown file type, no flags applied")
-    
-    # Show sample of activities found based on file type
-    if file_type == 'SM20':
-        if 'debug_count' in locals() and debug_count > 0:
-            print("\nSample debugging activities:")
-            debug_samples = df[df['DEBUG_FLAG'] != '']['DEBUG_FLAG'].value_counts().head(5)
-            for pattern, count in debug_samples.items():
-                print(f"  {pattern}: {count} occurrences")
-        
-        if 'table_maint_count' in locals() and table_maint_count > 0:
-            print("\nSample table maintenance activities:")
-            table_samples = df[df['TABLE_MAINT_FLAG'] != '']['TABLE_MAINT_FLAG'].value_counts().head(5)
-            for pattern, count in table_samples.items():
-                print(f"  {pattern}: {count} occurrences")
-        
-        if 'high_risk_count' in locals() and high_risk_count > 0:
-            print("\nSample high-risk transaction code activities:")
-            high_risk_samples = df[df['HIGH_RISK_TCODE_FLAG'] != '']['HIGH_RISK_TCODE_FLAG'].value_counts().head(5)
-            for pattern, count in high_risk_samples.items():
-                print(f"  {pattern}: {count} occurrences")
-        
-        if 'other_flags_count' in locals() and other_flags_count > 0:
-            print("\nSample other flag activities:")
-            other_samples = df[df['OTHER_FLAGS'] != '']['OTHER_FLAGS'].value_counts().head(5)
-            for pattern, count in other_samples.items():
-                print(f"  {pattern}: {count} occurrences")
-                
-    elif file_type == 'CDHDR':
-        if 'high_risk_count' in locals() and high_risk_count > 0:
-            print("\nSample high-risk transaction code activities:")
-            high_risk_samples = df[df['HIGH_RISK_TCODE_FLAG'] != '']['HIGH_RISK_TCODE_FLAG'].value_counts().head(5)
-            for pattern, count in high_risk_samples.items():
-                print(f"  {pattern}: {count} occurrences")
-                
-    elif file_type == 'CDPOS':
-        if 'high_risk_table_count' in locals() and high_risk_table_count > 0:
-            print("\nSample high-risk table modifications:")
-            table_samples = df[df['HIGH_RISK_TABLE_FLAG'] != '']['HIGH_RISK_TABLE_FLAG'].value_counts().head(5)
-            for pattern, count in table_samples.items():
-                print(f"  {pattern}: {count} occurrences")
+    # Render flag strings only now, for the output file
+    with profile_stage('analyze.render', rows=len(df)):
+        for flag_name, _ in descriptions:
+            df[flag_name] = flag_set.render(flag_name)
     
     # Save output
     if output_file is None:
@@ -536,7 +712,14 @@ def analyze_sap_activities(input_file, output_file=None):
         output_file = f"output/{base_name}_analyzed.csv"
     
     try:
-        df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        with profile_stage('analyze.write', rows=len(df)) as stage:
+            if projection:
+                flag_columns = {flag_name: df[flag_name].to_numpy() for flag_name, _ in descriptions}
+                _write_with_passthrough(input_file, output_file, flag_columns)
+            else:
+                df.to_csv(output_file, index=False, encoding='utf-8-sig')
+            stage.bytes_written = os.path.getsize(output_file)
+        write_flag_manifest(output_file, file_type, len(df), flag_fingerprints(file_type))
         print(f"\nSaved analyzed data to: {output_file}")
     except Exception as e:
         print(f"Error saving file: {e}")
@@ -8,15 +8,44 @@ Creates 3 CSV files that can be imported into Excel.
 import pandas as pd
 import os
 import glob
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+if __package__ in (None, ''):
+    # Run as a script (python core/sap_output_generator.py): make the core package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.dataframe_backend import get_backend
+from core.event_templates import VARIABLE_COLUMNS, compile_templates, render_descriptions
+from core.flag_set import FlagSet
+from core.profiling import profile_stage
+from core.result_store import ResultStore
+from core.table_index import TableDescriptionIndex
+
 # Constants
 ENCODING_OPTIONS = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252']
 
+# Prebuilt table description index (see core/table_index.py); tables.csv is
+# only loaded into memory when the index has not been built.
+TABLE_INDEX_FILE = 'data/tables.idx'
+
+# Every file LookupManager reads, so caches can tell when lookups changed
+LOOKUP_FILES = [
+    TABLE_INDEX_FILE, 'data/tables.csv', 'data/events.csv', 'data/tcodes.csv', 'data/fields.csv',
+    'data/object class.csv', 'data/change indicators.csv', 'data/ACTVT.csv', 'data/ABAP source.xlsx',
+]
+
+# Threads used to load lookup files concurrently (cold starts)
+LOOKUP_LOAD_THREADS = 4
+
+# Result store root (directory or s3://bucket/prefix) reports are appended to, if set
+RESULT_STORE_ENV = 'SAP_RESULT_STORE'
+
 class LookupManager:
     """Manages all lookup data from CSV files."""
     
-    def __init__(self):
+    def __init__(self, parallel=False):
         self.tables_dict = {}
         self.events_dict = {}
         self.tcodes_dict = {}
@@ -25,7 +54,8 @@ class LookupManager:
         self.object_classes_dict = {}
         self.change_indicators_dict = {}
         self.abap_sources_dict = {}
-        self.load_all_lookups()
+        self.event_templates = {}
+        self.load_all_lookups(parallel)
     
     def _load_csv_with_encoding(self, filename, key_col, value_col, description):
         """Load CSV file with multiple encoding attempts."""
@@ -47,41 +77,72 @@ class LookupManager:
             print(f"  - Warning: Could not load {filename}: {e}")
             return {}
 
-    def load_all_lookups(self):
-        """Load all lookup files from data directory."""
-        print("Loading lookup tables...")
-        
-        # Load all CSV lookups using helper method
-        self.tables_dict = self._load_csv_with_encoding('tables.csv', 'Table', 'Table Description', 'table descriptions')
-        self.events_dict = self._load_csv_with_encoding('events.csv', 'Event', 'Event Description', 'event descriptions')
-        self.tcodes_dict = self._load_csv_with_encoding('tcodes.csv', 'TCode', 'TCode Description', 'tcode descriptions')
-        self.fields_dict = self._load_csv_with_encoding('fields.csv', 'Field', 'Field Description', 'field descriptions')
-        self.object_classes_dict = self._load_csv_with_encoding('object class.csv', 'Object Class', 'Object Class Description', 'object class descriptions')
-        self.change_indicators_dict = self._load_csv_with_encoding('change indicators.csv', 'Change Indicator', 'Description', 'change indicator descriptions')
-        
-        # Load ACTVT.csv (special handling for Activity Code as string)
+    def _load_table_descriptions(self):
+        """Open the memory-mapped table index, falling back to tables.csv."""
+        if os.path.exists(TABLE_INDEX_FILE):
+            try:
+                index = TableDescriptionIndex(TABLE_INDEX_FILE)
+                print(f"  - Mapped {len(index)} table descriptions from {TABLE_INDEX_FILE}")
+                return index
+            except Exception as e:
+                print(f"  - Warning: Could not open {TABLE_INDEX_FILE}: {e}")
+        return self._load_csv_with_encoding('tables.csv', 'Table', 'Table Description', 'table descriptions')
+
+    def _load_activities(self):
+        """Load ACTVT.csv (special handling for Activity Code as string)."""
         try:
             activities_df = pd.read_csv('data/ACTVT.csv')
-            self.activities_dict = dict(zip(
+            activities_dict = dict(zip(
                 activities_df['Activity Code'].astype(str), 
                 activities_df['Description']
             ))
-            print(f"  - Loaded {len(self.activities_dict)} activity descriptions")
+            print(f"  - Loaded {len(activities_dict)} activity descriptions")
+            return activities_dict
         except Exception as e:
             print(f"  - Warning: Could not load ACTVT.csv: {e}")
-            self.activities_dict = {}
-        
-        # Load ABAP source.xlsx (Excel file)
+            return {}
+    
+    def _load_abap_sources(self):
+        """Load ABAP source.xlsx (Excel file)."""
         try:
             abap_df = pd.read_excel('data/ABAP source.xlsx')
-            self.abap_sources_dict = dict(zip(
+            abap_sources_dict = dict(zip(
                 abap_df['ABAP_SOURCE'], 
                 abap_df['ABAP Source Description']
             ))
-            print(f"  - Loaded {len(self.abap_sources_dict)} ABAP source descriptions")
+            print(f"  - Loaded {len(abap_sources_dict)} ABAP source descriptions")
+            return abap_sources_dict
         except Exception as e:
             print(f"  - Warning: Could not load ABAP source.xlsx: {e}")
-            self.abap_sources_dict = {}
+            return {}
+    
+    def load_all_lookups(self, parallel=False):
+        """Load all lookup files from data directory (concurrently when parallel)."""
+        print("Loading lookup tables...")
+        
+        loaders = {
+            # Table descriptions come from the compact index when available
+            'tables_dict': self._load_table_descriptions,
+            'events_dict': lambda: self._load_csv_with_encoding('events.csv', 'Event', 'Event Description', 'event descriptions'),
+            'tcodes_dict': lambda: self._load_csv_with_encoding('tcodes.csv', 'TCode', 'TCode Description', 'tcode descriptions'),
+            'fields_dict': lambda: self._load_csv_with_encoding('fields.csv', 'Field', 'Field Description', 'field descriptions'),
+            'object_classes_dict': lambda: self._load_csv_with_encoding('object class.csv', 'Object Class', 'Object Class Description', 'object class descriptions'),
+            'change_indicators_dict': lambda: self._load_csv_with_encoding('change indicators.csv', 'Change Indicator', 'Description', 'change indicator descriptions'),
+            'activities_dict': self._load_activities,
+            'abap_sources_dict': self._load_abap_sources,
+        }
+        
+        if parallel:
+            with ThreadPoolExecutor(max_workers=LOOKUP_LOAD_THREADS) as pool:
+                futures = {attr: pool.submit(loader) for attr, loader in loaders.items()}
+                for attr, future in futures.items():
+                    setattr(self, attr, future.result())
+        else:
+            for attr, loader in loaders.items():
+                setattr(self, attr, loader())
+
+        # Event descriptions are message templates, compiled once per load
+        self.event_templates = compile_templates(self.events_dict)
 
 def augment_table_maint_flag(flag_value, lookup_manager):
     """Augment TABLE_MAINT_FLAG with table and activity descriptions."""
@@ -121,6 +182,12 @@ def augment_table_maint_flag(flag_value, lookup_manager):
     
     return ' | '.join(augmented_parts)
 
+def _column_as_str(df, col):
+    """Return a column rendered with str(), or empty strings if it is absent."""
+    if col in df.columns:
+        return df[col].astype(str)
+    return pd.Series('', index=df.index, dtype=object)
+
 def _add_lookup_column(df, source_col, lookup_dict, new_col_name, position_after=None):
     """Helper function to add lookup description column after source column."""
     if source_col in df.columns:
@@ -128,27 +195,42 @@ def _add_lookup_column(df, source_col, lookup_dict, new_col_name, position_after
             position_after = source_col
         idx = df.columns.get_loc(position_after) + 1
         df.insert(idx, new_col_name, 
-                 df[source_col].apply(lambda x: lookup_dict.get(str(x).strip(), '') if pd.notna(x) else ''))
+                 get_backend().map_lookup(df[source_col], lookup_dict))
     return df
 
+def _add_event_description_column(df, lookup_manager):
+    """Add EVENT_DESCRIPTION after EVENT, with the event's VARIABLE1-3 filled into its template."""
+    if 'EVENT' in df.columns:
+        variables = [df[col] if col in df.columns else None for col in VARIABLE_COLUMNS]
+        df.insert(df.columns.get_loc('EVENT') + 1, 'EVENT_DESCRIPTION',
+                  render_descriptions(df['EVENT'], variables, lookup_manager.event_templates))
+    return df
+
+def _augment_table_maint_column(series, lookup_manager, flag_set=None):
+    """
+    Augment a TABLE_MAINT_FLAG column, formatting each distinct trigger once.
+    Uses the analyzer's FlagSet when given, otherwise splits each distinct
+    cell value once to build one.
+    """
+    if flag_set is None or 'TABLE_MAINT_FLAG' not in flag_set.flags:
+        flag_set = FlagSet.from_strings({'TABLE_MAINT_FLAG': series})
+    augmented = flag_set.render('TABLE_MAINT_FLAG', label_map=lambda label: augment_table_maint_flag(label, lookup_manager))
+    augmented.index = series.index
+    return augmented
+
 def _generate_key_column(df, key_parts):
     """Generate a KEY column from specified parts."""
-    def make_key(row):
-        parts = []
-        for part in key_parts:
-            value = str(row.get(part, ''))
-            parts.append(value)
-        return '_'.join(parts)
-    
-    return df.apply(make_key, axis=1)
+    parts = [_column_as_str(df, part) for part in key_parts]
+    return parts[0].str.cat(parts[1:], sep='_')
 
-def process_sm20_data(df, lookup_manager):
-    """Process SM20 data with augmentations."""
+def process_sm20_data(df, lookup_manager, flag_set=None):
+    """Process SM20 data with augmentations (modifies df in place and returns it)."""
     print("\nProcessing SM20 data...")
-    df_output = df.copy()
+    df_output = df
     
     # 1. Add KEY column as first column
-    df_output.insert(0, 'KEY', _generate_key_column(df_output, ['USER', 'DATE', 'TIME']))
+    with profile_stage('enrich.SM20.key', rows=len(df_output)):
+        df_output.insert(0, 'KEY', _generate_key_column(df_output, ['USER', 'DATE', 'TIME']))
     
     # 2. Rename transaction code columns to TCODE if needed
     if 'TCODE' not in df_output.columns:
@@ -158,28 +240,29 @@ def process_sm20_data(df, lookup_manager):
             df_output.rename(columns={'TRANSACTION_CODE': 'TCODE'}, inplace=True)
     
     # 3. Add lookup columns
-    df_output = _add_lookup_column(df_output, 'EVENT', lookup_manager.events_dict, 'EVENT_DESCRIPTION')
-    df_output = _add_lookup_column(df_output, 'TCODE', lookup_manager.tcodes_dict, 'TCODE_DESCRIPTION')
-    df_output = _add_lookup_column(df_output, 'ABAP_SOURCE', lookup_manager.abap_sources_dict, 'ABAP_SOURCE_DESCRIPTION')
+    with profile_stage('enrich.SM20.lookups', rows=len(df_output)):
+        df_output = _add_event_description_column(df_output, lookup_manager)
+        df_output = _add_lookup_column(df_output, 'TCODE', lookup_manager.tcodes_dict, 'TCODE_DESCRIPTION')
+        df_output = _add_lookup_column(df_output, 'ABAP_SOURCE', lookup_manager.abap_sources_dict, 'ABAP_SOURCE_DESCRIPTION')
     
     # 6. Augment TABLE_MAINT_FLAG with descriptions
     if 'TABLE_MAINT_FLAG' in df_output.columns:
-        df_output['TABLE_MAINT_FLAG'] = df_output['TABLE_MAINT_FLAG'].apply(
-            lambda x: augment_table_maint_flag(x, lookup_manager)
-        )
+        with profile_stage('enrich.SM20.table_maint', rows=len(df_output)):
+            df_output['TABLE_MAINT_FLAG'] = _augment_table_maint_column(df_output['TABLE_MAINT_FLAG'], lookup_manager, flag_set)
     
     return df_output
 
-def process_cdhdr_data(df, lookup_manager):
-    """Process CDHDR data with augmentations."""
+def process_cdhdr_data(df, lookup_manager, flag_set=None):
+    """Process CDHDR data with augmentations (modifies df in place and returns it)."""
     print("\nProcessing CDHDR data...")
-    df_output = df.copy()
+    df_output = df
     
     # 1. Add KEY column as first column - try multiple user column variations
     user_col = 'USERNAME' if 'USERNAME' in df_output.columns else 'USERN' if 'USERN' in df_output.columns else 'USER'
     date_col = 'UDATE' if 'UDATE' in df_output.columns else 'DATE'
     time_col = 'UTIME' if 'UTIME' in df_output.columns else 'TIME'
-    df_output.insert(0, 'KEY', _generate_key_column(df_output, [user_col, date_col, time_col]))
+    with profile_stage('enrich.CDHDR.key', rows=len(df_output)):
+        df_output.insert(0, 'KEY', _generate_key_column(df_output, [user_col, date_col, time_col]))
     
     # 2. Rename transaction code columns to TCODE if needed
     if 'TCODE' not in df_output.columns:
@@ -189,56 +272,61 @@ def process_cdhdr_data(df, lookup_manager):
             df_output.rename(columns={'TRANSACTION_CODE': 'TCODE'}, inplace=True)
     
     # 3. Add TCode Description
-    df_output = _add_lookup_column(df_output, 'TCODE', lookup_manager.tcodes_dict, 'TCODE_DESCRIPTION')
+    with profile_stage('enrich.CDHDR.lookups', rows=len(df_output)):
+        df_output = _add_lookup_column(df_output, 'TCODE', lookup_manager.tcodes_dict, 'TCODE_DESCRIPTION')
     
     # 4. Augment TABLE_MAINT_FLAG if present
     if 'TABLE_MAINT_FLAG' in df_output.columns:
-        df_output['TABLE_MAINT_FLAG'] = df_output['TABLE_MAINT_FLAG'].apply(
-            lambda x: augment_table_maint_flag(x, lookup_manager)
-        )
+        with profile_stage('enrich.CDHDR.table_maint', rows=len(df_output)):
+            df_output['TABLE_MAINT_FLAG'] = _augment_table_maint_column(df_output['TABLE_MAINT_FLAG'], lookup_manager, flag_set)
     
     return df_output
 
-def process_cdpos_data(df, lookup_manager):
-    """Process CDPOS data with augmentations."""
+def process_cdpos_data(df, lookup_manager, flag_set=None):
+    """Process CDPOS data with augmentations (modifies df in place and returns it)."""
     print("\nProcessing CDPOS data...")
-    df_output = df.copy()
+    df_output = df
     
     # 1. Add KEY column as first column - handle table name variations
     table_col = 'TABLE NAME' if 'TABLE NAME' in df_output.columns else 'TABNAME'
-    def make_cdpos_key(row):
-        changenr = str(row.get('CHANGENR', ''))
-        table_name = str(row.get(table_col, ''))
-        tabkey = str(row.get('TABKEY', ''))[:50]  # Truncate to 50 chars
-        return f"{changenr}_{table_name}_{tabkey}"
-    
-    df_output.insert(0, 'KEY', df_output.apply(make_cdpos_key, axis=1))
+    with profile_stage('enrich.CDPOS.key', rows=len(df_output)):
+        changenr = _column_as_str(df_output, 'CHANGENR')
+        table_name = _column_as_str(df_output, table_col)
+        tabkey = _column_as_str(df_output, 'TABKEY').str[:50]  # Truncate to 50 chars
+        df_output.insert(0, 'KEY', changenr.str.cat([table_name, tabkey], sep='_'))
     
     # 2. Add lookup columns for various field variations
-    table_col = 'TABLE NAME' if 'TABLE NAME' in df_output.columns else 'TABNAME' if 'TABNAME' in df_output.columns else None
-    if table_col:
-        df_output = _add_lookup_column(df_output, table_col, lookup_manager.tables_dict, 'TABLE_DESCRIPTION')
+    with profile_stage('enrich.CDPOS.lookups', rows=len(df_output)):
+        table_col = 'TABLE NAME' if 'TABLE NAME' in df_output.columns else 'TABNAME' if 'TABNAME' in df_output.columns else None
+        if table_col:
+            df_output = _add_lookup_column(df_output, table_col, lookup_manager.tables_dict, 'TABLE_DESCRIPTION')
     
-    obj_col = 'OBJECT' if 'OBJECT' in df_output.columns else 'OBJECTCLAS' if 'OBJECTCLAS' in df_output.columns else None
-    if obj_col:
-        df_output = _add_lookup_column(df_output, obj_col, lookup_manager.object_classes_dict, 'OBJECT_CLASS_DESCRIPTION')
+        obj_col = 'OBJECT' if 'OBJECT' in df_output.columns else 'OBJECTCLAS' if 'OBJECTCLAS' in df_output.columns else None
+        if obj_col:
+            df_output = _add_lookup_column(df_output, obj_col, lookup_manager.object_classes_dict, 'OBJECT_CLASS_DESCRIPTION')
     
-    field_col = 'FIELD NAME' if 'FIELD NAME' in df_output.columns else 'FNAME' if 'FNAME' in df_output.columns else None
-    if field_col:
-        df_output = _add_lookup_column(df_output, field_col, lookup_manager.fields_dict, 'FIELD_DESCRIPTION')
+        field_col = 'FIELD NAME' if 'FIELD NAME' in df_output.columns else 'FNAME' if 'FNAME' in df_output.columns else None
+        if field_col:
+            df_output = _add_lookup_column(df_output, field_col, lookup_manager.fields_dict, 'FIELD_DESCRIPTION')
     
-    chng_col = 'CHANGE INDICATOR' if 'CHANGE INDICATOR' in df_output.columns else 'CHNGIND' if 'CHNGIND' in df_output.columns else None
-    if chng_col:
-        df_output = _add_lookup_column(df_output, chng_col, lookup_manager.change_indicators_dict, 'CHANGE_INDICATOR_DESCRIPTION')
+        chng_col = 'CHANGE INDICATOR' if 'CHANGE INDICATOR' in df_output.columns else 'CHNGIND' if 'CHNGIND' in df_output.columns else None
+        if chng_col:
+            df_output = _add_lookup_column(df_output, chng_col, lookup_manager.change_indicators_dict, 'CHANGE_INDICATOR_DESCRIPTION')
     
     # 6. Augment TABLE_MAINT_FLAG if present
     if 'TABLE_MAINT_FLAG' in df_output.columns:
-        df_output['TABLE_MAINT_FLAG'] = df_output['TABLE_MAINT_FLAG'].apply(
-            lambda x: augment_table_maint_flag(x, lookup_manager)
-        )
+        with profile_stage('enrich.CDPOS.table_maint', rows=len(df_output)):
+            df_output['TABLE_MAINT_FLAG'] = _augment_table_maint_column(df_output['TABLE_MAINT_FLAG'], lookup_manager, flag_set)
     
     return df_output
 
+# Enrichment step for each file type
+PROCESSORS = {
+    'SM20': process_sm20_data,
+    'CDHDR': process_cdhdr_data,
+    'CDPOS': process_cdpos_data,
+}
+
 def create_excel_import_instructions(base_filename):
     """Create instructions for importing CSVs to Excel with formatting."""
     instructions = f"""SAP Analysis Report - Excel Import Instructions
@@ -312,6 +400,7 @@ def generate_final_output():
     base_filename = f"output/SAP_Analysis_Report_{timestamp}"
     
     files_created = []
+    reports = []
     
     # Process SM20
     if sm20_files:
@@ -322,6 +411,7 @@ def generate_final_output():
         output_file = f"{base_filename}_SM20.csv"
         sm20_df.to_csv(output_file, index=False, encoding='utf-8-sig')
         files_created.append(output_file)
+        reports.append(('SM20', output_file, sm20_df))
         print(f"  ✅ Created: {output_file} ({len(sm20_df)} records)")
     else:
         print("\n  ⚠️  No SM20 analyzed files found")
@@ -335,6 +425,7 @@ def generate_final_output():
         output_file = f"{base_filename}_CDHDR.csv"
         cdhdr_df.to_csv(output_file, index=False, encoding='utf-8-sig')
         files_created.append(output_file)
+        reports.append(('CDHDR', output_file, cdhdr_df))
         print(f"  ✅ Created: {output_file} ({len(cdhdr_df)} records)")
     else:
         print("\n  ⚠️  No CDHDR cleaned files found")
@@ -348,10 +439,19 @@ def generate_final_output():
         output_file = f"{base_filename}_CDPOS.csv"
         cdpos_df.to_csv(output_file, index=False, encoding='utf-8-sig')
         files_created.append(output_file)
+        reports.append(('CDPOS', output_file, cdpos_df))
         print(f"  ✅ Created: {output_file} ({len(cdpos_df)} records)")
     else:
         print("\n  ⚠️  No CDPOS cleaned files found")
     
+    # Append to the partitioned result store for cross-report queries
+    store_location = os.environ.get(RESULT_STORE_ENV)
+    if store_location and reports:
+        store = ResultStore(store_location)
+        for file_type, output_file, df in reports:
+            store.append(df, file_type, os.path.splitext(os.path.basename(output_file))[0])
+        print(f"\n  🗂️  Appended {len(reports)} reports to result store: {store_location}")
+    
     # Create instructions file
     instructions_file = create_excel_import_instructions(base_filename)
     print(f"\n  📄 Created: {instructions_file}")
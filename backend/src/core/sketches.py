@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+SAP Triage Sketches - Mergeable streaming summaries for huge exports
+Answers triage questions ("top users by debug events", "top tcodes by
+high-risk hits", "distinct terminals per user") over any number of rows in
+fixed memory. Every sketch is updated per chunk, serializes to a compact dict
+stored with the analysis summary, and merges across chunks, shards and files.
+
+Sketches and error bounds (N = total weight added, e = 2.718...):
+    CountMinSketch(width w, depth d)
+        estimate(x) >= true count, and estimate(x) <= true + (e / w) * N
+        with probability >= 1 - exp(-d). Defaults w=1024, d=4: overestimate
+        at most 0.27% of N with 98% confidence.
+    SpaceSaving(k counters)
+        Every key with true count > N / k is reported. Each reported count
+        overestimates by at most its recorded error, and error <= N / k.
+        count - error is a guaranteed lower bound. Merging keeps both bounds
+        (with N the combined total).
+    HyperLogLog(precision p, 2^p one-byte registers)
+        Relative standard error 1.04 / sqrt(2^p): 1.6% for p=12 (distinct
+        counts), 6.5% for p=8 (per-key distinct counts). Merging is exact:
+        the merged sketch equals the sketch of the combined stream.
+    KeyedHyperLogLog
+        One p=8 HyperLogLog per key. When serialized, only the max_keys keys
+        with the most distinct values are kept, so merges of truncated
+        sketches can miss keys that were below the cut in every part.
+
+Hashing uses blake2b, so sketches built in different processes or machines
+merge correctly.
+
+Usage:
+    sketches = TriageSketches()
+    sketches.update(df, flag_set)            # per chunk
+    record = sketches.to_dict()              # stored with the summary
+    merged = merge_triage([record_a, record_b])
+    print(triage_report(merged))
+"""
+
+import base64
+import hashlib
+import json
+import math
+import sys
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+SPACE_SAVING_K = 100
+HLL_PRECISION = 12
+KEYED_HLL_PRECISION = 8
+KEYED_HLL_MAX_KEYS = 200
+
+# Entries shown per triage question
+REPORT_TOP_N = 10
+
+# Triage questions; key/value list the candidate columns in preference order
+TRIAGE_SKETCHES = [
+    {'name': 'top_users_by_debug', 'kind': 'top', 'key': ['USER', 'USERNAME'], 'flag': 'DEBUG_FLAG'},
+    {'name': 'debug_events_per_user', 'kind': 'count', 'key': ['USER', 'USERNAME'], 'flag': 'DEBUG_FLAG'},
+    {'name': 'top_tcodes_by_high_risk', 'kind': 'top', 'key': ['SOURCE_TA', 'TRANSACTION_CODE', 'TCODE'],
+     'flag': 'HIGH_RISK_TCODE_FLAG'},
+    {'name': 'top_high_risk_tables', 'kind': 'top', 'key': ['TABNAME', 'TABLE NAME'], 'flag': 'HIGH_RISK_TABLE_FLAG'},
+    {'name': 'distinct_users', 'kind': 'distinct', 'key': ['USER', 'USERNAME']},
+    {'name': 'distinct_terminals_per_user', 'kind': 'distinct_per_key', 'key': ['USER'], 'value': ['TERMINAL']},
+]
+
+def _pack(array):
+    return base64.b64encode(zlib.compress(np.ascontiguousarray(array).tobytes(), 9)).decode('ascii')
+
+def _unpack(text, dtype, shape):
+    return np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=dtype).reshape(shape).copy()
+
+def hash64(values):
+    """Stable 64-bit hashes of string values (same on every machine)."""
+    return np.array([int.from_bytes(hashlib.blake2b(str(v).encode('utf-8'), digest_size=8).digest(), 'little')
+                     for v in values], dtype=np.uint64)
+
+# ================================================================================
+# SKETCHES
+# ================================================================================
+
+class CountMinSketch:
+    """Point-count estimates with a one-sided (over) error of at most e/width * N."""
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint64)  # uint32 wraps past 4.29e9 per cell
+        self.total = 0
+
+    def _columns(self, hashes):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, weights):
+        """Add weights for keys (parallel sequences)."""
+        if len(keys) == 0:
+            return
+        weights = np.asarray(weights, dtype=np.uint64)
+        columns = self._columns(hash64(keys))
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], weights)
+        self.total += int(weights.sum())
+
+    def estimate(self, key):
+        columns = self._columns(hash64([key]))[:, 0]
+        return int(self.table[np.arange(self.depth), columns].min())
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches with different dimensions cannot be merged")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {'kind': 'count', 'width': self.width, 'depth': self.depth, 'total': self.total,
+                'dtype': 'uint64', 'table': _pack(self.table)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['width'], data['depth'])
+        # Records written before the uint64 table have no dtype and hold uint32 cells
+        dtype = np.dtype(data.get('dtype', 'uint32'))
+        sketch.table = _unpack(data['table'], dtype, (data['depth'], data['width'])).astype(np.uint64)
+        sketch.total = data['total']
+        return sketch
+
+
+class SpaceSaving:
+    """Top-k heavy hitters; counts overestimate by at most their error (<= N/k)."""
+
+    def __init__(self, k=SPACE_SAVING_K):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+
+    def _floor(self):
+        """Count any unmonitored key could have had (0 until all k counters are used)."""
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def add(self, keys, weights):
+        """Add weights for keys; heavier keys first so they claim counters."""
+        for key, weight in sorted(zip(keys, weights), key=lambda item: (-item[1], str(item[0]))):
+            weight = int(weight)
+            self.total += weight
+            if key in self.counts:
+                self.counts[key] += weight
+            elif len(self.counts) < self.k:
+                self.counts[key] = weight
+                self.errors[key] = 0
+            else:
+                evicted = min(self.counts, key=lambda candidate: (self.counts[candidate], str(candidate)))
+                floor = self.counts.pop(evicted)
+                del self.errors[evicted]
+                self.counts[key] = floor + weight
+                self.errors[key] = floor
+
+    def merge(self, other):
+        """Mergeable-summaries combine: a key missing from one side gets that side's floor."""
+        floor_self, floor_other = self._floor(), other._floor()
+        counts, errors = {}, {}
+        for key in set(self.counts) | set(other.counts):
+            count_self = self.counts.get(key, floor_self)
+            count_other = other.counts.get(key, floor_other)
+            counts[key] = count_self + count_other
+            errors[key] = (self.errors.get(key, floor_self) + other.errors.get(key, floor_other))
+        keep = sorted(counts, key=lambda key: (-counts[key], str(key)))[:self.k]
+        self.counts = {key: counts[key] for key in keep}
+        self.errors = {key: errors[key] for key in keep}
+        self.total += other.total
+        return self
+
+    def top(self, n=REPORT_TOP_N):
+        """[(key, count, error)] by count; count - error is a guaranteed lower bound."""
+        keys = sorted(self.counts, key=lambda key: (-self.counts[key], str(key)))[:n]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+    def to_dict(self):
+        return {'kind': 'top', 'k': self.k, 'total': self.total,
+                'items': [[key, count, error] for key, count, error in self.top(self.k)]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        for key, count, error in data['items']:
+            sketch.counts[key] = count
+            sketch.errors[key] = error
+        sketch.total = data['total']
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count estimate with relative standard error 1.04 / sqrt(2^p)."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        p = self.precision
+        indexes = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        remainders = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Rank = position of the first 1 bit in the remaining 64 - p bits
+        ranks = np.array([(64 - p) - int(r).bit_length() + 1 for r in remainders], dtype=np.uint8)
+        np.maximum.at(self.registers, indexes, ranks)
+
+    def add(self, values):
+        self.add_hashes(hash64(values))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))  # linear counting for small cardinalities
+        return int(round(raw))
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLogs with different precision cannot be merged")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def to_dict(self):
+        return {'kind': 'distinct', 'precision': self.precision, 'registers': _pack(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['precision'])
+        sketch.registers = _unpack(data['registers'], np.uint8, (1 << data['precision'],))
+        return sketch
+
+
+class KeyedHyperLogLog:
+    """A small HyperLogLog per key (e.g. distinct terminals per user)."""
+
+    def __init__(self, precision=KEYED_HLL_PRECISION, max_keys=KEYED_HLL_MAX_KEYS):
+        self.precision = precision
+        self.max_keys = max_keys
+        self.sketches = {}
+
+    def add(self, keys, values):
+        """Add (key, value) pairs (parallel sequences)."""
+        if len(keys) == 0:
+            return
+        hashes = hash64(values)
+        keys = pd.Series(keys)
+        for key, positions in keys.groupby(keys, sort=False).indices.items():
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = HyperLogLog(self.precision)
+            sketch.add_hashes(hashes[positions])
+
+    def merge(self, other):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = HyperLogLog.from_dict(sketch.to_dict())
+        return self
+
+    def top(self, n=REPORT_TOP_N):
+        """[(key, distinct estimate)] for the keys with the most distinct values."""
+        estimates = {key: sketch.estimate() for key, sketch in self.sketches.items()}
+        keys = sorted(estimates, key=lambda key: (-estimates[key], str(key)))[:n]
+        return [(key, estimates[key]) for key in keys]
+
+    def to_dict(self):
+        keys = [key for key, _ in self.top(self.max_keys)]
+        registers = np.stack([self.sketches[key].registers for key in keys]) if keys else np.zeros((0, 1 << self.precision), np.uint8)
+        return {'kind': 'distinct_per_key', 'precision': self.precision, 'max_keys': self.max_keys,
+                'dropped_keys': max(0, len(self.sketches) - len(keys)), 'keys': keys, 'registers': _pack(registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['precision'], data['max_keys'])
+        registers = _unpack(data['registers'], np.uint8, (len(data['keys']), 1 << data['precision']))
+        for key, row in zip(data['keys'], registers):
+            hll = HyperLogLog(data['precision'])
+            hll.registers = row.copy()
+            sketch.sketches[key] = hll
+        return sketch
+
+
+SKETCH_TYPES = {
+    'count': CountMinSketch,
+    'top': SpaceSaving,
+    'distinct': HyperLogLog,
+    'distinct_per_key': KeyedHyperLogLog,
+}
+
+# ================================================================================
+# TRIAGE SKETCHES FOR THE PIPELINE
+# ================================================================================
+
+def _first_column(df, candidates):
+    for column in candidates:
+        if column in df.columns:
+            return column
+    return None
+
+
+def _weighted_keys(series):
+    """Distinct non-empty values of series and how often each occurs."""
+    series = series[series.notna() & (series.astype(str) != '')].astype(str)
+    counts = series.value_counts(sort=False)
+    return list(counts.index), counts.values
+
+
+class TriageSketches:
+    """The TRIAGE_SKETCHES questions for one analysis, updated chunk by chunk."""
+
+    def __init__(self, sketches=None):
+        self.sketches = sketches if sketches is not None else {
+            spec['name']: SKETCH_TYPES[spec['kind']]() for spec in TRIAGE_SKETCHES}
+
+    def update(self, df, flag_set=None):
+        """Add a cleaned chunk; flag-filtered questions need its FlagSet."""
+        for spec in TRIAGE_SKETCHES:
+            sketch = self.sketches.get(spec['name'])
+            key_column = _first_column(df, spec['key'])
+            if sketch is None or key_column is None:
+                continue
+
+            rows = df
+            if spec.get('flag'):
+                if flag_set is None or spec['flag'] not in flag_set.flags:
+                    continue
+                rows = df[flag_set.mask(spec['flag'])]
+
+            if spec['kind'] in ('top', 'count'):
+                keys, weights = _weighted_keys(rows[key_column])
+                sketch.add(keys, weights)
+            elif spec['kind'] == 'distinct':
+                keys, _ = _weighted_keys(rows[key_column])
+                sketch.add(keys)
+            elif spec['kind'] == 'distinct_per_key':
+                value_column = _first_column(df, spec['value'])
+                if value_column is None:
+                    continue
+                pairs = rows[[key_column, value_column]].astype(str).drop_duplicates()
+                pairs = pairs[(pairs[key_column] != '') & (pairs[value_column] != '')]
+                sketch.add(pairs[key_column].tolist(), pairs[value_column].tolist())
+
+    def merge(self, other):
+        for name, sketch in other.sketches.items():
+            if name in self.sketches:
+                self.sketches[name].merge(sketch)
+            else:
+                self.sketches[name] = sketch
+        return self
+
+    def to_dict(self):
+        return {name: sketch.to_dict() for name, sketch in self.sketches.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({name: SKETCH_TYPES[entry['kind']].from_dict(entry) for name, entry in data.items()})
+
+
+def merge_triage(records):
+    """Merge serialized TriageSketches (chunks, shards or files) into one serialized record."""
+    records = [record for record in records if record]
+    if not records:
+        return {}
+    merged = TriageSketches.from_dict(records[0])
+    for record in records[1:]:
+        merged.merge(TriageSketches.from_dict(record))
+    return merged.to_dict()
+
+
+def triage_report(record, top_n=REPORT_TOP_N):
+    """Readable answers from a serialized TriageSketches record."""
+    report = {}
+    for name, sketch in TriageSketches.from_dict(record).sketches.items():
+        if isinstance(sketch, SpaceSaving):
+            report[name] = [{'key': key, 'count': count, 'min_count': count - error}
+                            for key, count, error in sketch.top(top_n)]
+        elif isinstance(sketch, KeyedHyperLogLog):
+            report[name] = [{'key': key, 'distinct': estimate} for key, estimate in sketch.top(top_n)]
+        elif isinstance(sketch, HyperLogLog):
+            report[name] = sketch.estimate()
+        elif isinstance(sketch, CountMinSketch):
+            report[name] = {'total': sketch.total,
+                            'max_overestimate': math.ceil(math.e / sketch.width * sketch.total)}
+    return report
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface - merge triage records (JSON files) and print the report."""
+    if len(sys.argv) < 2:
+        print("Usage: python -m core.sketches <triage.json> [more.json ...]")
+        print("Each file holds a summary's 'triage' record (or a summary containing one).")
+        return
+
+    records = []
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            data = json.load(f)
+        records.append(data.get('triage', data))
+    print(json.dumps(triage_report(merge_triage(records)), indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
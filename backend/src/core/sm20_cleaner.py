@@ -9,9 +9,18 @@ import numpy as np
 import os
 import sys
 import glob
+import io
 import chardet
 from datetime import datetime
 
+if __package__ in (None, ''):
+    # Run as a script (python core/sm20_cleaner.py): make the core package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.archive_input import list_members
+from core.dataframe_backend import get_backend
+from core.profiling import get_profiler, profile_stage
+
 # ================================================================================
 # CONFIGURATION & CONSTANTS
 # ================================================================================
@@ -22,6 +31,31 @@ STRING_COLUMNS = ['EVENT', 'VARIABLE1', 'VARIABLE2', 'VARIABLE3', 'TERMINAL']
 # File encodings to try in order
 ENCODING_OPTIONS = ['utf-8', 'utf-8-sig', 'latin-1', 'iso-8859-1', 'cp1252']
 
+# DATE formats SAP users can choose (SU01 defaults), plus what Excel exports
+# produce. Detection picks the format parsing the most distinct dates; on a
+# tie (e.g. every day <= 12) the earlier entry wins.
+DATE_FORMATS = [
+    ('DD.MM.YYYY', '%d.%m.%Y'),
+    ('MM/DD/YYYY', '%m/%d/%Y'),
+    ('MM-DD-YYYY', '%m-%d-%Y'),
+    ('YYYY.MM.DD', '%Y.%m.%d'),
+    ('YYYY/MM/DD', '%Y/%m/%d'),
+    ('YYYY-MM-DD', '%Y-%m-%d'),
+    ('YYYYMMDD', '%Y%m%d'),
+    ('DD/MM/YYYY', '%d/%m/%Y'),
+    ('DD-MM-YYYY', '%d-%m-%Y'),
+    ('YYYY-MM-DD HH:MM:SS', '%Y-%m-%d %H:%M:%S'),
+]
+
+TIME_FORMATS = [
+    ('HH:MM:SS', '%H:%M:%S'),
+    ('HHMMSS', '%H%M%S'),
+    ('HH:MM', '%H:%M'),
+]
+
+# Distinct values examined when detecting a date/time format
+DATETIME_SAMPLE_SIZE = 2000
+
 # Column mapping for SM20 files
 SM20_COLUMN_MAPPING = {
     # System columns
@@ -84,35 +118,92 @@ SM20_COLUMN_MAPPING = {
 # ================================================================================
 
 def _clean_string_columns(df):
-    """Clean string columns by stripping whitespace and normalizing."""
-    for col in df.columns:
-        if df[col].dtype == 'object' or col in STRING_COLUMNS:
-            # Strip whitespace
-            df[col] = df[col].apply(lambda x: str(x).strip() if pd.notna(x) else '')
-            # Replace various null representations with empty string
-            df[col] = df[col].replace(['nan', 'None', 'NaN', 'NULL', '<NA>'], '')
-            # Clean up extra whitespace
-            df[col] = df[col].str.replace(r'\s+', ' ', regex=True)
-            # Remove non-printable characters except newlines
-            df[col] = df[col].apply(lambda x: ''.join(c for c in x if c.isprintable() or c == '\n') if x else '')
-            # Replace empty-ish values
-            df[col] = df[col].replace('', '')
+    """Clean string columns by stripping whitespace and normalizing (see core/dataframe_backend.py)."""
+    columns = [col for col in df.columns if df[col].dtype == 'object' or col in STRING_COLUMNS]
+    return get_backend().clean_strings(df, columns)
+
+def _unique_strings(series):
+    """Factorize a column and return (codes, stripped string uniques); code -1 is missing."""
+    codes, uniques = pd.factorize(series)
+    return codes, pd.Index(uniques).astype(str).str.strip()
+
+def _detect_format(values, formats):
+    """Return the (label, format) that parses the most of a sample of values, or None."""
+    if len(values) > DATETIME_SAMPLE_SIZE:
+        values = values[np.linspace(0, len(values) - 1, DATETIME_SAMPLE_SIZE).astype(int)]
+    best, best_hits = None, 0
+    for label, fmt in formats:
+        hits = pd.to_datetime(values, format=fmt, errors='coerce').notna().sum()
+        if hits > best_hits:
+            best, best_hits = (label, fmt), hits
+        if best_hits == len(values):
+            break  # later formats could only tie, and ties go to the earlier one
+    return best
+
+def _resolve_format(label, values, formats):
+    """The (label, format) for a known label, otherwise the format detected from values."""
+    known = dict(formats)
+    if label in known:
+        return label, known[label]
+    return _detect_format(values, formats)
+
+def parse_sap_datetime(date_series, time_series=None, date_format=None, time_format=None):
+    """
+    Combine SAP DATE and TIME columns into datetimes.
+    The format of each column is detected once from its distinct values (unless
+    given as a label, e.g. to keep chunks of one file consistent), and each
+    distinct date/time string is parsed once with that explicit format.
     
-    return df
+    Returns:
+        (datetime Series, date format label, time format label, unparseable row count)
+    """
+    date_codes, date_values = _unique_strings(date_series)
+    date_format = _resolve_format(date_format, date_values, DATE_FORMATS)
+    dates = np.full(len(date_values) + 1, np.datetime64('NaT'), dtype='datetime64[ns]')
+    if date_format:
+        dates[:-1] = pd.to_datetime(date_values, format=date_format[1], errors='coerce').values
+    result = dates[date_codes]  # code -1 picks the trailing NaT
+    
+    time_format = None
+    if time_series is not None:
+        time_codes, time_values = _unique_strings(time_series)
+        # Numeric HHMMSS loses its leading zero when read as a number
+        time_values = time_values.where(~time_values.str.fullmatch(r'\d{5}'), '0' + time_values)
+        time_format = _resolve_format(time_format, time_values, TIME_FORMATS)
+        offsets = np.full(len(time_values) + 1, np.timedelta64('NaT'), dtype='timedelta64[ns]')
+        if time_format:
+            parsed = pd.to_datetime(time_values, format=time_format[1], errors='coerce')
+            offsets[:-1] = (parsed - parsed.normalize()).values
+        result = result + offsets[time_codes]
+    
+    datetimes = pd.Series(result, index=date_series.index)
+    return (datetimes,
+            date_format[0] if date_format else None,
+            time_format[0] if time_format else None,
+            int(datetimes.isna().sum()))
 
-def _read_file_with_encoding(input_file, file_type='csv'):
-    """Read file with multiple encoding attempts for better compatibility."""
+def _read_file_with_encoding(input_file, file_type='csv', opener=None):
+    """
+    Read file with multiple encoding attempts for better compatibility.
+    
+    opener, when given, returns a fresh binary stream (e.g. a decompressing
+    archive member) and is called again for every attempt.
+    """
+    source = (lambda: opener()) if opener else (lambda: open(input_file, 'rb'))
+    
     if file_type == 'csv':
         # Try different encodings
         for encoding in ENCODING_OPTIONS:
             try:
                 # First try comma-separated
-                df = pd.read_csv(input_file, encoding=encoding, on_bad_lines='skip')
+                with source() as f:
+                    df = pd.read_csv(f, encoding=encoding, on_bad_lines='skip')
                 
                 # If only one column, try tab-delimited
                 if len(df.columns) == 1:
                     print("Trying tab-delimited format...")
-                    df = pd.read_csv(input_file, sep='\t', encoding=encoding, on_bad_lines='skip')
+                    with source() as f:
+                        df = pd.read_csv(f, sep='\t', encoding=encoding, on_bad_lines='skip')
                 
                 # If we got here, it worked
                 return df
@@ -120,57 +211,40 @@ def _read_file_with_encoding(input_file, file_type='csv'):
                 continue
         
         # If all encodings failed, try with error handling
-        df = pd.read_csv(input_file, encoding='utf-8', on_bad_lines='skip', encoding_errors='replace')
+        with source() as f:
+            df = pd.read_csv(f, encoding='utf-8', on_bad_lines='skip', encoding_errors='replace')
     else:
-        # Excel file
-        df = pd.read_excel(input_file)
+        # Excel file (openpyxl needs a seekable stream, so archive members are buffered)
+        with source() as f:
+            df = pd.read_excel(f if f.seekable() else io.BytesIO(f.read()))
     
     return df
 
+def detect_file_type(name, default='SM20'):
+    """Infer SM20/CDHDR/CDPOS from a file name, falling back to default."""
+    name_upper = os.path.basename(name).upper()
+    for file_type in ['SM20', 'CDHDR', 'CDPOS']:
+        if file_type in name_upper:
+            return file_type
+    print(f"Warning: Could not determine file type of {name}, defaulting to {default}")
+    return default
+
 # ================================================================================
 # UNIFIED CLEANING FUNCTION
 # ================================================================================
 
-def clean_sap_file(input_file, file_type='AUTO', output_file=None):
+def clean_dataframe(df, file_type, datetime_formats=(None, None)):
     """
-    Clean any SAP export file (SM20, CDHDR, or CDPOS).
+    Standardize columns, build DATETIME and clean strings of a loaded export.
     
     Args:
-        input_file: Path to SAP export file
-        file_type: 'SM20', 'CDHDR', 'CDPOS', or 'AUTO' (auto-detect)
-        output_file: Optional output path
+        df: Raw export as read from the file
+        file_type: 'SM20', 'CDHDR' or 'CDPOS'
+        datetime_formats: (date label, time label) to use instead of detecting
     
     Returns:
-        DataFrame with cleaned data
+        (cleaned DataFrame, (date label, time label) used)
     """
-    
-    # Auto-detect file type if needed
-    if file_type == 'AUTO':
-        filename_upper = input_file.upper()
-        if 'SM20' in filename_upper:
-            file_type = 'SM20'
-        elif 'CDHDR' in filename_upper:
-            file_type = 'CDHDR'
-        elif 'CDPOS' in filename_upper:
-            file_type = 'CDPOS'
-        else:
-            # Default to SM20 if can't determine
-            file_type = 'SM20'
-            print(f"Warning: Could not determine file type, defaulting to SM20")
-    
-    print(f"Cleaning {file_type} file: {input_file}")
-    
-    # Determine file format
-    file_format = 'xlsx' if input_file.endswith('.xlsx') else 'csv'
-    
-    # Read the file
-    try:
-        df = _read_file_with_encoding(input_file, file_format)
-        print(f"Loaded {len(df)} records with {len(df.columns)} columns")
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return None
-    
     # Show original columns for SM20 (others have fewer columns)
     if file_type == 'SM20':
         print("Original columns:", list(df.columns))
@@ -189,16 +263,20 @@ def clean_sap_file(input_file, file_type='AUTO', output_file=None):
     # 3. CREATE DATETIME COLUMN (for files with DATE and TIME)
     if 'DATE' in df.columns and 'TIME' in df.columns:
         try:
-            date_str = df['DATE'].astype(str)
-            time_str = df['TIME'].astype(str)
-            datetime_str = date_str + ' ' + time_str
-            df['DATETIME'] = pd.to_datetime(datetime_str, errors='coerce')
-            print(f"Created DATETIME column from DATE + TIME")
+            with profile_stage('clean.datetime', rows=len(df)):
+                df['DATETIME'], date_format, time_format, unparseable = parse_sap_datetime(
+                    df['DATE'], df['TIME'], *datetime_formats)
+            print(f"Created DATETIME column from DATE + TIME (date format {date_format}, time format {time_format})")
+            if unparseable:
+                print(f"Warning: {unparseable} rows have unparseable DATE/TIME values")
+            get_profiler().count('clean.datetime_unparseable_rows', unparseable)
+            datetime_formats = (date_format, time_format)
         except Exception as e:
             print(f"Warning: Could not create datetime: {e}")
     
     # 4. CLEAN STRING COLUMNS
-    df = _clean_string_columns(df)
+    with profile_stage('clean.strings', rows=len(df)):
+        df = _clean_string_columns(df)
     
     # 5. FILE-SPECIFIC POST-PROCESSING
     if file_type == 'CDHDR':
@@ -209,18 +287,71 @@ def clean_sap_file(input_file, file_type='AUTO', output_file=None):
     elif file_type == 'CDPOS':
         print(f"Processed {len(df)} CDPOS records")
     
+    return df, datetime_formats
+
+def clean_sap_file(input_file, file_type='AUTO', output_file=None, member=None):
+    """
+    Clean any SAP export file (SM20, CDHDR, or CDPOS).
+    
+    Args:
+        input_file: Path to SAP export file (.csv/.xlsx, optionally .gz/.zst
+            compressed, or a .zip archive)
+        file_type: 'SM20', 'CDHDR', 'CDPOS', or 'AUTO' (auto-detect)
+        output_file: Optional output path
+        member: ArchiveMember to clean when input_file is a multi-file archive
+    
+    Returns:
+        DataFrame with cleaned data
+    """
+    
+    # Resolve the data file (archives are decompressed while reading)
+    if member is None:
+        try:
+            members = list_members(input_file)
+        except Exception as e:
+            print(f"Error reading file: {e}")
+            return None
+        if len(members) != 1:
+            print(f"Error: {input_file} contains {len(members)} data files; use clean_sap_archive()")
+            return None
+        member = members[0]
+    
+    # Auto-detect file type if needed
+    if file_type == 'AUTO':
+        file_type = detect_file_type(member.name)
+    
+    if member.compression:
+        print(f"Cleaning {file_type} file: {input_file} ({member.compression}: {member.name})")
+    else:
+        print(f"Cleaning {file_type} file: {input_file}")
+    
+    # Read the file
+    try:
+        with profile_stage('clean.read', bytes_read=os.path.getsize(input_file)) as stage:
+            opener = member.open if member.compression else None
+            df = _read_file_with_encoding(input_file, member.file_format, opener)
+            stage.rows = len(df)
+        print(f"Loaded {len(df)} records with {len(df.columns)} columns")
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return None
+    
+    df, _ = clean_dataframe(df, file_type)
+    
     # 6. SAVE OUTPUT
     if output_file is None:
         # Auto-generate output filename
-        filename = os.path.basename(input_file)
+        filename = os.path.basename(member.name)
         base_name = os.path.splitext(filename)[0]
         output_file = f"output/{base_name}_cleaned.csv"
     
     # Create output directory if needed
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
     
     try:
-        df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        with profile_stage('clean.write', rows=len(df)) as stage:
+            df.to_csv(output_file, index=False, encoding='utf-8-sig')
+            stage.bytes_written = os.path.getsize(output_file)
         print(f"{file_type} saved to: {output_file}")
     except Exception as e:
         print(f"Error saving file: {e}")
@@ -232,6 +363,23 @@ def clean_sap_file(input_file, file_type='AUTO', output_file=None):
     
     return df
 
+def clean_sap_archive(input_file, file_type='AUTO', output_dir='output'):
+    """
+    Clean every SAP export inside an upload (zip members, or the single file).
+    
+    Each member's file type is detected from its name unless file_type is given.
+    
+    Returns:
+        Dict of member name -> (file type, cleaned DataFrame or None)
+    """
+    results = {}
+    for member in list_members(input_file):
+        member_type = detect_file_type(member.name) if file_type == 'AUTO' else file_type
+        base_name = os.path.splitext(os.path.basename(member.name))[0]
+        output_file = os.path.join(output_dir, f"{base_name}_cleaned.csv")
+        results[member.name] = (member_type, clean_sap_file(input_file, member_type, output_file, member))
+    return results
+
 # ================================================================================
 # LEGACY WRAPPER FUNCTIONS (for backward compatibility)
 # ================================================================================
@@ -294,6 +442,15 @@ def find_and_process_all_files():
     else:
         print("\nNo CDPOS files found (input/*CDPOS*.xlsx) - skipping")
     
+    # Compressed exports and archives (members are routed by name)
+    archive_files = []
+    for pattern in ['input/*.gz', 'input/*.zip', 'input/*.zst']:
+        archive_files.extend(glob.glob(pattern))
+    for file in archive_files:
+        print(f"\nProcessing archive: {file}")
+        for name, (member_type, result) in clean_sap_archive(file).items():
+            results[f'{member_type}_{file}:{name}'] = result is not None
+    
     # Summary
     print("\n" + "=" * 60)
     print("PROCESSING SUMMARY:")
@@ -324,8 +481,14 @@ def main():
             print(f"File not found: {input_file}")
             return
         
-        # Use unified function with auto-detection
-        result = clean_sap_file(input_file, 'AUTO', output_file)
+        # Archives with several exports are cleaned member by member
+        if len(list_members(input_file)) > 1:
+            output_dir = output_file or 'output'
+            cleaned = clean_sap_archive(input_file, 'AUTO', output_dir)
+            result = cleaned if all(df is not None for _, df in cleaned.values()) else None
+        else:
+            # Use unified function with auto-detection
+            result = clean_sap_file(input_file, 'AUTO', output_file)
         
         if result is not None:
             print("\nFile cleaning completed!")
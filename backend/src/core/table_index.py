@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+SAP Table Description Index - Compact on-disk lookup for table descriptions
+Stores the 830K+ SAP table descriptions as a sorted fixed-width key array with
+offsets into a UTF-8 string blob, memory-mapped so only the pages touched by a
+lookup are read.
+
+File layout (little-endian):
+    header   32 bytes: magic, record count, key width, reserved
+    keys     count * key_width bytes, sorted, NUL-padded
+    offsets  (count + 1) uint64 offsets into the blob, 8-byte aligned
+    blob     concatenated UTF-8 descriptions
+
+Build: python -m core.table_index data/tables.csv data/tables.idx
+"""
+
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+INDEX_MAGIC = b'SAPTIDX1'
+HEADER_FORMAT = '<8sQII8x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Column names used by tables.csv
+DEFAULT_KEY_COLUMN = 'Table'
+DEFAULT_VALUE_COLUMN = 'Table Description'
+
+# ================================================================================
+# INDEX READER
+# ================================================================================
+
+class TableDescriptionIndex:
+    """Read-only, memory-mapped table description lookup with dict-style access."""
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        with open(index_file, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, key_width, _ = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+        if magic != INDEX_MAGIC:
+            self._mm.close()
+            raise ValueError(f"Not a table description index: {index_file}")
+
+        self._count = count
+        self._key_width = key_width
+        keys_end = HEADER_SIZE + count * key_width
+        offsets_start = _align8(keys_end)
+        self._blob_start = offsets_start + (count + 1) * 8
+
+        # Zero-copy views over the mapping; pages are faulted in on access
+        self._keys = np.frombuffer(self._mm, dtype=f'S{key_width}', count=count, offset=HEADER_SIZE)
+        self._offsets = np.frombuffer(self._mm, dtype='<u8', count=count + 1, offset=offsets_start)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __getitem__(self, key):
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self._value_at(pos)
+
+    def get(self, key, default=None):
+        """Return the description for key, or default if it is not indexed."""
+        pos = self._find(key)
+        return self._value_at(pos) if pos >= 0 else default
+
+    def get_many(self, keys, default=''):
+        """Look up a sequence of keys with one vectorized binary search."""
+        encoded = [str(key).encode('utf-8') for key in keys]
+        results = [default] * len(encoded)
+        if not encoded or self._count == 0:
+            return results
+        fits = np.array([len(key) <= self._key_width for key in encoded], dtype=bool)
+        probe = np.array([key if ok else b'' for key, ok in zip(encoded, fits)], dtype=f'S{self._key_width}')
+        positions = np.searchsorted(self._keys, probe)
+        for i, pos in enumerate(positions):
+            if fits[i] and pos < self._count and self._keys[pos] == probe[i]:
+                results[i] = self._value_at(pos)
+        return results
+
+    def close(self):
+        """Release the memory mapping."""
+        self._keys = None
+        self._offsets = None
+        self._mm.close()
+
+    def _find(self, key):
+        encoded = str(key).encode('utf-8')
+        if len(encoded) > self._key_width or self._count == 0:
+            return -1
+        pos = int(np.searchsorted(self._keys, encoded))
+        if pos < self._count and self._keys[pos] == encoded:
+            return pos
+        return -1
+
+    def _value_at(self, pos):
+        start = self._blob_start + int(self._offsets[pos])
+        end = self._blob_start + int(self._offsets[pos + 1])
+        return self._mm[start:end].decode('utf-8')
+
+# ================================================================================
+# INDEX BUILDER
+# ================================================================================
+
+def _align8(offset):
+    return (offset + 7) & ~7
+
+def build_table_index(csv_file, index_file, key_col=DEFAULT_KEY_COLUMN, value_col=DEFAULT_VALUE_COLUMN):
+    """
+    Build a table description index from a CSV lookup file.
+
+    Keys are stored as-is (like the dict the CSV used to be loaded into); for
+    duplicate keys the last row wins.
+
+    Returns:
+        Number of indexed keys
+    """
+    df = pd.read_csv(csv_file, usecols=[key_col, value_col], dtype=str, keep_default_na=False)
+    df = df.drop_duplicates(subset=key_col, keep='last')
+
+    keys = [key.encode('utf-8') for key in df[key_col]]
+    values = [value.encode('utf-8') for value in df[value_col]]
+    key_width = max((len(key) for key in keys), default=1) or 1
+
+    key_array = np.array(keys, dtype=f'S{key_width}')
+    order = np.argsort(key_array, kind='stable')
+    key_array = key_array[order]
+
+    sorted_values = [values[i] for i in order]
+    offsets = np.zeros(len(sorted_values) + 1, dtype='<u8')
+    np.cumsum([len(value) for value in sorted_values], out=offsets[1:])
+
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, INDEX_MAGIC, len(key_array), key_width, 0))
+        f.write(key_array.tobytes())
+        f.write(b'\0' * (_align8(f.tell()) - f.tell()))
+        f.write(offsets.tobytes())
+        for value in sorted_values:
+            f.write(value)
+    os.replace(tmp_file, index_file)
+
+    return len(key_array)
+
+def main():
+    """Command line interface."""
+    if len(sys.argv) < 3:
+        print("Usage: python -m core.table_index <tables.csv> <tables.idx>")
+        return
+
+    csv_file, index_file = sys.argv[1], sys.argv[2]
+    if not os.path.exists(csv_file):
+        print(f"File not found: {csv_file}")
+        return
+
+    count = build_table_index(csv_file, index_file)
+    print(f"Indexed {count} table descriptions into {index_file} ({os.path.getsize(index_file)} bytes)")
+
+if __name__ == "__main__":
+    main()
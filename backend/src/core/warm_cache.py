@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+SAP Warm Cache - Process-level reuse of lookup, rule and client state
+Lambda reuses a container across invocations, so the lookup tables, the
+compiled detection rules and the boto3 clients only need to be built once per
+container. Each cached entry remembers the (mtime, size) signature of the data
+files it was built from and is rebuilt when any of them changes, so an updated
+rule pack or lookup file takes effect without a redeploy.
+
+Cold starts build everything concurrently with warm_up(); warm invocations only
+stat the data files before reusing the cached objects.
+
+Usage:
+    warm_up()                                  # at handler import
+    lookup_manager = get_lookup_manager()      # per invocation
+    get_detection_rules()                      # refreshes sap_analyzer if stale
+    s3 = get_client('s3')
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from core import sap_analyzer
+from core.sap_output_generator import LOOKUP_FILES, LookupManager
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+# Threads used by warm_up() to build the cached state concurrently
+WARM_UP_THREADS = 4
+
+# AWS clients and resources created during warm_up()
+WARM_CLIENTS = ['s3']
+WARM_RESOURCES = ['dynamodb']
+
+_entries = {}   # name -> (signature, value)
+_locks = {}     # name -> lock guarding a rebuild
+_locks_guard = threading.Lock()
+
+# ================================================================================
+# CACHE PRIMITIVES
+# ================================================================================
+
+def file_signature(paths):
+    """(path, mtime_ns, size) for each file; missing files are recorded as such."""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def _lock_for(name):
+    with _locks_guard:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def cached(name, paths, loader):
+    """
+    Return the cached value for name, calling loader() when it is missing or
+    any of the files in paths changed since it was built.
+    """
+    signature = file_signature(paths)
+    entry = _entries.get(name)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    with _lock_for(name):
+        entry = _entries.get(name)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        if entry is not None:
+            print(f"Data files for {name} changed; rebuilding")
+        value = loader()
+        _entries[name] = (signature, value)
+        return value
+
+
+def clear():
+    """Drop every cached entry (the next call rebuilds)."""
+    _entries.clear()
+
+
+def cache_status():
+    """Names of the cached entries and the files each was built from."""
+    return {name: [path for path, _, _ in signature] for name, (signature, _) in _entries.items()}
+
+# ================================================================================
+# CACHED STATE
+# ================================================================================
+
+def get_lookup_manager():
+    """Lookup tables for the output generator, loaded concurrently on first use."""
+    return cached('lookups', LOOKUP_FILES, lambda: LookupManager(parallel=True))
+
+
+def get_detection_rules():
+    """
+    Compiled detection rules. The rules sap_analyzer compiled at import are
+    adopted when they were built from the same files (absolute path, mtime,
+    size) as the current working directory resolves to, so a cold start
+    compiles the rule pack once; otherwise, and whenever those files change,
+    the lookups are reloaded and the pack recompiled.
+    """
+    paths = [os.path.abspath(path) for path in sap_analyzer.detection_data_files()]
+    with _lock_for('detection_rules'):
+        if 'detection_rules' not in _entries and sap_analyzer.DETECTION_DATA_SIGNATURE == file_signature(paths):
+            _entries['detection_rules'] = (sap_analyzer.DETECTION_DATA_SIGNATURE, sap_analyzer.DETECTION_RULES)
+    return cached('detection_rules', paths, sap_analyzer.reload_detection_data)
+
+
+def get_client(service):
+    """boto3 client for service, created once per container."""
+    # Sessions are not thread-safe, so each client gets its own
+    return cached(f'client.{service}', [], lambda: boto3.session.Session().client(service))
+
+
+def get_resource(service):
+    """boto3 resource for service, created once per container."""
+    return cached(f'resource.{service}', [], lambda: boto3.session.Session().resource(service))
+
+
+def warm_up():
+    """Build the lookup tables, detection rules and AWS clients concurrently."""
+    start = time.perf_counter()
+    tasks = [get_lookup_manager, get_detection_rules]
+    tasks += [lambda service=service: get_client(service) for service in WARM_CLIENTS]
+    tasks += [lambda service=service: get_resource(service) for service in WARM_RESOURCES]
+
+    with ThreadPoolExecutor(max_workers=WARM_UP_THREADS) as pool:
+        futures = [pool.submit(task) for task in tasks]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Warning: Warm-up task failed, it will be retried on first use: {e}")
+
+    print(f"Warm cache ready in {time.perf_counter() - start:.2f}s ({', '.join(sorted(_entries))})")
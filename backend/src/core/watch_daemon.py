@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+SAP Watch Daemon - Watch-folder ingestion with a warm engine
+Watches an input folder and runs every new export through clean -> analyze ->
+enrich as soon as it is fully written, writing
+output/SAP_Analysis_Report_<name>_<TYPE>.csv and a _summary.json beside it.
+
+The folder is watched with inotify (Linux, through libc) or, where that is not
+available, by polling. A file is taken once it is complete: on inotify its
+writer closed it (or it was moved in); on polling, and for files found by the
+startup or periodic rescans, its size and mtime stayed unchanged for
+SETTLE_SECONDS. Temporary and hidden names (.part, ~$, .tmp, ...) are ignored.
+
+Files are processed by a bounded pool of worker processes that load the
+lookup tables and compile the detection rules once (see core/warm_cache.py),
+so a drop costs the analysis alone. At most workers + MAX_QUEUED files are
+handed to the pool; further ready files wait on disk until a slot frees up,
+and each worker gets an equal share of the memory budget for its chunks.
+
+Each export runs through the checkpointed pipeline (core/checkpoint.py) with
+its checkpoint under output/.checkpoints, so a daemon restart resumes an
+interrupted file. Finished and failed files are recorded with their size and
+mtime in output/.watch_state.json; a file is processed again only if it
+changes.
+
+Usage:
+    python -m core.watch_daemon [input dir] [output dir] [--workers N] [--poll] [--once]
+                                [--baselines DIR | s3://bucket/prefix]
+
+    --once       process the files already in the input folder and exit
+    --poll       poll instead of using inotify
+    --baselines  score SM20 against (and update) user baselines (core/baselines.py)
+    SAP_RESULT_STORE, if set, receives every report (core/result_store.py)
+"""
+
+import ctypes
+import ctypes.util
+import json
+import multiprocessing
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from core.archive_input import COMPRESSED_EXTENSIONS, list_members
+from core.baselines import BASELINE_FILE_TYPES, UserBaselines, baseline_store
+from core.checkpoint import checkpoint_store, run_checkpointed
+from core.memory_governor import MemoryGovernor, default_budget_bytes
+from core.profiling import profile_run
+from core.result_store import ResultStore
+from core.sap_output_generator import RESULT_STORE_ENV
+from core.sketches import triage_report
+from core.sm20_cleaner import detect_file_type
+from core.warm_cache import get_detection_rules, get_lookup_manager
+
+# ================================================================================
+# CONFIGURATION & CONSTANTS
+# ================================================================================
+
+DEFAULT_INPUT_DIR = 'input'
+DEFAULT_OUTPUT_DIR = 'output'
+DEFAULT_WORKERS = 2
+
+# Ready files handed to the pool beyond one per worker
+MAX_QUEUED = 2
+
+# A file found by scanning is complete once unchanged for this long
+SETTLE_SECONDS = 2.0
+
+# Polling interval, and the longest the event loop waits for inotify
+POLL_SECONDS = 1.0
+
+# Full rescans of the input folder (catches anything inotify missed); a file
+# inotify saw changing but never saw closed is taken after this long unchanged
+RESCAN_SECONDS = 30.0
+
+DATA_EXTENSIONS = ['.csv', '.xlsx', '.txt'] + list(COMPRESSED_EXTENSIONS)
+TEMPORARY_SUFFIXES = ['.part', '.partial', '.tmp', '.crdownload', '.swp', '.filepart']
+OUTPUT_SUFFIXES = ['_cleaned.csv', '_analyzed.csv']
+
+STATE_FILE = '.watch_state.json'
+CHECKPOINT_DIR = '.checkpoints'
+REPORT_TEMPLATE = 'SAP_Analysis_Report_{name}_{file_type}.csv'
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+INOTIFY_EVENT = struct.Struct('iIII')
+INOTIFY_READ_BYTES = 64 * 1024
+
+# ================================================================================
+# WATCHERS
+# ================================================================================
+
+def is_data_file(name):
+    """True for export names the daemon should pick up."""
+    base = os.path.basename(name)
+    lower = base.lower()
+    if base.startswith('.') or base.startswith('~$'):
+        return False
+    if any(lower.endswith(suffix) for suffix in TEMPORARY_SUFFIXES + OUTPUT_SUFFIXES):
+        return False
+    return os.path.splitext(lower)[1] in DATA_EXTENSIONS
+
+
+def scan_directory(directory):
+    """Paths of the data files directly inside directory."""
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        print(f"Warning: Cannot list {directory}: {e}")
+        return []
+    return [os.path.join(directory, name) for name in sorted(names)
+            if is_data_file(name) and os.path.isfile(os.path.join(directory, name))]
+
+
+class PollingWatcher:
+    """Reports every data file in the folder on each poll (completion is judged by settling)."""
+
+    name = 'polling'
+
+    def __init__(self, directory, interval=POLL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+
+    def events(self, timeout):
+        """[(path, closed)] - polled files are never known to be closed."""
+        time.sleep(min(timeout, self.interval))
+        return [(path, False) for path in scan_directory(self.directory)]
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """inotify on one folder through libc; raises OSError where it is unavailable."""
+
+    name = 'inotify'
+
+    def __init__(self, directory):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def events(self, timeout):
+        """[(path, closed)] for the data files that changed; closed once written and closed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.fd, INOTIFY_READ_BYTES)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(buffer):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            raw_name = buffer[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length]
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                print("Warning: inotify queue overflowed, rescanning the input folder")
+                events.extend((path, False) for path in scan_directory(self.directory))
+                continue
+            name = os.fsdecode(raw_name.rstrip(b'\0'))
+            if name and is_data_file(name):
+                events.append((os.path.join(self.directory, name), bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(directory, poll=False):
+    """inotify watcher for directory, or a polling one when asked or unavailable."""
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"Warning: inotify unavailable ({e}), polling every {POLL_SECONDS:.0f}s")
+    return PollingWatcher(directory)
+
+# ================================================================================
+# WORKER PROCESSES
+# ================================================================================
+
+_shared_lock = None
+
+
+def _init_worker(lock):
+    """Load lookups and compile rules once per worker process."""
+    global _shared_lock
+    _shared_lock = lock
+    # The daemon decides when workers stop: it lets them finish their files
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    get_detection_rules()
+    get_lookup_manager()
+
+
+def _report_name(path):
+    """Input file name without its data and compression extensions."""
+    name = os.path.basename(path)
+    stem, extension = os.path.splitext(name)
+    while extension.lower() in DATA_EXTENSIONS and stem:
+        name = stem
+        stem, extension = os.path.splitext(name)
+    return name
+
+
+def process_file(path, output_dir, budget_mb=None, baseline_location=None, store_location=None):
+    """
+    Clean, analyze and enrich every export in path (a worker job).
+
+    Returns:
+        List of {'member', 'fileType', 'output', 'summary'} per export
+    """
+    members = list_members(path)
+    if not members:
+        raise ValueError(f"No SM20/CDHDR/CDPOS files found in {path}")
+    name = _report_name(path)
+    baselines = UserBaselines(baseline_store(baseline_location)) if baseline_location else None
+
+    results = []
+    for index, member in enumerate(members):
+        file_type = detect_file_type(member.name)
+        report_name = name if len(members) == 1 else f"{name}_{_report_name(member.name)}"
+        output_file = os.path.join(output_dir, REPORT_TEMPLATE.format(name=report_name, file_type=file_type))
+        store = checkpoint_store(os.path.join(output_dir, CHECKPOINT_DIR), f"{report_name}_{index}")
+
+        with profile_run(report_name) as profiler:
+            get_detection_rules()
+            summary = run_checkpointed(path, file_type, output_file, store, get_lookup_manager(), member,
+                                       governor=MemoryGovernor(budget_mb), baselines=baselines)
+
+        # Stores shared by all workers are updated one file at a time
+        with _shared_lock:
+            if store_location:
+                ResultStore(store_location).append_csv(output_file, file_type, os.path.splitext(os.path.basename(output_file))[0])
+            if baselines is not None and file_type in BASELINE_FILE_TYPES:
+                baselines.update_from_csv(output_file, report_name)
+        store.clear()
+
+        if summary.get('triage'):
+            summary['triage'] = triage_report(summary['triage'])
+        summary_file = os.path.splitext(output_file)[0] + '_summary.json'
+        with open(summary_file, 'w') as f:
+            json.dump({'input': path, 'member': member.name, 'fileType': file_type,
+                       'summary': summary, 'profile': profiler.report()}, f, indent=2, default=str)
+        results.append({'member': member.name, 'fileType': file_type, 'output': output_file,
+                        'summary': {key: summary.get(key) for key in ('total_records', 'flagged_records')}})
+    return results
+
+# ================================================================================
+# DAEMON
+# ================================================================================
+
+def _signature(path):
+    """(size, mtime_ns) of path, or None if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class WatchDaemon:
+    """Event loop: watch, settle, hand ready files to the worker pool, record outcomes."""
+
+    def __init__(self, input_dir=DEFAULT_INPUT_DIR, output_dir=DEFAULT_OUTPUT_DIR, workers=DEFAULT_WORKERS,
+                 poll=False, baseline_location=None, store_location=None):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.workers = workers
+        self.poll = poll
+        self.baseline_location = baseline_location
+        self.store_location = store_location
+        self.budget_mb = default_budget_bytes() / 2**20 / workers
+        self.state_file = os.path.join(output_dir, STATE_FILE)
+        self.processed = self._load_state()
+        self.pending = {}     # path -> {'signature', 'stable_since', 'settle', 'closed', 'seen'}
+        self.in_flight = {}   # future -> (path, signature, seen)
+        self._stopping = False
+
+    # --- Ledger -----------------------------------------------------------------------
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(self.processed, f, indent=2)
+        os.replace(temp_file, self.state_file)
+
+    def _done_before(self, path, signature):
+        entry = self.processed.get(os.path.basename(path))
+        return entry is not None and [entry['size'], entry['mtime_ns']] == list(signature)
+
+    # --- Readiness --------------------------------------------------------------------
+
+    def note(self, path, closed, now, settle=SETTLE_SECONDS):
+        """Record a watcher event or scan hit for path."""
+        signature = _signature(path)
+        if signature is None or self._done_before(path, signature):
+            self.pending.pop(path, None)
+            return
+        entry = self.pending.get(path)
+        if entry is None or entry['signature'] != signature:
+            self.pending[path] = {'signature': signature, 'stable_since': now, 'settle': settle,
+                                  'closed': closed, 'seen': entry['seen'] if entry else now}
+        elif closed:
+            entry['closed'] = True
+
+    def ready(self, now):
+        """Pending paths that are complete and not already being processed, oldest first."""
+        busy = {path for path, _, _ in self.in_flight.values()}
+        ready = []
+        for path, entry in sorted(self.pending.items(), key=lambda item: item[1]['seen']):
+            if path in busy or self._done_before(path, entry['signature']):
+                continue
+            if _signature(path) != entry['signature']:
+                self.note(path, False, now, entry['settle'])
+                continue
+            if entry['closed'] or now - entry['stable_since'] >= entry['settle']:
+                ready.append(path)
+        return ready
+
+    # --- Loop -------------------------------------------------------------------------
+
+    def stop(self, *_):
+        """Stop taking new files; files in progress finish first."""
+        if not self._stopping:
+            print("Stopping: waiting for files in progress")
+        self._stopping = True
+
+    def run(self, once=False):
+        """Process files until stopped (or, with once, until the folder is drained)."""
+        os.makedirs(self.input_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Warm before the pool starts: forked workers inherit the loaded state
+        get_detection_rules()
+        get_lookup_manager()
+        self.pool = self._new_pool()
+        watcher = None if once else open_watcher(self.input_dir, self.poll)
+        print(f"Watching {self.input_dir} -> {self.output_dir} "
+              f"({watcher.name if watcher else 'once'}, {self.workers} workers, "
+              f"{self.budget_mb:.0f} MB each)")
+
+        # Files already waiting: complete in once mode, left to settle otherwise
+        now = time.monotonic()
+        for path in scan_directory(self.input_dir):
+            self.note(path, once, now)
+        last_rescan = now
+        try:
+            while True:
+                now = time.monotonic()
+                if not self._stopping:
+                    self._submit(now)
+                if once and not self.pending and not self.in_flight:
+                    break
+                if self._stopping and not self.in_flight:
+                    break
+
+                if watcher is None or self._stopping:
+                    if not self.in_flight:
+                        time.sleep(POLL_SECONDS)  # waiting for files to settle
+                    done, _ = wait(list(self.in_flight), timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                else:
+                    timeout = 0.0 if any(future.done() for future in self.in_flight) else POLL_SECONDS
+                    for path, closed in watcher.events(timeout):
+                        # inotify reports closes; polled files settle
+                        settle = RESCAN_SECONDS if isinstance(watcher, InotifyWatcher) else SETTLE_SECONDS
+                        self.note(path, closed, time.monotonic(), settle)
+                    if time.monotonic() - last_rescan >= RESCAN_SECONDS:
+                        for path in scan_directory(self.input_dir):
+                            if path not in self.pending:
+                                self.note(path, False, time.monotonic())
+                        last_rescan = time.monotonic()
+                    done = [future for future in self.in_flight if future.done()]
+                for future in done:
+                    self._finish(future)
+        finally:
+            if watcher is not None:
+                watcher.close()
+            self.pool.shutdown(wait=True)
+
+    def _new_pool(self):
+        context = multiprocessing.get_context()
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                   initializer=_init_worker, initargs=(context.Lock(),))
+
+    def _submit(self, now):
+        """Hand ready files to the pool while it has room (the rest wait on disk)."""
+        for path in self.ready(now):
+            if len(self.in_flight) >= self.workers + MAX_QUEUED:
+                break
+            entry = self.pending.pop(path)
+            sys.stdout.flush()  # forked workers would repeat unflushed output
+            future = self.pool.submit(process_file, path, self.output_dir, self.budget_mb,
+                                 self.baseline_location, self.store_location)
+            self.in_flight[future] = (path, entry['signature'], entry['seen'])
+            print(f"Queued {os.path.basename(path)} ({len(self.in_flight)} in progress)")
+
+    def _finish(self, future):
+        """Record a finished job in the ledger."""
+        path, signature, seen = self.in_flight.pop(future)
+        seconds = round(time.monotonic() - seen, 2)
+        entry = {'size': signature[0], 'mtime_ns': signature[1], 'seconds': seconds,
+                 'finished': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        try:
+            entry['results'] = future.result()
+            entry['status'] = 'completed'
+            outputs = ', '.join(os.path.basename(result['output']) for result in entry['results'])
+            print(f"Processed {os.path.basename(path)} in {seconds}s from detection -> {outputs}")
+        except Exception as e:
+            entry['status'] = 'failed'
+            entry['error'] = str(e) or type(e).__name__
+            print(f"Warning: Failed to process {os.path.basename(path)}: {entry['error']}")
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. killed for memory); its files fail and the pool is rebuilt
+                self.pool.shutdown(wait=False)
+                self.pool = self._new_pool()
+        self.processed[os.path.basename(path)] = entry
+        self._save_state()
+
+# ================================================================================
+# COMMAND LINE INTERFACE
+# ================================================================================
+
+def main():
+    """Command line interface."""
+    args = sys.argv[1:]
+    if '--help' in args or '-h' in args:
+        print("Usage: python -m core.watch_daemon [input dir] [output dir] [--workers N] [--poll] [--once] "
+              "[--baselines DIR | s3://bucket/prefix]")
+        return
+
+    options = {'--workers': str(DEFAULT_WORKERS), '--baselines': None}
+    flags = set()
+    positional = []
+    while args:
+        argument = args.pop(0)
+        if argument in options and args:
+            options[argument] = args.pop(0)
+        elif argument in ('--poll', '--once'):
+            flags.add(argument)
+        else:
+            positional.append(argument)
+
+    daemon = WatchDaemon(positional[0] if positional else DEFAULT_INPUT_DIR,
+                         positional[1] if len(positional) > 1 else DEFAULT_OUTPUT_DIR,
+                         workers=max(1, int(options['--workers'])), poll='--poll' in flags,
+                         baseline_location=options['--baselines'],
+                         store_location=os.environ.get(RESULT_STORE_ENV))
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run(once='--once' in flags)
+
+if __name__ == "__main__":
+    main()
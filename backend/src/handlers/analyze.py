@@ -1,5 +1,4 @@
 import json
-import boto3
 import os
 import tempfile
 import traceback
@@ -7,119 +6,207 @@ from datetime import datetime
 import sys
 sys.path.append('/opt/python')
 
+# Lookup files ship in the layer under /opt/python/data and are read relative to
+# the CWD, partly at import time (sap_analyzer), so change into it before importing
+if os.path.isdir('/opt/python/data'):
+    os.chdir('/opt/python')
+
 # Import core analysis modules
-from core.sm20_cleaner import sm20Cleaner
-from core.sap_analyzer import SAPAnalyzer
-from core.sap_output_generator import SAPOutputGenerator
+from core.archive_input import list_members
+from core.baselines import BASELINE_FILE_TYPES, S3BaselineStore, UserBaselines
+from core.checkpoint import S3CheckpointStore, run_checkpointed
+from core.memory_governor import MemoryGovernor
+from core.result_store import ResultStore
+from core.sm20_cleaner import detect_file_type
+from core.sap_analyzer import combine_summaries
+from core.sketches import triage_report
+from core.sap_output_generator import PROCESSORS
+from core.profiling import profile_run, profile_stage
+from core.warm_cache import get_client, get_detection_rules, get_lookup_manager, get_resource, warm_up
+
+# Chunk checkpoints live under this prefix, per analysis and archive member
+CHECKPOINT_PREFIX = 'checkpoints'
+
+# Per-user behaviour baselines (scored against, then updated after each analysis)
+BASELINE_PREFIX = os.environ.get('BASELINE_PREFIX', 'baselines')
+
+# Partitioned store (system/year/month/day) all results are appended to
+RESULT_STORE_PREFIX = os.environ.get('RESULT_STORE_PREFIX', 'store')
+
+# Errors a re-run cannot fix (unsupported file type, no data members, column
+# mismatch, malformed event): such failures are not marked resumable
+PERMANENT_ERRORS = (ValueError, KeyError)
+
+# Full per-stage profile report, written next to the results; the analyses
+# table only holds the report aggregated by stage name (items are limited to 400 KB)
+PROFILE_REPORT_NAME = 'profile.json'
+
+# Build lookups, rules and clients once per container; warm invocations reuse them
+warm_up()
 
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+def _analyze_member(input_file, member, file_type, temp_dir, lookup_manager, s3, bucket, results_key, store,
+                    baselines):
+    """Clean, analyze and enrich one export chunk by chunk and upload the result; returns its summary."""
+    # Steps 1-3 per chunk, committed to the checkpoint store so a re-run resumes;
+    # chunks are sized to the function's memory
+    enriched_file = os.path.join(temp_dir, f"{file_type}_analyzed.csv")
+    summary = run_checkpointed(input_file, file_type, enriched_file, store, lookup_manager, member,
+                               governor=MemoryGovernor(), baselines=baselines)
+
+    # Upload results to S3
+    with profile_stage('s3.upload') as stage:
+        stage.bytes_written = os.path.getsize(enriched_file)
+        s3.upload_file(enriched_file, bucket, results_key)
+
+    # Append to the partitioned store for cross-report queries (replaces a retry's files)
+    ResultStore(f"s3://{bucket}/{RESULT_STORE_PREFIX}", s3).append_csv(enriched_file, file_type, results_key)
+
+    # Learn this export into the baselines (keyed by result, so a retry is not counted twice)
+    if file_type in BASELINE_FILE_TYPES:
+        baselines.update_from_csv(enriched_file, results_key)
+    return summary
+
+def _checkpoint_committed(stores):
+    """Whether any member's checkpoint holds a committed chunk a re-run can resume from."""
+    for store in stores:
+        try:
+            state = store.load_state()
+        except Exception:
+            continue
+        if state and state.get('chunks_done'):
+            return True
+    return False
 
 def lambda_handler(event, context):
     """
     Lambda handler for SAP file analysis
-    
+
     Expected event structure:
     {
         "bucket": "sapanalyzer4-uploads",
-        "key": "uploads/123/SM20_export.csv",
+        "key": "uploads/123/SM20_export.csv",  # also .gz, .zst or a .zip of exports
         "analysisId": "123",
         "fileType": "SM20"  # or "CDHDR" or "CDPOS"
     }
     """
+    stores = []  # checkpoint store of each archive member started
     try:
-        # Extract parameters
+        # Extract parameters (direct invoke or API Gateway proxy)
+        if 'body' in event:
+            event = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
         bucket = event['bucket']
         key = event['key']
         analysis_id = event['analysisId']
         file_type = event.get('fileType', 'SM20')
-        
-        # Create temp directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Download file from S3
-            input_file = os.path.join(temp_dir, 'input.csv')
-            s3.download_file(bucket, key, input_file)
-            
-            # Step 1: Clean the file
-            cleaner = sm20Cleaner()
-            cleaned_file = os.path.join(temp_dir, 'cleaned.csv')
-            
-            if file_type == 'SM20':
-                cleaner.clean_sm20(input_file, cleaned_file)
-            elif file_type == 'CDHDR':
-                cleaner.clean_cdhdr(input_file, cleaned_file)
-            elif file_type == 'CDPOS':
-                cleaner.clean_cdpos(input_file, cleaned_file)
-            else:
-                raise ValueError(f"Unsupported file type: {file_type}")
-            
-            # Step 2: Analyze the cleaned file
-            analyzer = SAPAnalyzer()
-            analyzed_file = os.path.join(temp_dir, 'analyzed.csv')
-            
-            # Run analysis
-            summary = analyzer.analyze_files(
-                sm20_file=cleaned_file if file_type == 'SM20' else None,
-                cdhdr_file=cleaned_file if file_type == 'CDHDR' else None,
-                cdpos_file=cleaned_file if file_type == 'CDPOS' else None,
-                output_dir=temp_dir
-            )
-            
-            # Step 3: Generate enriched output
-            generator = SAPOutputGenerator()
-            enriched_files = generator.generate_outputs(temp_dir, temp_dir)
-            
-            # Upload results to S3
-            results_key = f"results/{analysis_id}/{file_type}_analyzed.csv"
-            
-            # Find the enriched file
-            for file in enriched_files:
-                if file_type.lower() in file.lower():
-                    s3.upload_file(file, bucket, results_key)
-                    break
-            
-            # Store analysis metadata in DynamoDB
-            table = dynamodb.Table(os.environ.get('ANALYSIS_TABLE', 'sapanalyzer4-analyses'))
-            table.put_item(
-                Item={
-                    'analysisId': analysis_id,
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'fileType': file_type,
-                    'inputKey': key,
-                    'resultKey': results_key,
-                    'summary': json.dumps(summary),
-                    'status': 'completed'
-                }
-            )
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'analysisId': analysis_id,
-                    'resultKey': results_key,
-                    'summary': summary
-                })
-            }
-            
+        if file_type not in PROCESSORS:
+            raise ValueError(f"Unsupported file type: {file_type}")
+
+        with profile_run(analysis_id) as profiler, tempfile.TemporaryDirectory() as temp_dir:
+            # Reuse the container's state, rebuilding anything whose data files changed
+            with profile_stage('warm.check'):
+                s3 = get_client('s3')
+                get_detection_rules()
+                lookup_manager = get_lookup_manager()
+                baselines = UserBaselines(S3BaselineStore(bucket, BASELINE_PREFIX, s3))
+
+            # Download file from S3 (keep the name so xlsx, archives and SM20.csv.gz are recognised)
+            input_file = os.path.join(temp_dir, os.path.basename(key) or 'input.csv')
+            with profile_stage('s3.download') as stage:
+                s3.download_file(bucket, key, input_file)
+                stage.bytes_read = os.path.getsize(input_file)
+
+            # Archives may hold several exports; each is decompressed while it is read
+            members = list_members(input_file)
+            if not members:
+                raise ValueError(f"No SM20/CDHDR/CDPOS files found in {key}")
+            results = []
+            for index, member in enumerate(members):
+                member_type = file_type if len(members) == 1 else detect_file_type(member.name, file_type)
+                result_name = member_type if len(members) == 1 else os.path.splitext(os.path.basename(member.name))[0]
+                results_key = f"results/{analysis_id}/{result_name}_analyzed.csv"
+                store = S3CheckpointStore(bucket, f"{CHECKPOINT_PREFIX}/{analysis_id}/{index}", s3)
+                stores.append(store)
+                summary = _analyze_member(input_file, member, member_type, temp_dir, lookup_manager,
+                                          s3, bucket, results_key, store, baselines)
+                results.append({'member': member.name, 'fileType': member_type,
+                                'resultKey': results_key, 'summary': summary})
+
+        # Results are stored; the checkpoints are no longer needed
+        for store in stores:
+            store.clear()
+
+        profile_key = f"results/{analysis_id}/{PROFILE_REPORT_NAME}"
+        s3.put_object(Bucket=bucket, Key=profile_key, ContentType='application/json',
+                      Body=json.dumps(profiler.report(), default=str).encode())
+        summary = combine_summaries([result['summary'] for result in results])
+        # The merged triage sketches are stored once, not in every summary
+        triage = summary.pop('triage', None)
+        for result in results:
+            result['summary'].pop('triage', None)
+        triage_summary = triage_report(triage) if triage else {}
+        results_key = results[0]['resultKey']
+
+        # Store analysis metadata in DynamoDB
+        item = {
+            'analysisId': analysis_id,
+            'timestamp': datetime.utcnow().isoformat(),
+            'fileType': '+'.join(sorted({result['fileType'] for result in results})),
+            'inputKey': key,
+            'resultKey': results_key,
+            'summary': json.dumps(summary),
+            'profile': json.dumps(profiler.summary(), default=str),
+            'profileKey': profile_key,
+            'status': 'completed'
+        }
+        if len(results) > 1:
+            item['results'] = json.dumps(results)
+        if triage:
+            # Raw sketches merge with other analyses; the report is what the frontend shows
+            item['triage'] = json.dumps(triage)
+            item['triageReport'] = json.dumps(triage_summary, default=str)
+        table = get_resource('dynamodb').Table(os.environ.get('ANALYSIS_TABLE', 'sapanalyzer4-analyses'))
+        table.put_item(Item=item)
+
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'analysisId': analysis_id,
+                'resultKey': results_key,
+                'summary': summary,
+                'results': results,
+                'triageReport': triage_summary
+            }, default=str)
+        }
+
     except Exception as e:
         print(f"Error processing file: {str(e)}")
         print(traceback.format_exc())
-        
+
         # Update status in DynamoDB
         if 'analysis_id' in locals():
-            table = dynamodb.Table(os.environ.get('ANALYSIS_TABLE', 'sapanalyzer4-analyses'))
-            table.put_item(
-                Item={
-                    'analysisId': analysis_id,
-                    'timestamp': datetime.utcnow().isoformat(),
-                    'status': 'failed',
-                    'error': str(e)
-                }
-            )
-        
+            table = get_resource('dynamodb').Table(os.environ.get('ANALYSIS_TABLE', 'sapanalyzer4-analyses'))
+            item = {
+                'analysisId': analysis_id,
+                'timestamp': datetime.utcnow().isoformat(),
+                'status': 'failed',
+                'error': str(e),
+                # Re-posting the same analysisId resumes from the last committed chunk
+                'resumable': (not isinstance(e, PERMANENT_ERRORS)
+                              and _checkpoint_committed(stores))
+            }
+            if 'profiler' in locals():
+                item['profile'] = json.dumps(profiler.summary(), default=str)
+            table.put_item(Item=item)
+
         return {
             'statusCode': 500,
+            'headers': {
+                'Access-Control-Allow-Origin': '*'
+            },
             'body': json.dumps({
                 'error': str(e)
             })
-        }
\ No newline at end of file
+        }
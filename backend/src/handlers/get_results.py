@@ -49,10 +49,26 @@ def lambda_handler(event, context):
                 ExpiresIn=3600  # 1 hour
             )
             item['downloadUrl'] = download_url
+
+            # Multi-file archives get a download per export
+            if isinstance(item.get('results'), str):
+                item['results'] = json.loads(item['results'])
+                for result in item['results']:
+                    result['downloadUrl'] = s3.generate_presigned_url(
+                        'get_object',
+                        Params={'Bucket': bucket, 'Key': result['resultKey']},
+                        ExpiresIn=3600
+                    )
         
         # Parse summary if it's a string
         if 'summary' in item and isinstance(item['summary'], str):
             item['summary'] = json.loads(item['summary'])
+        if 'profile' in item and isinstance(item['profile'], str):
+            item['profile'] = json.loads(item['profile'])
+        # Top users/tcodes and distinct counts answered from the stored sketches
+        if 'triageReport' in item and isinstance(item['triageReport'], str):
+            item['triageReport'] = json.loads(item['triageReport'])
+        item.pop('triage', None)
         
         return {
             'statusCode': 200,
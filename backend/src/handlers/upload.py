@@ -1,4 +1,5 @@
 import json
+import math
 import boto3
 import uuid
 import os
@@ -6,54 +7,204 @@ from datetime import datetime
 
 s3 = boto3.client('s3')
 
+# Content type signed into the upload URL, by file extension
+CONTENT_TYPES = {
+    '.csv': 'text/csv',
+    '.txt': 'text/plain',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.gz': 'application/gzip',
+    '.zip': 'application/zip',
+    '.zst': 'application/zstd',
+}
+
+# Multipart upload sizing (S3 allows 5 MB - 5 GB parts and at most 10,000 parts)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Presigned part URLs handed out per request
+PART_URL_BATCH = 100
+
+URL_EXPIRY_SECONDS = 3600  # 1 hour
+
+def _response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS'
+        },
+        'body': json.dumps(body)
+    }
+
+def _bucket():
+    return os.environ.get('UPLOAD_BUCKET', 'sapanalyzer4-uploads')
+
+def _content_type(file_name):
+    return CONTENT_TYPES.get(os.path.splitext(file_name)[1].lower(), 'application/octet-stream')
+
+def _part_size(file_size):
+    """Smallest part size >= DEFAULT_PART_SIZE that keeps the upload within MAX_PARTS."""
+    return max(DEFAULT_PART_SIZE, MIN_PART_SIZE, math.ceil(file_size / MAX_PARTS))
+
+def _part_urls(bucket, key, upload_id, part_numbers):
+    """Presigned upload_part URLs keyed by part number."""
+    return {
+        str(part_number): s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=URL_EXPIRY_SECONDS
+        )
+        for part_number in part_numbers
+    }
+
+def _uploaded_parts(bucket, key, upload_id):
+    """Parts S3 already holds for the upload, in part order."""
+    parts = []
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            parts.append({'PartNumber': part['PartNumber'], 'ETag': part['ETag'], 'Size': part['Size']})
+    return parts
+
+# ================================================================================
+# ACTIONS
+# ================================================================================
+
+def presign_put(body):
+    """Single presigned PUT for the whole file (small files)."""
+    file_name = body['fileName']
+    analysis_id = str(uuid.uuid4())
+    key = f"uploads/{analysis_id}/{file_name}"
+    content_type = _content_type(file_name)
+
+    presigned_url = s3.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': _bucket(),
+            'Key': key,
+            'ContentType': content_type
+        },
+        ExpiresIn=URL_EXPIRY_SECONDS
+    )
+    return {
+        'uploadUrl': presigned_url,
+        'analysisId': analysis_id,
+        'key': key,
+        'contentType': content_type
+    }
+
+def initiate_multipart(body):
+    """Start a multipart upload and return its part layout and the first batch of part URLs."""
+    file_name = body['fileName']
+    file_size = int(body['fileSize'])
+    analysis_id = str(uuid.uuid4())
+    key = f"uploads/{analysis_id}/{file_name}"
+    bucket = _bucket()
+    content_type = _content_type(file_name)
+
+    upload = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+    part_size = _part_size(file_size)
+    part_count = max(1, math.ceil(file_size / part_size))
+
+    return {
+        'analysisId': analysis_id,
+        'key': key,
+        'uploadId': upload['UploadId'],
+        'partSize': part_size,
+        'partCount': part_count,
+        'partUrls': _part_urls(bucket, key, upload['UploadId'], range(1, min(part_count, PART_URL_BATCH) + 1))
+    }
+
+def presign_parts(body):
+    """Presigned URLs for the requested part numbers (at most PART_URL_BATCH)."""
+    part_numbers = [int(n) for n in body['partNumbers']]
+    if len(part_numbers) > PART_URL_BATCH:
+        raise ValueError(f"At most {PART_URL_BATCH} part URLs per request")
+    if any(n < 1 or n > MAX_PARTS for n in part_numbers):
+        raise ValueError(f"Part numbers must be between 1 and {MAX_PARTS}")
+    return {'partUrls': _part_urls(_bucket(), body['key'], body['uploadId'], part_numbers)}
+
+def upload_status(body):
+    """Parts already uploaded, so an interrupted client can resume with the rest."""
+    return {'parts': _uploaded_parts(_bucket(), body['key'], body['uploadId'])}
+
+def complete_multipart(body):
+    """
+    Assemble the uploaded parts. The client may send its parts list; otherwise
+    the parts S3 holds are used (browsers cannot always read the ETag header).
+    """
+    bucket = _bucket()
+    parts = body.get('parts') or _uploaded_parts(bucket, body['key'], body['uploadId'])
+    if not parts:
+        raise ValueError("No parts have been uploaded")
+    if 'partCount' in body and len(parts) != int(body['partCount']):
+        raise ValueError(f"{len(parts)} of {body['partCount']} parts uploaded; upload the missing parts first")
+
+    parts = sorted(({'PartNumber': int(p['PartNumber']), 'ETag': p['ETag']} for p in parts),
+                   key=lambda p: p['PartNumber'])
+    s3.complete_multipart_upload(
+        Bucket=bucket,
+        Key=body['key'],
+        UploadId=body['uploadId'],
+        MultipartUpload={'Parts': parts}
+    )
+    return {'key': body['key'], 'parts': len(parts)}
+
+def abort_multipart(body):
+    """Discard an upload the client gave up on."""
+    s3.abort_multipart_upload(Bucket=_bucket(), Key=body['key'], UploadId=body['uploadId'])
+    return {'key': body['key'], 'aborted': True}
+
+ACTIONS = {
+    'presign': presign_put,
+    'initiate': initiate_multipart,
+    'parts': presign_parts,
+    'status': upload_status,
+    'complete': complete_multipart,
+    'abort': abort_multipart,
+}
+
 def lambda_handler(event, context):
     """
-    Generate pre-signed URL for file upload
-    
+    Generate pre-signed URLs for file upload
+
     Expected event structure:
     {
-        "fileName": "SM20_export.csv",
+        "fileName": "SM20_export.csv",  # or .xlsx, .gz, .zst, .zip
         "fileType": "SM20"
     }
+
+    Large files use a multipart upload, selected with "action":
+        initiate  {fileName, fileSize}             -> uploadId, partSize, partCount, first part URLs
+        parts     {key, uploadId, partNumbers}     -> more part URLs
+        status    {key, uploadId}                  -> parts already uploaded (resume)
+        complete  {key, uploadId, [parts], [partCount]}
+        abort     {key, uploadId}
+
+    Invalid requests get 400; an uploadId S3 does not know (completed,
+    aborted or expired) gets 404.
     """
     try:
         # Parse request
         body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-        file_name = body['fileName']
-        file_type = body.get('fileType', 'SM20')
-        
-        # Generate unique analysis ID
-        analysis_id = str(uuid.uuid4())
-        
-        # Create S3 key
-        key = f"uploads/{analysis_id}/{file_name}"
-        bucket = os.environ.get('UPLOAD_BUCKET', 'sapanalyzer4-uploads')
-        
-        # Generate pre-signed URL for upload
-        presigned_url = s3.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': bucket,
-                'Key': key,
-                'ContentType': 'text/csv'
-            },
-            ExpiresIn=3600  # 1 hour
-        )
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS'
-            },
-            'body': json.dumps({
-                'uploadUrl': presigned_url,
-                'analysisId': analysis_id,
-                'key': key
-            })
-        }
-        
+        action = body.get('action', 'presign')
+        if action not in ACTIONS:
+            return _response(400, {'error': f"Unknown action: {action}"})
+
+        return _response(200, ACTIONS[action](body))
+
+    except KeyError as e:
+        # Missing request field (key, uploadId, ...): the client has to fix the request
+        return _response(400, {'error': f"Missing field: {e.args[0]}"})
+    except ValueError as e:
+        # Invalid part numbers, missing or no uploaded parts, malformed body: not transient
+        return _response(400, {'error': str(e)})
+    except s3.exceptions.NoSuchUpload:
+        # Unknown, completed or aborted uploadId: nothing to resume
+        return _response(404, {'error': f"Upload not found: {body.get('uploadId')}"})
     except Exception as e:
         return {
             'statusCode': 500,
@@ -63,4 +214,4 @@ def lambda_handler(event, context):
             'body': json.dumps({
                 'error': str(e)
             })
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,13 @@
+"""Test setup: the core package lives in backend/src and reads lookups from src/data."""
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+os.chdir(SRC_DIR)  # lookup files are read relative to src/ (partly at import)
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
@@ -0,0 +1,61 @@
+import json
+
+import boto3
+import pytest
+
+moto = pytest.importorskip('moto')
+
+BUCKET = 'test-data'
+TABLE = 'test-analyses'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    with moto.mock_aws():
+        from handlers import analyze
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket=BUCKET)
+        s3.put_object(Bucket=BUCKET, Key='uploads/a1/SM20.csv',
+                      Body=b'Date,Time,User,Event\n01.02.2024,08:00:00,U1,AU2\n')
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(TableName=TABLE, KeySchema=[{'AttributeName': 'analysisId', 'KeyType': 'HASH'}],
+                              AttributeDefinitions=[{'AttributeName': 'analysisId', 'AttributeType': 'S'}],
+                              BillingMode='PAY_PER_REQUEST')
+        monkeypatch.setenv('ANALYSIS_TABLE', TABLE)
+        monkeypatch.setattr(analyze, 'get_client', lambda service: s3)
+        monkeypatch.setattr(analyze, 'get_resource', lambda service: dynamodb)
+        yield analyze, dynamodb.Table(TABLE)
+
+
+def _fail_run(analyze, monkeypatch, error, commit):
+    """Make the checkpointed run raise error, optionally after committing a chunk."""
+    def run_checkpointed(input_file, file_type, output_file, store, *args, **kwargs):
+        if commit:
+            store.save_state({'chunks_done': 1, 'rows_done': 1})
+        raise error
+    monkeypatch.setattr(analyze, 'run_checkpointed', run_checkpointed)
+
+
+def _analyze(analyze, table, **event):
+    event = dict({'bucket': BUCKET, 'key': 'uploads/a1/SM20.csv', 'analysisId': 'a1'}, **event)
+    response = analyze.lambda_handler({'body': json.dumps(event)}, None)
+    assert response['statusCode'] == 500
+    item = table.get_item(Key={'analysisId': 'a1'})['Item']
+    assert item['status'] == 'failed'
+    return item
+
+
+@pytest.mark.parametrize('error, commit, resumable', [
+    (TimeoutError('interrupted'), True, True),
+    (TimeoutError('interrupted'), False, False),
+    (ValueError('Chunk 2 produced different columns than earlier chunks'), True, False),
+])
+def test_resumable_only_after_a_commit_and_transient_error(aws, monkeypatch, error, commit, resumable):
+    analyze, table = aws
+    _fail_run(analyze, monkeypatch, error, commit)
+    assert _analyze(analyze, table)['resumable'] is resumable
+
+
+def test_validation_errors_are_not_resumable(aws):
+    analyze, table = aws
+    assert _analyze(analyze, table, fileType='SM21')['resumable'] is False
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('polars')
+
+from core.dataframe_backend import NULL_STRINGS, PandasBackend, PolarsBackend  # noqa: E402
+
+# Values the cleaner and detectors see in real exports, plus the awkward ones
+STRINGS = ['SAPUSER', '  padded  ', 'a  b\t\tc', 'line\nbreak', '\x1cFS\x1f', 'x\x1d\x1ey',
+           'nbsp\xa0here', '\xa0\u2003edge\u3000', 'zero\u200bwidth', 'bell\x07', '\xfcmlaut',
+           '', ' ', '\t', *NULL_STRINGS, ' NULL ', 'null', 'N/A']
+MIXED = [1, 1.0, True, '1', 'True', 2.5, -0.0, None, np.nan, pd.NaT, b'bytes', ('a', 1)]
+
+SERIES = {
+    'strings': pd.Series(STRINGS * 3, dtype=object),
+    'strings_with_missing': pd.Series([None, np.nan] + STRINGS, dtype=object),
+    'all_missing': pd.Series([None, np.nan, None], dtype=object),
+    'mixed_objects': pd.Series(MIXED + STRINGS, dtype=object),
+    'integers': pd.Series([3, 1, 3, 2]),
+    'floats_with_nan': pd.Series([1.5, np.nan, 1.5, 2.0]),
+    'empty': pd.Series([], dtype=object),
+}
+
+
+@pytest.fixture(scope='module')
+def backends():
+    return PandasBackend(), PolarsBackend()
+
+
+@pytest.mark.parametrize('name', sorted(SERIES))
+def test_clean_strings(backends, name):
+    pandas_backend, polars_backend = backends
+    frame = pd.DataFrame({'A': SERIES[name], 'B': SERIES[name].iloc[::-1].to_numpy()})
+    expected = pandas_backend.clean_strings(frame.copy(), ['A', 'B'])
+    actual = polars_backend.clean_strings(frame.copy(), ['A', 'B'])
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+@pytest.mark.parametrize('name', sorted(SERIES))
+def test_factorize(backends, name):
+    pandas_backend, polars_backend = backends
+    expected_codes, expected_uniques = pandas_backend.factorize(SERIES[name])
+    codes, uniques = polars_backend.factorize(SERIES[name])
+    # Same rendering per row; code numbering may differ
+    assert list(uniques[codes]) == list(expected_uniques[expected_codes])
+    assert len(uniques) == len(expected_uniques)
+
+
+@pytest.mark.parametrize('name', sorted(SERIES))
+def test_map_lookup(backends, name):
+    pandas_backend, polars_backend = backends
+    lookup = {'SAPUSER': 'Standard user', 'padded': 'Stripped key', 'a  b\t\tc': 'Inner whitespace',
+              'nbsp\xa0here': 'NBSP', 'FS': 'Separators stripped', '1': 'One', 'True': 'Truth',
+              '2.5': 'Float', 'nan': 'Not a number', '1.5': np.nan, '3': 3}
+    expected = pandas_backend.map_lookup(SERIES[name], lookup)
+    actual = polars_backend.map_lookup(SERIES[name], lookup)
+    # Descriptions are compared as they are written to the CSV
+    assert list(_as_written(actual)) == list(_as_written(expected))
+    assert actual.index.equals(expected.index)
+
+
+def _as_written(series):
+    return series.map(lambda value: '' if pd.isna(value) else str(value))
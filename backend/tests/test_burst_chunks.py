@@ -0,0 +1,59 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+from core.checkpoint import LocalCheckpointStore, run_checkpointed
+from core.sap_output_generator import LookupManager
+
+ROWS = 4000
+BURSTS = 30
+BURST_EVENTS = 8
+# Failed logons of the same user and terminal on other days
+STRAY_EVENTS = 4
+
+
+def _shuffled_export(path):
+    """Synthetic SM20 with failed-logon bursts injected, rows in random order."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        synthetic.generate_export('SM20', ROWS, path, seed=3)
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    rng = np.random.default_rng(3)
+    per_group = BURST_EVENTS + STRAY_EVENTS
+    rows = rng.choice(len(df), BURSTS * per_group, replace=False)
+    for burst in range(BURSTS):
+        picked = rows[burst * per_group:(burst + 1) * per_group]
+        start = pd.Timestamp('2024-02-01 08:00:00') + pd.Timedelta(hours=burst)
+        offsets = [pd.Timedelta(seconds=int(s)) for s in rng.integers(0, 240, BURST_EVENTS)]
+        offsets += [pd.Timedelta(days=int(d)) for d in rng.integers(-20, 20, STRAY_EVENTS)]
+        times = [start + offset for offset in offsets]
+        df.loc[picked, 'Date'] = [time.strftime('%d.%m.%Y') for time in times]
+        df.loc[picked, 'Time'] = [time.strftime('%H:%M:%S') for time in times]
+        df.loc[picked, 'User'] = f'BRUTE{burst:02d}'
+        df.loc[picked, 'Terminal Name'] = 'T1'
+        df.loc[picked, 'Event'] = 'AU2'
+    df.sample(frac=1, random_state=3).to_csv(path, index=False)
+
+
+def _run(export, directory, chunk_rows):
+    output = directory / f'out_{chunk_rows}.csv'
+    with contextlib.redirect_stdout(io.StringIO()):
+        store = LocalCheckpointStore(str(directory / str(chunk_rows)))
+        summary = run_checkpointed(export, 'SM20', str(output), store, LookupManager(), chunk_rows=chunk_rows)
+    return pd.read_csv(output, dtype=str, keep_default_na=False), summary
+
+
+def test_chunked_bursts_match_whole_file_on_shuffled_input(tmp_path):
+    export = str(tmp_path / 'SM20_export.csv')
+    _shuffled_export(export)
+
+    whole, whole_summary = _run(export, tmp_path, ROWS)
+    assert (whole['BURST_FLAG'] != '').sum() >= BURSTS * BURST_EVENTS
+
+    for chunk_rows in (250, 1000):
+        chunked, summary = _run(export, tmp_path, chunk_rows)
+        pd.testing.assert_frame_equal(chunked, whole)
+        assert summary['flagged_records'] == whole_summary['flagged_records']
+        assert summary['flag_counts'] == whole_summary['flag_counts']
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import synthetic
+from core import sap_output_generator as gen
+from core.query_engine import EXAMPLE_QUERIES, QueryEngine
+from core.sap_analyzer import analyze_sap_activities
+from core.sm20_cleaner import clean_sap_file
+
+PROCESSORS = {'SM20': gen.process_sm20_data, 'CDHDR': gen.process_cdhdr_data, 'CDPOS': gen.process_cdpos_data}
+
+
+def _export(directory, file_type, rows, headers=None, seed=7):
+    path = os.path.join(directory, f'{file_type}_export.csv')
+    with contextlib.redirect_stdout(io.StringIO()):
+        synthetic.generate_export(file_type, rows, path, seed=seed, headers=headers)
+    return path
+
+
+def _pipeline(directory, file_type, export):
+    """Clean, analyze and enrich an export into directory, named as the pipeline names its files."""
+    cleaned = os.path.join(directory, f'{file_type}_export_cleaned.csv')
+    analyzed = os.path.join(directory, f'{file_type}_export_analyzed.csv')
+    with contextlib.redirect_stdout(io.StringIO()):
+        clean_sap_file(export, file_type, cleaned)
+        analyze_sap_activities(cleaned, analyzed)
+        df = PROCESSORS[file_type](pd.read_csv(analyzed, encoding='utf-8-sig'), gen.LookupManager())
+    df.to_csv(os.path.join(directory, f'SAP_Analysis_Report_test_{file_type}.csv'), index=False,
+              encoding='utf-8-sig')
+    os.remove(export)
+
+
+@pytest.fixture(scope='module')
+def output_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('output'))
+    exports = {file_type: _export(directory, file_type, 3000) for file_type in PROCESSORS}
+    # Synthetic CDPOS items are generated independently; attach them to the CDHDR headers
+    headers = pd.read_csv(exports['CDHDR'], dtype=str, keep_default_na=False)
+    items = pd.read_csv(exports['CDPOS'], dtype=str, keep_default_na=False)
+    for header, item in [('OBJECTCLAS', 'Object'), ('OBJECTID', 'Object Value'), ('CHANGENR', 'CHANGENR')]:
+        items[item] = headers[header].to_numpy()
+    items.to_csv(exports['CDPOS'], index=False)
+    for file_type, export in exports.items():
+        _pipeline(directory, file_type, export)
+    return directory
+
+
+@pytest.mark.parametrize('example', sorted(EXAMPLE_QUERIES))
+def test_example_queries_run(output_dir, example):
+    engine = QueryEngine()
+    engine.register_directory(output_dir)
+    engine.register_lookups()
+    try:
+        df = engine.query(EXAMPLE_QUERIES[example])
+    finally:
+        engine.close()
+    assert len(df) > 0
+
+
+def test_descriptive_and_technical_headers_share_columns(tmp_path):
+    # Synthetic CDPOS defaults to descriptive headers, CDHDR to technical ones
+    _pipeline(str(tmp_path), 'CDPOS', _export(str(tmp_path), 'CDPOS', 200, headers='technical', seed=1))
+    month = tmp_path / 'month2'
+    month.mkdir()
+    _pipeline(str(month), 'CDPOS', _export(str(month), 'CDPOS', 300, seed=2))
+
+    engine = QueryEngine()
+    engine.register_directory(str(tmp_path))
+    df = engine.query("SELECT SOURCE_FILE, COUNT(*) AS n, SUM(TABNAME <> '') AS tables, "
+                      "SUM(OBJECTID <> '') AS objects FROM cdpos_enriched GROUP BY SOURCE_FILE")
+    columns = engine.query("SELECT * FROM cdpos_enriched LIMIT 1").columns
+    engine.close()
+
+    assert sorted(df['n']) == [200, 300]
+    assert (df['tables'] == df['n']).all() and (df['objects'] == df['n']).all()
+    assert not {'TABLE NAME', 'FIELD NAME', 'OBJECT', 'OBJECT VALUE'} & set(columns)
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from core.result_diff import diff_results
+
+
+def _write(path, rows):
+    pd.DataFrame(rows, columns=['USER', 'TIME', 'EVENT', 'DEBUG_FLAG']).to_csv(path, index=False)
+
+
+def test_changed_counts_only_matched_rows(tmp_path):
+    before, after = tmp_path / 'before.csv', tmp_path / 'after.csv'
+    _write(before, [['U1', '10:00', 'AU2', ''],
+                    ['U2', '10:01', 'AU2', 'Debug:A'],
+                    ['U3', '10:02', 'AU3', 'Debug:B']])
+    _write(after, [['U1', '10:00', 'AU2', 'Debug:A'],
+                   ['U2', '10:01', 'AU2', 'Debug:A'],
+                   ['U4', '10:03', 'AU3', 'Debug:C']])
+
+    diff_file = tmp_path / 'diff.csv'
+    summary = diff_results(str(before), str(after), str(diff_file))
+
+    rows = summary['rows']
+    assert (rows['matched'], rows['added'], rows['removed']) == (2, 1, 1)
+    # The removed and added rows carry flags too, but only U1 changed
+    assert rows['changed'] == 1
+    diff = pd.read_csv(diff_file, dtype=str, keep_default_na=False)
+    assert (diff['STATUS'] == 'changed').sum() == rows['changed']
@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.sketches import CountMinSketch, HyperLogLog, KeyedHyperLogLog, SpaceSaving, _pack
+from sketch_accuracy import build, zipf_stream
+
+ROWS = 50000
+KEYS = 5000
+SHARDS = 4
+
+
+def _merged(stream):
+    """Sketches of stream built in SHARDS parts and merged, plus the exact counts."""
+    parts = [build(part) for part in np.array_split(stream, SHARDS)]
+    cms, top, hll = parts[0]
+    for other_cms, other_top, other_hll in parts[1:]:
+        cms.merge(other_cms)
+        top.merge(other_top)
+        hll.merge(other_hll)
+    return cms, top, hll, pd.Series(stream).value_counts()
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_count_min_is_one_sided(seed):
+    stream = zipf_stream(ROWS, KEYS, seed)
+    cms, _, _, truth = _merged(stream)
+
+    over = np.array([cms.estimate(key) for key in truth.index]) - truth.values
+    assert (over >= 0).all()
+    violations = int((over > math.e / cms.width * len(stream)).sum())
+    assert violations <= len(truth) * math.exp(-cms.depth)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_space_saving_bounds_and_recall(seed):
+    stream = zipf_stream(ROWS, KEYS, seed)
+    _, top, _, truth = _merged(stream)
+
+    for key, count, error in top.top(top.k):
+        assert count - error <= truth.get(key, 0) <= count
+        assert error <= len(stream) / top.k
+    heavy = set(truth[truth > len(stream) / top.k].index)
+    assert heavy and heavy <= set(top.counts)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_hyperloglog_error_and_exact_merge(seed):
+    stream = zipf_stream(ROWS, KEYS, seed)
+    _, _, hll, truth = _merged(stream)
+
+    standard = 1.04 / math.sqrt(len(hll.registers))
+    assert abs(hll.estimate() - len(truth)) / len(truth) <= 4 * standard
+    _, _, single = build(stream)
+    assert np.array_equal(hll.registers, single.registers)
+
+
+def test_keyed_hyperloglog_error():
+    rng = np.random.default_rng(0)
+    distinct = {f'USER{i:03d}': int(rng.integers(1, 400)) for i in range(50)}
+    pairs = [(user, f'T{t:05d}') for user, count in distinct.items() for t in range(count)]
+    pairs = [pairs[i] for i in rng.permutation(len(pairs))]
+
+    keyed = KeyedHyperLogLog()
+    for start in range(0, len(pairs), 1000):
+        chunk = pairs[start:start + 1000]
+        keyed.add([user for user, _ in chunk], [terminal for _, terminal in chunk])
+
+    standard = 1.04 / math.sqrt(1 << keyed.precision)
+    for user, estimate in keyed.top(len(distinct)):
+        assert abs(estimate - distinct[user]) / distinct[user] <= 4 * standard
+
+
+def test_count_min_does_not_wrap():
+    shards = [CountMinSketch(), CountMinSketch()]
+    for shard in shards:
+        shard.add(['U1'], [3000000000])
+    merged = shards[0].merge(shards[1])
+    assert merged.estimate('U1') == 6000000000
+
+    restored = CountMinSketch.from_dict(merged.to_dict())
+    assert restored.estimate('U1') == 6000000000
+
+
+def test_count_min_reads_uint32_records():
+    sketch = CountMinSketch()
+    sketch.add(['U1', 'U2'], [5, 7])
+    record = sketch.to_dict()
+    # Records stored before the uint64 table carry no dtype
+    del record['dtype']
+    record['table'] = _pack(sketch.table.astype(np.uint32))
+
+    restored = CountMinSketch.from_dict(record)
+    assert (restored.estimate('U1'), restored.estimate('U2')) == (5, 7)
+
+
+def test_merge_is_exact_for_space_saving_below_k():
+    a, b = SpaceSaving(), SpaceSaving()
+    a.add(['X', 'Y'], [3, 2])
+    b.add(['X', 'Z'], [4, 1])
+    a.merge(b)
+    assert a.top() == [('X', 7, 0), ('Y', 2, 0), ('Z', 1, 0)]
+    assert HyperLogLog().merge(HyperLogLog()).estimate() == 0
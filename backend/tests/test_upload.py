@@ -0,0 +1,139 @@
+import json
+
+import boto3
+import pytest
+
+moto = pytest.importorskip('moto')
+
+from handlers import upload  # noqa: E402
+
+BUCKET = 'test-uploads'
+PART = b'x' * upload.MIN_PART_SIZE
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setenv('UPLOAD_BUCKET', BUCKET)
+        monkeypatch.setattr(upload, 's3', client)
+        yield client
+
+
+def _call(action=None, **body):
+    if action:
+        body['action'] = action
+    response = upload.lambda_handler({'body': json.dumps(body)}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def _initiate(file_size=len(PART) + 3):
+    status, body = _call('initiate', fileName='SM20_export.csv', fileSize=file_size)
+    assert status == 200
+    return body
+
+
+def _upload_parts(s3, started, chunks):
+    """Upload chunks as parts 1..n the way a client PUTs to the part URLs; returns the client parts list."""
+    parts = []
+    for number, chunk in enumerate(chunks, start=1):
+        etag = s3.upload_part(Bucket=BUCKET, Key=started['key'], UploadId=started['uploadId'],
+                              PartNumber=number, Body=chunk)['ETag']
+        parts.append({'PartNumber': number, 'ETag': etag})
+    return parts
+
+
+def test_presign(s3):
+    status, body = _call(fileName='SM20_export.csv', fileType='SM20')
+    assert status == 200
+    assert body['key'] == f"uploads/{body['analysisId']}/SM20_export.csv"
+    assert body['contentType'] == 'text/csv' and BUCKET in body['uploadUrl']
+
+
+def test_initiate_lays_out_parts(s3):
+    started = _initiate(file_size=upload.DEFAULT_PART_SIZE * 150 + 1)
+    assert started['partSize'] == upload.DEFAULT_PART_SIZE
+    assert started['partCount'] == 151
+    assert sorted(map(int, started['partUrls'])) == list(range(1, upload.PART_URL_BATCH + 1))
+    uploads = s3.list_multipart_uploads(Bucket=BUCKET)['Uploads']
+    assert [u['UploadId'] for u in uploads] == [started['uploadId']]
+
+
+def test_parts_returns_requested_urls(s3):
+    started = _initiate()
+    status, body = _call('parts', key=started['key'], uploadId=started['uploadId'], partNumbers=[101, 102])
+    assert status == 200
+    assert sorted(body['partUrls']) == ['101', '102']
+    assert 'partNumber=101' in body['partUrls']['101']
+
+
+def test_status_lists_uploaded_parts(s3):
+    started = _initiate()
+    _upload_parts(s3, started, [PART])
+    status, body = _call('status', key=started['key'], uploadId=started['uploadId'])
+    assert status == 200
+    assert [(p['PartNumber'], p['Size']) for p in body['parts']] == [(1, len(PART))]
+
+
+@pytest.mark.parametrize('client_parts', [True, False])
+def test_complete(s3, client_parts):
+    started = _initiate()
+    parts = _upload_parts(s3, started, [PART, b'end'])
+    request = {'key': started['key'], 'uploadId': started['uploadId'], 'partCount': len(parts)}
+    if client_parts:
+        request['parts'] = list(reversed(parts))  # order is not the client's job
+    status, body = _call('complete', **request)
+    assert status == 200
+    assert body == {'key': started['key'], 'parts': 2}
+    assert s3.get_object(Bucket=BUCKET, Key=started['key'])['Body'].read() == PART + b'end'
+
+
+def test_complete_rejects_missing_parts(s3):
+    started = _initiate()
+    _upload_parts(s3, started, [PART])
+    status, body = _call('complete', key=started['key'], uploadId=started['uploadId'], partCount=2)
+    assert status == 400
+    assert '1 of 2 parts uploaded' in body['error']
+    # Nothing was assembled; the client can upload the missing part and retry
+    assert s3.list_multipart_uploads(Bucket=BUCKET)['Uploads']
+
+
+def test_complete_without_parts(s3):
+    started = _initiate()
+    status, body = _call('complete', key=started['key'], uploadId=started['uploadId'])
+    assert (status, body['error']) == (400, 'No parts have been uploaded')
+
+
+def test_abort(s3):
+    started = _initiate()
+    _upload_parts(s3, started, [PART])
+    status, body = _call('abort', key=started['key'], uploadId=started['uploadId'])
+    assert (status, body) == (200, {'key': started['key'], 'aborted': True})
+    assert 'Uploads' not in s3.list_multipart_uploads(Bucket=BUCKET)
+
+
+@pytest.mark.parametrize('action', ['status', 'complete'])
+def test_unknown_upload_is_not_found(s3, action):
+    status, body = _call(action, key='uploads/x/SM20.csv', uploadId='no-such-upload')
+    assert status == 404
+    assert 'no-such-upload' in body['error']
+
+
+@pytest.mark.parametrize('request_body, error', [
+    ({'action': 'rename', 'fileName': 'a.csv'}, 'Unknown action: rename'),
+    ({'action': 'initiate', 'fileName': 'a.csv'}, 'Missing field: fileSize'),
+    ({'action': 'initiate', 'fileName': 'a.csv', 'fileSize': 'big'}, 'invalid literal'),
+    ({'action': 'status', 'key': 'uploads/x/a.csv'}, 'Missing field: uploadId'),
+    ({'action': 'parts', 'key': 'k', 'uploadId': 'u', 'partNumbers': [0]}, 'Part numbers must be between'),
+    ({'action': 'parts', 'key': 'k', 'uploadId': 'u', 'partNumbers': list(range(1, 102))}, 'At most 100'),
+])
+def test_invalid_requests(s3, request_body, error):
+    status, body = _call(**request_body)
+    assert status == 400
+    assert error in body['error']
+
+
+def test_malformed_body(s3):
+    response = upload.lambda_handler({'body': '{not json'}, None)
+    assert response['statusCode'] == 400
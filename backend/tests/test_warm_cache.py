@@ -0,0 +1,38 @@
+import os
+import shutil
+
+import pytest
+
+from core import sap_analyzer, warm_cache
+
+
+@pytest.fixture
+def compiles(monkeypatch):
+    """Count rule pack compiles instead of running them."""
+    calls = []
+    monkeypatch.setattr(sap_analyzer, 'reload_detection_data', lambda: calls.append(1) or 'recompiled')
+    warm_cache.clear()
+    yield calls
+    warm_cache.clear()
+
+
+def test_cold_start_adopts_import_time_rules(compiles):
+    assert warm_cache.get_detection_rules() is sap_analyzer.DETECTION_RULES
+    assert warm_cache.get_detection_rules() is sap_analyzer.DETECTION_RULES
+    assert compiles == []
+
+
+def test_rules_from_other_files_are_recompiled(compiles, monkeypatch, tmp_path):
+    # Same relative name, different file: the import-time rules were not built from it
+    copy = tmp_path / 'high_risk_tcodes.csv'
+    shutil.copy(sap_analyzer.HIGH_RISK_TCODES_FILE, copy)
+    monkeypatch.setattr(sap_analyzer, 'HIGH_RISK_TCODES_FILE', str(copy))
+    assert warm_cache.get_detection_rules() == 'recompiled'
+    assert len(compiles) == 1
+
+    assert warm_cache.get_detection_rules() == 'recompiled'
+    assert len(compiles) == 1
+    stat = os.stat(copy)
+    os.utime(copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    warm_cache.get_detection_rules()
+    assert len(compiles) == 2
@@ -56,7 +56,7 @@ const AnalysisResults = ({ results, onReset }) => {
       </div>
 
       <div className="download-section">
-        {results.downloadUrl && (
+        {results.downloadUrl && !results.results && (
           <a 
             href={results.downloadUrl} 
             className="download-btn"
@@ -65,6 +65,16 @@ const AnalysisResults = ({ results, onReset }) => {
             Download Analyzed CSV
           </a>
         )}
+        {results.results && results.results.map((result) => (
+          <a
+            key={result.member}
+            href={result.downloadUrl}
+            className="download-btn"
+            download
+          >
+            Download {result.member} ({result.fileType})
+          </a>
+        ))}
       </div>
 
       <div className="results-details">
@@ -16,7 +16,10 @@ const FileUpload = ({ onUpload, loading, error }) => {
     accept: {
       'text/csv': ['.csv'],
       'application/vnd.ms-excel': ['.xls'],
-      'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': ['.xlsx']
+      'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': ['.xlsx'],
+      'application/gzip': ['.gz'],
+      'application/zip': ['.zip'],
+      'application/zstd': ['.zst']
     },
     disabled: loading,
     multiple: false
@@ -46,7 +49,7 @@ const FileUpload = ({ onUpload, loading, error }) => {
           <div>
             <p>Drag and drop a SAP export file here</p>
             <p className="alternative">or click to select a file</p>
-            <p className="formats">Supported formats: CSV, XLS, XLSX</p>
+            <p className="formats">Supported formats: CSV, XLS, XLSX (optionally .gz/.zst compressed, or a ZIP of exports)</p>
           </div>
         )}
       </div>
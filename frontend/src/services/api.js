@@ -3,22 +3,110 @@ import axios from 'axios';
 // API base URL - will be set via environment variable in production
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:3001';
 
-export const analyzeFile = async (file, fileType) => {
-  try {
-    // Step 1: Get pre-signed upload URL
-    const uploadResponse = await axios.post(`${API_BASE_URL}/upload`, {
-      fileName: file.name,
-      fileType: fileType
-    });
+// Files above this size are sent as a resumable, parallel multipart upload
+const MULTIPART_THRESHOLD = 64 * 1024 * 1024;
+const PART_CONCURRENCY = 4;
+const PART_RETRIES = 3;
+const PART_URL_BATCH = 100;
 
-    const { uploadUrl, analysisId, key } = uploadResponse.data;
+// In-progress multipart uploads are remembered per file so a retry resumes them
+const uploadStateKey = (file) => `sapanalyzer4-upload:${file.name}:${file.size}:${file.lastModified}`;
 
-    // Step 2: Upload file directly to S3
-    await axios.put(uploadUrl, file, {
-      headers: {
-        'Content-Type': 'text/csv'
-      }
+const uploadAction = async (body) => {
+  const response = await axios.post(`${API_BASE_URL}/upload`, body);
+  return response.data;
+};
+
+const uploadPart = async (url, blob) => {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      await axios.put(url, blob);
+      return;
+    } catch (error) {
+      if (attempt >= PART_RETRIES) throw error;
+    }
+  }
+};
+
+const multipartUpload = async (file, onProgress) => {
+  const stateKey = uploadStateKey(file);
+  let upload = JSON.parse(localStorage.getItem(stateKey) || 'null');
+  let done = new Set();
+  let firstUrls = null;
+
+  if (upload) {
+    // Resume: skip the parts S3 already holds
+    try {
+      const { parts } = await uploadAction({ action: 'status', key: upload.key, uploadId: upload.uploadId });
+      done = new Set(parts.map((part) => part.PartNumber));
+    } catch (error) {
+      upload = null;
+    }
+  }
+  if (!upload) {
+    const initiated = await uploadAction({ action: 'initiate', fileName: file.name, fileSize: file.size });
+    firstUrls = initiated.partUrls;
+    upload = { ...initiated, partUrls: undefined };
+    localStorage.setItem(stateKey, JSON.stringify(upload));
+  }
+
+  const pending = [];
+  for (let partNumber = 1; partNumber <= upload.partCount; partNumber++) {
+    if (!done.has(partNumber)) pending.push(partNumber);
+  }
+
+  // Upload the missing parts in batches of presigned URLs, several at a time
+  for (let i = 0; i < pending.length; i += PART_URL_BATCH) {
+    const batch = pending.slice(i, i + PART_URL_BATCH);
+    // A fresh upload already received URLs for its first batch
+    const { partUrls } = i === 0 && firstUrls ? { partUrls: firstUrls } : await uploadAction({
+      action: 'parts', key: upload.key, uploadId: upload.uploadId, partNumbers: batch
     });
+    const queue = [...batch];
+    const worker = async () => {
+      while (queue.length > 0) {
+        const partNumber = queue.shift();
+        const start = (partNumber - 1) * upload.partSize;
+        await uploadPart(partUrls[partNumber], file.slice(start, start + upload.partSize));
+        done.add(partNumber);
+        if (onProgress) onProgress(done.size / upload.partCount);
+      }
+    };
+    await Promise.all(Array.from({ length: PART_CONCURRENCY }, worker));
+  }
+
+  await uploadAction({
+    action: 'complete', key: upload.key, uploadId: upload.uploadId, partCount: upload.partCount
+  });
+  localStorage.removeItem(stateKey);
+  return upload;
+};
+
+export const analyzeFile = async (file, fileType, onProgress) => {
+  try {
+    let analysisId;
+    let key;
+
+    if (file.size > MULTIPART_THRESHOLD) {
+      // Steps 1-2: Resumable multipart upload straight to S3
+      ({ analysisId, key } = await multipartUpload(file, onProgress));
+    } else {
+      // Step 1: Get pre-signed upload URL
+      const uploadResponse = await axios.post(`${API_BASE_URL}/upload`, {
+        fileName: file.name,
+        fileType: fileType
+      });
+
+      const { uploadUrl, contentType } = uploadResponse.data;
+      ({ analysisId, key } = uploadResponse.data);
+
+      // Step 2: Upload file directly to S3 (content type must match the signed URL)
+      await axios.put(uploadUrl, file, {
+        headers: {
+          'Content-Type': contentType || 'text/csv'
+        }
+      });
+    }
 
     // Step 3: Trigger analysis
     await axios.post(`${API_BASE_URL}/analyze`, {
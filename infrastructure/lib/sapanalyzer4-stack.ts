@@ -21,12 +21,20 @@ export class SapAnalyzer4Stack extends cdk.Stack {
         allowedHeaders: ['*'],
         allowedMethods: [s3.HttpMethods.GET, s3.HttpMethods.PUT, s3.HttpMethods.POST],
         allowedOrigins: ['*'],
+        exposedHeaders: ['ETag'],
         maxAge: 3000,
       }],
       lifecycleRules: [{
         id: 'DeleteOldFiles',
         expiration: cdk.Duration.days(30),
         prefix: 'uploads/',
+      }, {
+        id: 'DeleteStaleCheckpoints',
+        expiration: cdk.Duration.days(7),
+        prefix: 'checkpoints/',
+      }, {
+        id: 'AbortIncompleteUploads',
+        abortIncompleteMultipartUploadAfter: cdk.Duration.days(7),
       }],
       removalPolicy: cdk.RemovalPolicy.DESTROY,
       autoDeleteObjects: true,